@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+RQ worker autoscaler.
+
+Supervises a pool of ``worker.py`` processes and sizes it from the backlog:
+the number of queued jobs across the lanes and how long the oldest one has
+been waiting. Scales up immediately when uploads pile up, scales down one
+worker at a time once the pool has been oversized for a while, and restarts
+workers that die. Workers warm the face model before taking jobs.
+
+Stopping a worker sends SIGTERM, which RQ treats as a warm shutdown: the job
+in hand finishes before the process exits.
+
+Usage:
+    python autoscaler.py
+"""
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+import logging
+from datetime import datetime
+
+import redis
+from rq import Queue
+from rq.job import Job
+
+from config import settings
+from jobs.queues import worker_lanes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("autoscaler")
+
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+conn = redis.from_url(redis_url)
+
+WORKER_CMD = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")]
+
+
+def backlog(queues: list[Queue]) -> tuple[int, float]:
+    """Total queued jobs and the age in seconds of the oldest one."""
+    depth = 0
+    oldest = 0.0
+    now = datetime.utcnow()
+    for q in queues:
+        depth += q.count
+        head = q.get_job_ids(0, 1)
+        if not head:
+            continue
+        try:
+            job = Job.fetch(head[0], connection=conn)
+        except Exception:
+            continue  # expired/deleted between the two reads
+        if job.enqueued_at:
+            enqueued = job.enqueued_at.replace(tzinfo=None)
+            oldest = max(oldest, (now - enqueued).total_seconds())
+    return depth, oldest
+
+
+def desired_workers(depth: int, oldest_age: float, running: int) -> int:
+    """Pool size for the current backlog, clamped to [min, max].
+
+    One worker per ``AUTOSCALE_JOBS_PER_WORKER`` queued jobs, plus one more
+    whenever the head of a queue has waited longer than the age target.
+    """
+    want = math.ceil(depth / max(settings.AUTOSCALE_JOBS_PER_WORKER, 1))
+    if depth and oldest_age > settings.AUTOSCALE_MAX_JOB_AGE:
+        want = max(want, running + 1)
+    return max(settings.AUTOSCALE_MIN_WORKERS, min(settings.AUTOSCALE_MAX_WORKERS, want))
+
+
+class WorkerPool:
+    """The worker.py child processes this supervisor owns."""
+
+    def __init__(self):
+        self.running: list[subprocess.Popen] = []
+        self.stopping: list[subprocess.Popen] = []
+
+    def reap(self) -> None:
+        for p in [p for p in self.running if p.poll() is not None]:
+            logger.warning(f"Worker {p.pid} exited with code {p.returncode}")
+            self.running.remove(p)
+        self.stopping = [p for p in self.stopping if p.poll() is None]
+
+    def grow(self, n: int) -> None:
+        for _ in range(n):
+            p = subprocess.Popen(WORKER_CMD, env=os.environ.copy())
+            self.running.append(p)
+            logger.info(f"⬆️ Started worker {p.pid} ({len(self.running)} running)")
+
+    def shrink(self, n: int) -> None:
+        # Newest first: older workers are more likely to be mid-job.
+        for _ in range(min(n, len(self.running))):
+            p = self.running.pop()
+            p.send_signal(signal.SIGTERM)
+            self.stopping.append(p)
+            logger.info(f"⬇️ Stopping worker {p.pid} ({len(self.running)} running)")
+
+    def stop_all(self, timeout: float = 600.0) -> None:
+        self.shrink(len(self.running))
+        deadline = time.monotonic() + timeout
+        for p in self.stopping:
+            try:
+                p.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def main():
+    queues = [Queue(name, connection=conn) for name in worker_lanes()]
+    pool = WorkerPool()
+    oversized_since: float | None = None
+    shutting_down = False
+
+    def _shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    logger.info(
+        f"📈 Autoscaler on {', '.join(q.name for q in queues)}: "
+        f"{settings.AUTOSCALE_MIN_WORKERS}-{settings.AUTOSCALE_MAX_WORKERS} workers"
+    )
+
+    while not shutting_down:
+        pool.reap()
+        running = len(pool.running)
+        try:
+            depth, oldest_age = backlog(queues)
+        except redis.RedisError:
+            logger.warning("Could not read queue backlog", exc_info=True)
+            depth, oldest_age = 0, 0.0
+        want = desired_workers(depth, oldest_age, running)
+
+        if want > running:
+            logger.info(f"Backlog {depth} jobs, oldest {oldest_age:.0f}s → {want} workers")
+            pool.grow(want - running)
+            oversized_since = None
+        elif want < running:
+            # Only give capacity back after the pool has been oversized for a
+            # while, one worker per tick, so a lull between bursts doesn't
+            # churn processes (and model loads).
+            now = time.monotonic()
+            if oversized_since is None:
+                oversized_since = now
+            elif now - oversized_since >= settings.AUTOSCALE_SCALE_DOWN_DELAY:
+                pool.shrink(1)
+                oversized_since = now
+        else:
+            oversized_since = None
+
+        time.sleep(settings.AUTOSCALE_INTERVAL)
+
+    logger.info("Autoscaler stopping; waiting for workers to finish their jobs")
+    pool.stop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,12 @@ class Settings(BaseSettings):
     # Optional public base for returned URLs (CDN/custom domain)
     PUBLIC_S3_BASE_URL: str | None = None
 
+    # Shared S3 client: pooled connections, background upload threads and the
+    # size above which uploads switch to parallel multipart
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_UPLOAD_THREADS: int = 8
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024
+
     UPLOAD_DIR: str = "uploads"
     VECTOR_DIM: int = 512
     INSIGHTFACE_PROVIDER: str = "CPUExecutionProvider"
@@ -26,8 +32,78 @@ class Settings(BaseSettings):
     MIN_FACE_PIXELS: int = 48
     EMBEDDING_MODEL_VERSION: str = "buffalo_l_v1"
 
-    # Worker backend: "rq" (Redis Queue, self-hosted) or "modal" (serverless, pay-per-use)
+    # Worker backend: "rq" (Redis Queue, self-hosted), "modal" (serverless, pay-per-use)
+    # or "local" (process pool inside the API host, see jobs/local_pool.py)
     WORKER_BACKEND: str = "rq"
+    # Local backend: pool processes (one model each), max running+waiting jobs,
+    # and seconds dispatch waits for room before giving up
+    LOCAL_WORKERS: int = 2
+    LOCAL_QUEUE_SIZE: int = 64
+    LOCAL_QUEUE_TIMEOUT: float = 300.0
+    # Comma-separated RQ lanes a worker listens on; empty = all lanes (see jobs/queues.py)
+    RQ_QUEUES: str = ""
+    # Shared Drive download throttle (services/gdrive.DriveThrottle): token
+    # bucket rate/burst across all workers, AIMD concurrency bounds, and the
+    # shared cooldown after a throttling response
+    GDRIVE_RATE_PER_SEC: float = 10.0
+    GDRIVE_BURST: int = 20
+    GDRIVE_CONCURRENCY_INIT: int = 8
+    GDRIVE_CONCURRENCY_MIN: int = 2
+    GDRIVE_CONCURRENCY_MAX: int = 32
+    GDRIVE_THROTTLE_COOLDOWN: float = 5.0
+    # Linked Drive folders older than this (seconds) are re-synced by
+    # `python -m jobs.gdrive_sync` (run it from cron). 0 = only on demand.
+    GDRIVE_SYNC_INTERVAL: int = 0
+    # Concurrent listing requests when crawling a folder tree (recursive imports)
+    GDRIVE_CRAWL_WORKERS: int = 4
+    # Pipelined batch ingest (jobs/pipeline.py): images per batch job, I/O
+    # threads (download/upload) and bounded queue depth between stages
+    INGEST_BATCH_SIZE: int = 8
+    INGEST_IO_THREADS: int = 4
+    INGEST_PIPELINE_DEPTH: int = 4
+    # Streamed Drive originals are spooled in memory up to this size, then on disk
+    INGEST_SPOOL_BYTES: int = 4 * 1024 * 1024
+    # Measure quality metrics and flags during ingest, on the image already
+    # decoded for face detection, instead of in a later quality job that has
+    # to fetch and decode it again. Flags use global (uncalibrated) thresholds;
+    # a later analysis re-flags from the stored metrics without refetching.
+    QUALITY_ON_INGEST: bool = False
+    QUALITY_INGEST_THRESHOLD: float = 0.70
+    # Processes that decode + analyze images in a quality job (rq/local
+    # backends); 0 = one per CPU core
+    QUALITY_ANALYSIS_PROCESSES: int = 0
+    # Images per quality-analysis chunk. Larger analyses are split into
+    # chunks run as separate jobs in parallel, each checkpointing its own
+    # progress, so a crashed worker only costs one chunk.
+    QUALITY_CHUNK_SIZE: int = 250
+    # Seconds between API sweeps that re-dispatch lost or failed chunks
+    # (0 = off; chunks are then only resumed when analysis is re-triggered)
+    QUALITY_CHUNK_SWEEP_INTERVAL: int = 120
+    # Perceptual-hash grouping: images within this many differing dHash bits
+    # (of 64; at most 7) join the same burst. With REUSE_NEAR_DUPLICATE_FACES,
+    # an image within NEAR_DUPLICATE_REUSE_DISTANCE bits of an already
+    # processed sibling of the same size copies its faces instead of running
+    # detection again.
+    NEAR_DUPLICATE_DISTANCE: int = 6
+    REUSE_NEAR_DUPLICATE_FACES: bool = False
+    NEAR_DUPLICATE_REUSE_DISTANCE: int = 2
+    # RQ autoscaler (autoscaler.py): pool size bounds, queued jobs per worker,
+    # max seconds a job may wait before adding a worker, poll interval, and how
+    # long the pool must stay oversized before a worker is stopped.
+    AUTOSCALE_MIN_WORKERS: int = 1
+    AUTOSCALE_MAX_WORKERS: int = 4
+    AUTOSCALE_JOBS_PER_WORKER: int = 10
+    AUTOSCALE_MAX_JOB_AGE: int = 30
+    AUTOSCALE_INTERVAL: int = 5
+    AUTOSCALE_SCALE_DOWN_DELAY: int = 120
+    # Fair-share scheduling (jobs/fairshare.py): max in-flight jobs per celebration
+    # and across the whole backend; 0 disables that cap. Slots expire after
+    # FAIR_SHARE_SLOT_TTL seconds in case a worker dies without releasing; the
+    # API re-checks parked jobs every FAIR_SHARE_DRAIN_INTERVAL seconds (0 = off).
+    FAIR_SHARE_TENANT_CAP: int = 8
+    FAIR_SHARE_GLOBAL_CAP: int = 0
+    FAIR_SHARE_SLOT_TTL: int = 1200
+    FAIR_SHARE_DRAIN_INTERVAL: int = 30
     # Modal settings (only used when WORKER_BACKEND=modal)
     MODAL_APP_NAME: str = "muhyak-face-processor"
 
@@ -1,5 +1,5 @@
 """
-Job Dispatcher - Routes background jobs to configured backend (RQ or Modal)
+Job Dispatcher - Routes background jobs to configured backend (RQ, Modal or local pool)
 
 Usage:
     from jobs.dispatcher import dispatch_job
@@ -16,31 +16,62 @@ from config import settings
 logger = logging.getLogger(__name__)
 
 # Lazy-loaded connections
-_rq_queue = None
+_rq_conn = None
+_rq_queues = {}
 _modal_functions = {}
 
-
-def _get_rq_queue():
-    """Get or create RQ queue connection."""
-    global _rq_queue
-    if _rq_queue is None:
+_JOB_TYPES = (
+    "process_image",
+    "quality_analysis",
+    "quality_chunk",
+    "reprocess_image",
+    "import_drive_image",
+    "process_image_batch",
+    "import_drive_batch",
+    "drive_sync",
+)
+
+# Per-image budget for batch jobs' timeout (download + upload + detect).
+_BATCH_SECONDS_PER_IMAGE = 120
+
+
+def _get_redis():
+    """Raw (bytes) Redis connection shared by RQ and fair-share bookkeeping."""
+    global _rq_conn
+    if _rq_conn is None:
         import redis
-        from rq import Queue
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        redis_conn = redis.from_url(redis_url)
-        _rq_queue = Queue("default", connection=redis_conn)
-    return _rq_queue
+        _rq_conn = redis.from_url(redis_url)
+    return _rq_conn
+
+
+def _get_rq_queue(name: str = "default"):
+    """Get or create the RQ queue for a priority lane."""
+    if name not in _rq_queues:
+        from rq import Queue
+        _rq_queues[name] = Queue(name, connection=_get_redis())
+    return _rq_queues[name]
 
 
-def _dispatch_rq(job_type: str, **kwargs) -> str:
-    """Dispatch job to Redis Queue."""
-    queue = _get_rq_queue()
+def on_rq_job_done(job, connection, *args, **kwargs):
+    """RQ success/failure callback: free the job's fair-share slot."""
+    release_slot(job.meta.get("fair_share"), conn=connection)
 
+
+def _job_call(job_type: str, kwargs: dict) -> tuple[str, tuple, dict]:
+    """Job function path, positional args and RQ options for a job type.
+
+    Shared by the RQ and local backends, which run the same functions.
+    """
     job_mapping = {
         "process_image": "routers.uploads._handle_single_upload",
         "quality_analysis": "services.quality_analyzer.analyze_celebration_job",
+        "quality_chunk": "services.quality_analyzer.analyze_chunk_job",
         "reprocess_image": "jobs.reprocess.reprocess_image_job",
         "import_drive_image": "jobs.gdrive_import.import_drive_image_job",
+        "process_image_batch": "routers.uploads._handle_upload_batch",
+        "import_drive_batch": "jobs.gdrive_import.import_drive_batch_job",
+        "drive_sync": "jobs.gdrive_sync.sync_folder",
     }
 
     func_path = job_mapping.get(job_type)
@@ -49,30 +80,49 @@ def _dispatch_rq(job_type: str, **kwargs) -> str:
 
     # Map kwargs to positional args based on job type
     if job_type == "process_image":
-        job = queue.enqueue(
-            func_path,
+        args = (
             kwargs.get("celebrant"),
             kwargs.get("photographer"),
             kwargs.get("filename"),
             kwargs.get("content"),
             kwargs.get("celebration_id"),
         )
+        return func_path, args, {}
     elif job_type == "quality_analysis":
-        job = queue.enqueue(
-            func_path,
+        args = (
             kwargs.get("celebration_id"),
             kwargs.get("threshold", 0.70),
             kwargs.get("reanalyze", False),
-            job_timeout=600,
         )
+        return func_path, args, {"job_timeout": 600}
+    elif job_type == "quality_chunk":
+        return func_path, (kwargs.get("chunk_id"),), {"job_timeout": 900}
     elif job_type == "reprocess_image":
-        job = queue.enqueue(
-            func_path,
-            kwargs.get("image_id"),
+        return func_path, (kwargs.get("image_id"),), {}
+    elif job_type == "process_image_batch":
+        files = kwargs.get("files") or []
+        args = (
+            kwargs.get("celebrant"),
+            kwargs.get("photographer"),
+            files,
+            kwargs.get("celebration_id"),
         )
-    elif job_type == "import_drive_image":
-        job = queue.enqueue(
-            func_path,
+        return func_path, args, {"job_timeout": max(600, len(files) * _BATCH_SECONDS_PER_IMAGE)}
+    elif job_type == "import_drive_batch":
+        files = kwargs.get("files") or []
+        args = (
+            files,
+            kwargs.get("api_key"),
+            kwargs.get("celebrant"),
+            kwargs.get("photographer"),
+            kwargs.get("celebration_id"),
+        )
+        return func_path, args, {"job_timeout": max(600, len(files) * _BATCH_SECONDS_PER_IMAGE)}
+    elif job_type == "drive_sync":
+        # Listing a large folder tree can take a while; matches the sync lock's TTL.
+        return func_path, (kwargs.get("sync_id"),), {"job_timeout": 3600}
+    else:  # import_drive_image
+        args = (
             kwargs.get("file_id"),
             kwargs.get("api_key"),
             kwargs.get("filename"),
@@ -80,74 +130,231 @@ def _dispatch_rq(job_type: str, **kwargs) -> str:
             kwargs.get("celebrant"),
             kwargs.get("photographer"),
             kwargs.get("celebration_id"),
-            job_timeout=600,
+            kwargs.get("md5_checksum"),
+            kwargs.get("size"),
+            kwargs.get("source_folder"),
         )
-    else:
-        raise ValueError(f"Unknown job type: {job_type}")
+        return func_path, args, {"job_timeout": 600}
+
 
-    logger.info(f"[RQ] Dispatched {job_type} job: {job.id}")
+def _dispatch_rq(job_type: str, slot: dict | None = None, **kwargs) -> str:
+    """Dispatch job to Redis Queue, on the lane for its job type."""
+    from jobs.queues import lane_for
+
+    func_path, args, opts = _job_call(job_type, kwargs)
+    queue = _get_rq_queue(lane_for(job_type))
+
+    # Slot bookkeeping rides on the job; the callbacks hand it back when the
+    # job finishes either way.
+    if slot:
+        opts = {
+            **opts,
+            "meta": {"fair_share": slot},
+            "on_success": on_rq_job_done,
+            "on_failure": on_rq_job_done,
+        }
+
+    job = queue.enqueue(func_path, *args, **opts)
+
+    logger.info(f"[RQ] Dispatched {job_type} job to {queue.name}: {job.id}")
     return job.id
 
 
-def _dispatch_modal(job_type: str, **kwargs) -> str:
-    """Dispatch job to Modal serverless functions."""
+def _dispatch_local(job_type: str, **kwargs) -> str:
+    """Dispatch job to the in-process pool (jobs/local_pool.py).
+
+    A job already running in a pool process runs what it dispatches itself,
+    rather than starting a nested pool.
+    """
+    from jobs import local_pool
+
+    func_path, args, _ = _job_call(job_type, kwargs)
+    if local_pool.in_worker():
+        return local_pool.run_here(job_type, func_path, args)
+    return local_pool.submit(job_type, func_path, args)
+
+
+def _modal_call(job_type: str, kwargs: dict) -> tuple[str, dict]:
+    """Translate dispatcher kwargs into (Modal function name, call kwargs)."""
+    if job_type == "process_image":
+        return "process_image", {
+            "image_bytes": kwargs.get("content"),
+            "celebrant": kwargs.get("celebrant"),
+            "photographer": kwargs.get("photographer"),
+            "filename": kwargs.get("filename"),
+            "celebration_id": kwargs.get("celebration_id"),
+        }
+    elif job_type == "quality_analysis":
+        return "analyze_quality", {
+            "celebration_id": kwargs.get("celebration_id"),
+            "threshold": kwargs.get("threshold", 0.70),
+            "reanalyze": kwargs.get("reanalyze", False),
+        }
+    elif job_type == "quality_chunk":
+        return "analyze_quality_chunk", {"chunk_id": kwargs.get("chunk_id")}
+    elif job_type == "reprocess_image":
+        return "reprocess_image", {"image_id": kwargs.get("image_id")}
+    elif job_type == "import_drive_image":
+        return "import_drive_image", {
+            "file_id": kwargs.get("file_id"),
+            "api_key": kwargs.get("api_key"),
+            "filename": kwargs.get("filename"),
+            "mime_type": kwargs.get("mime_type"),
+            "celebrant": kwargs.get("celebrant"),
+            "photographer": kwargs.get("photographer"),
+            "celebration_id": kwargs.get("celebration_id"),
+            "md5_checksum": kwargs.get("md5_checksum"),
+            "size": kwargs.get("size"),
+            "source_folder": kwargs.get("source_folder"),
+        }
+    elif job_type in ("process_image_batch", "import_drive_batch"):
+        # Modal scales out one container per image instead; callers check
+        # supports_batches() and dispatch single-image jobs there.
+        raise ValueError(f"{job_type} is not supported on the Modal backend")
+    elif job_type == "drive_sync":
+        # The listing planner lives in this package, which modal_worker.py
+        # can't import; callers check supports_drive_sync().
+        raise ValueError(f"{job_type} is not supported on the Modal backend")
+    else:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+
+def _spawn_modal(fn_name: str, call_kwargs: dict, slot: dict | None = None) -> str:
+    """Spawn a Modal function by name; returns immediately."""
     try:
         import modal
     except ImportError:
         raise RuntimeError("Modal is not installed. Run: pip install modal")
 
-    app_name = settings.MODAL_APP_NAME
+    # Modal 1.x syntax uses from_name()
+    fn = modal.Function.from_name(settings.MODAL_APP_NAME, fn_name)
+    if slot:
+        call_kwargs = {**call_kwargs, "slot": slot}
+    call = fn.spawn(**call_kwargs)
+    job_id = call.object_id
+    logger.info(f"[Modal] Dispatched {fn_name} job: {job_id}")
+    return job_id
 
-    if job_type == "process_image":
-        # Call the Modal function - Modal 1.x syntax uses from_name()
-        process_fn = modal.Function.from_name(app_name, "process_image")
-        # spawn() returns immediately, runs in background
-        call = process_fn.spawn(
-            image_bytes=kwargs.get("content"),
-            celebrant=kwargs.get("celebrant"),
-            photographer=kwargs.get("photographer"),
-            filename=kwargs.get("filename"),
-            celebration_id=kwargs.get("celebration_id"),
-        )
-        job_id = call.object_id
-        logger.info(f"[Modal] Dispatched process_image job: {job_id}")
-        return job_id
 
-    elif job_type == "quality_analysis":
-        analyze_fn = modal.Function.from_name(app_name, "analyze_quality")
-        call = analyze_fn.spawn(
-            celebration_id=kwargs.get("celebration_id"),
-            threshold=kwargs.get("threshold", 0.70),
-            reanalyze=kwargs.get("reanalyze", False),
-        )
-        job_id = call.object_id
-        logger.info(f"[Modal] Dispatched quality_analysis job: {job_id}")
-        return job_id
+def _dispatch_modal(job_type: str, slot: dict | None = None, **kwargs) -> str:
+    """Dispatch job to Modal serverless functions."""
+    fn_name, call_kwargs = _modal_call(job_type, kwargs)
+    return _spawn_modal(fn_name, call_kwargs, slot)
+
+
+def _dispatch_payload(payload: dict, slot: dict | None) -> str:
+    """Dispatch a payload parked by fair-share scheduling."""
+    if payload.get("modal_fn"):
+        return _spawn_modal(payload["modal_fn"], payload["kwargs"], slot)
+    return _dispatch_rq(payload["job_type"], slot=slot, **payload["kwargs"])
+
+
+def _fair_share_caps() -> tuple[int, int, int]:
+    return (
+        settings.FAIR_SHARE_TENANT_CAP,
+        settings.FAIR_SHARE_GLOBAL_CAP,
+        settings.FAIR_SHARE_SLOT_TTL,
+    )
+
+
+def _drain(conn) -> int:
+    """Release parked jobs round-robin across tenants while slots are free."""
+    from jobs import fairshare
+
+    released = 0
+    while True:
+        nxt = fairshare.next_pending(conn, *_fair_share_caps())
+        if nxt is None:
+            return released
+        slot, payload = nxt
+        try:
+            _dispatch_payload(payload, slot)
+            released += 1
+        except Exception:
+            logger.exception(f"Failed to release parked {payload.get('job_type')} job")
+            fairshare.release(conn, slot)
+
+
+def drain_parked() -> int:
+    """Release parked jobs into whatever slots are free right now.
+
+    Parked jobs otherwise move only when a job finishes or a new one is
+    dispatched, so a slot freed by TTL expiry (a worker that died without
+    releasing) would sit idle until the next upload. The API calls this on a
+    timer (``FAIR_SHARE_DRAIN_INTERVAL``).
+    """
+    try:
+        return _drain(_get_redis())
+    except Exception:
+        logger.warning("Fair-share drain failed", exc_info=True)
+        return 0
 
-    elif job_type == "reprocess_image":
-        reprocess_fn = modal.Function.from_name(app_name, "reprocess_image")
-        call = reprocess_fn.spawn(image_id=kwargs.get("image_id"))
-        job_id = call.object_id
-        logger.info(f"[Modal] Dispatched reprocess_image job: {job_id}")
-        return job_id
 
-    elif job_type == "import_drive_image":
-        import_fn = modal.Function.from_name(app_name, "import_drive_image")
-        call = import_fn.spawn(
-            file_id=kwargs.get("file_id"),
-            api_key=kwargs.get("api_key"),
-            filename=kwargs.get("filename"),
-            mime_type=kwargs.get("mime_type"),
-            celebrant=kwargs.get("celebrant"),
-            photographer=kwargs.get("photographer"),
-            celebration_id=kwargs.get("celebration_id"),
-        )
-        job_id = call.object_id
-        logger.info(f"[Modal] Dispatched import_drive_image job: {job_id}")
-        return job_id
+def release_slot(slot: dict | None, conn=None) -> None:
+    """Free a finished job's fair-share slot and release whatever it unblocks."""
+    if not slot:
+        return
+    from jobs import fairshare
 
+    conn = conn or _get_redis()
+    try:
+        fairshare.release(conn, slot)
+        _drain(conn)
+    except Exception:
+        logger.warning("Fair-share slot release failed", exc_info=True)
+
+
+def _dispatch_fair(backend: str, job_type: str, kwargs: dict) -> str:
+    """Dispatch within the tenant's concurrency cap, or park the job."""
+    from jobs import fairshare
+    from jobs.queues import lane_for
+
+    tenant = str(kwargs["celebration_id"])
+    lane = lane_for(job_type)
+    conn = _get_redis()
+
+    # Older parked jobs go first; also recovers jobs whose slot holders died.
+    _drain(conn)
+
+    slot = fairshare.try_acquire(conn, tenant, lane, *_fair_share_caps())
+    if slot:
+        try:
+            if backend == "modal":
+                return _dispatch_modal(job_type, slot=slot, **kwargs)
+            return _dispatch_rq(job_type, slot=slot, **kwargs)
+        except Exception:
+            fairshare.release(conn, slot)
+            raise
+
+    if backend == "modal":
+        fn_name, call_kwargs = _modal_call(job_type, kwargs)
+        payload = {"job_type": job_type, "modal_fn": fn_name, "kwargs": call_kwargs}
     else:
-        raise ValueError(f"Unknown job type: {job_type}")
+        payload = {"job_type": job_type, "kwargs": kwargs}
+    depth = fairshare.defer(conn, tenant, lane, payload)
+    logger.info(f"[fair-share] Parked {job_type} for celebration {tenant} ({depth} waiting)")
+    return f"parked:{tenant}:{depth}"
+
+
+def supports_batches() -> bool:
+    """Whether the backend takes the pipelined *_batch job types.
+
+    RQ and local workers overlap transfers with detection inside a batch
+    (jobs/pipeline.py); Modal gets its parallelism from one container per image.
+    """
+    return settings.WORKER_BACKEND.lower() in ("rq", "local")
+
+
+def supports_drive_sync() -> bool:
+    """Whether the backend runs drive_sync jobs (the folder listing/diff).
+
+    Modal only has the functions mirrored in modal_worker.py, so with it the
+    API lists folders itself. So does the local backend: a sync run in a
+    pool process couldn't queue its import pages on the pool (see
+    jobs/local_pool.py), while from the API they go through the shared,
+    bounded queue.
+    """
+    return settings.WORKER_BACKEND.lower() == "rq"
 
 
 def dispatch_job(job_type: str, **kwargs) -> str:
@@ -155,9 +362,14 @@ def dispatch_job(job_type: str, **kwargs) -> str:
     Dispatch a background job to the configured backend.
 
     Args:
-        job_type: One of "process_image", "quality_analysis", "reprocess_image"
+        job_type: One of "process_image", "quality_analysis", "reprocess_image",
+            "import_drive_image"
         **kwargs: Job-specific arguments
 
+    Jobs carrying a ``celebration_id`` are subject to fair-share scheduling
+    (see jobs/fairshare.py): over the celebration's concurrency cap they are
+    parked in Redis and the returned ID is ``parked:<celebration>:<depth>``.
+
     Returns:
         Job ID string
 
@@ -174,17 +386,55 @@ def dispatch_job(job_type: str, **kwargs) -> str:
             - threshold: float (default 0.70)
             - reanalyze: bool (default False)
 
+        quality_chunk:
+            - chunk_id: str
+            - celebration_id: str
+
         reprocess_image:
             - image_id: str
+            - celebration_id: str (optional, enables fair-share scheduling)
+
+        import_drive_image:
+            - file_id, api_key, filename, mime_type: str
+            - celebrant, photographer, celebration_id: str
+
+        process_image_batch (RQ/local only, see supports_batches):
+            - celebrant, photographer, celebration_id: str
+            - files: list of (filename, content) tuples
+
+        import_drive_batch (RQ/local only, see supports_batches):
+            - api_key, celebrant, photographer, celebration_id: str
+            - files: list of Drive listing entries (id, name, mimeType)
+
+        drive_sync (RQ only, see supports_drive_sync):
+            - sync_id: str
     """
     backend = settings.WORKER_BACKEND.lower()
 
+    if backend not in ("rq", "modal", "local"):
+        raise ValueError(f"Unknown WORKER_BACKEND: {backend}. Use 'rq', 'modal' or 'local'.")
+    if job_type not in _JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    # The local pool's bounded queue already caps concurrency on its own box.
+    if backend == "local":
+        return _dispatch_local(job_type, **kwargs)
+
+    fair = (
+        kwargs.get("celebration_id")
+        and (settings.FAIR_SHARE_TENANT_CAP > 0 or settings.FAIR_SHARE_GLOBAL_CAP > 0)
+    )
+    if fair:
+        import redis
+        try:
+            return _dispatch_fair(backend, job_type, kwargs)
+        except redis.RedisError:
+            # Bookkeeping trouble must not drop the job; run it uncapped.
+            logger.warning("Fair-share scheduling unavailable; dispatching directly", exc_info=True)
+
     if backend == "rq":
         return _dispatch_rq(job_type, **kwargs)
-    elif backend == "modal":
-        return _dispatch_modal(job_type, **kwargs)
-    else:
-        raise ValueError(f"Unknown WORKER_BACKEND: {backend}. Use 'rq' or 'modal'.")
+    return _dispatch_modal(job_type, **kwargs)
 
 
 def get_backend_info() -> dict:
@@ -192,10 +442,13 @@ def get_backend_info() -> dict:
     backend = settings.WORKER_BACKEND.lower()
 
     if backend == "rq":
+        from jobs.queues import LANES
+
         return {
             "backend": "rq",
             "description": "Redis Queue (self-hosted workers)",
             "redis_url": os.getenv("REDIS_URL", "redis://localhost:6379"),
+            "queues": LANES,
         }
     elif backend == "modal":
         return {
@@ -203,5 +456,12 @@ def get_backend_info() -> dict:
             "description": "Modal.com (serverless, pay-per-use)",
             "app_name": settings.MODAL_APP_NAME,
         }
+    elif backend == "local":
+        return {
+            "backend": "local",
+            "description": "In-process pool on the API host (no Redis queue or workers)",
+            "processes": settings.LOCAL_WORKERS,
+            "queue_size": settings.LOCAL_QUEUE_SIZE,
+        }
     else:
         return {"backend": backend, "description": "Unknown backend"}
@@ -0,0 +1,169 @@
+"""
+Per-celebration fair-share scheduling.
+
+Each celebration (tenant) may have at most ``FAIR_SHARE_TENANT_CAP`` jobs in
+flight on the worker backend, and the backend as a whole at most
+``FAIR_SHARE_GLOBAL_CAP``. Jobs over the cap wait in Redis and are released
+round-robin across tenants as slots free up, so one photographer's 10k-photo
+Drive import can't push everyone else to the back of the queue (or spin up
+unbounded Modal containers).
+
+Within a tenant, parked jobs are kept per priority lane (jobs/queues.py) and
+the highest lane with work goes first, so a fresh upload doesn't wait behind
+the same celebration's parked Drive import or reprocess run.
+
+Redis layout (all under ``fairshare:``):
+    inflight                 ZSET token -> deadline, every running job
+    inflight:<tenant>        ZSET token -> deadline, one tenant's running jobs
+    pending:<tenant>:<lane>  LIST of pickled payloads waiting for a slot
+    ring / members           round-robin LIST of tenants with pending work (+ SET)
+
+Slots carry a deadline so a worker that dies without releasing (OOM, Modal
+timeout) only blocks its slot until ``FAIR_SHARE_SLOT_TTL`` passes; the API's
+periodic drain (dispatcher.drain_parked) then hands it to a parked job.
+
+modal_worker.py keeps its own copy of the release path (it can't import this
+package); keep the two in sync.
+"""
+from __future__ import annotations
+
+import pickle
+import time
+import uuid
+from typing import Any
+
+from jobs.queues import LANES
+
+PREFIX = "fairshare:"
+
+# Acquire a slot for a direct dispatch. Refuses when the tenant already has
+# queued work in the job's lane or a higher one (ARGV[9..]), so a tenant's
+# jobs keep FIFO order within a lane and never overtake a more urgent lane.
+_ACQUIRE = """
+local now, deadline, token = tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local tcap, gcap, ttl = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local ginflight = ARGV[1] .. 'inflight'
+local inflight = ginflight .. ':' .. ARGV[8]
+redis.call('ZREMRANGEBYSCORE', ginflight, '-inf', now)
+redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now)
+for i = 9, #ARGV do
+  if redis.call('LLEN', ARGV[1] .. 'pending:' .. ARGV[8] .. ':' .. ARGV[i]) > 0 then return 0 end
+end
+if tcap > 0 and redis.call('ZCARD', inflight) >= tcap then return 0 end
+if gcap > 0 and redis.call('ZCARD', ginflight) >= gcap then return 0 end
+redis.call('ZADD', inflight, deadline, token)
+redis.call('ZADD', ginflight, deadline, token)
+redis.call('EXPIRE', inflight, ttl)
+redis.call('EXPIRE', ginflight, ttl)
+return 1
+"""
+
+# Park a payload on the tenant's lane list and put the tenant on the ring.
+_DEFER = """
+local tenant = ARGV[2]
+local pending = ARGV[1] .. 'pending:' .. tenant .. ':' .. ARGV[3]
+redis.call('RPUSH', pending, ARGV[4])
+if redis.call('SADD', ARGV[1] .. 'members', tenant) == 1 then
+  redis.call('LPUSH', ARGV[1] .. 'ring', tenant)
+end
+return redis.call('LLEN', pending)
+"""
+
+# Pop the next pending payload, visiting tenants round-robin and each tenant's
+# lanes (ARGV[8..]) in priority order, and take a slot for it. Returns
+# {tenant, payload} or nil when nothing can run yet.
+_NEXT = """
+local now, deadline, token = tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local tcap, gcap, ttl = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local ring, members, ginflight = ARGV[1] .. 'ring', ARGV[1] .. 'members', ARGV[1] .. 'inflight'
+redis.call('ZREMRANGEBYSCORE', ginflight, '-inf', now)
+if gcap > 0 and redis.call('ZCARD', ginflight) >= gcap then return nil end
+local n = redis.call('LLEN', ring)
+for i = 1, n do
+  local tenant = redis.call('RPOPLPUSH', ring, ring)
+  local pending, waiting = nil, 0
+  for j = 8, #ARGV do
+    local key = ARGV[1] .. 'pending:' .. tenant .. ':' .. ARGV[j]
+    local len = redis.call('LLEN', key)
+    if len > 0 and pending == nil then pending = key end
+    waiting = waiting + len
+  end
+  if pending == nil then
+    redis.call('LREM', ring, 0, tenant)
+    redis.call('SREM', members, tenant)
+  else
+    local inflight = ginflight .. ':' .. tenant
+    redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now)
+    if tcap <= 0 or redis.call('ZCARD', inflight) < tcap then
+      local payload = redis.call('LPOP', pending)
+      redis.call('ZADD', inflight, deadline, token)
+      redis.call('ZADD', ginflight, deadline, token)
+      redis.call('EXPIRE', inflight, ttl)
+      redis.call('EXPIRE', ginflight, ttl)
+      if waiting == 1 then
+        redis.call('LREM', ring, 0, tenant)
+        redis.call('SREM', members, tenant)
+      end
+      return {tenant, payload}
+    end
+  end
+end
+return nil
+"""
+
+
+def _slot_args(tenant_cap: int, global_cap: int, ttl: int) -> tuple[dict, list]:
+    now = time.time()
+    token = uuid.uuid4().hex
+    args = [PREFIX, now, now + ttl, token, tenant_cap, global_cap, ttl]
+    return {"token": token}, args
+
+
+def _lanes_up_to(lane: str) -> list[str]:
+    """``lane`` and every lane ahead of it in priority order."""
+    if lane not in LANES:
+        return [lane]
+    return LANES[:LANES.index(lane) + 1]
+
+
+def try_acquire(conn, tenant: str, lane: str, tenant_cap: int, global_cap: int, ttl: int) -> dict | None:
+    """Take a slot for ``tenant`` if it has headroom. Returns the slot or None."""
+    slot, args = _slot_args(tenant_cap, global_cap, ttl)
+    if conn.eval(_ACQUIRE, 0, *args, tenant, *_lanes_up_to(lane)):
+        slot["tenant"] = tenant
+        return slot
+    return None
+
+
+def defer(conn, tenant: str, lane: str, payload: dict[str, Any]) -> int:
+    """Queue a payload until the tenant gets a slot. Returns its lane's depth."""
+    return int(conn.eval(_DEFER, 0, PREFIX, tenant, lane, pickle.dumps(payload)))
+
+
+def next_pending(conn, tenant_cap: int, global_cap: int, ttl: int) -> tuple[dict, dict] | None:
+    """Round-robin pop of the next runnable payload, with a slot already taken."""
+    slot, args = _slot_args(tenant_cap, global_cap, ttl)
+    res = conn.eval(_NEXT, 0, *args, *LANES)
+    if not res:
+        return None
+    tenant, payload = res
+    slot["tenant"] = tenant.decode() if isinstance(tenant, bytes) else tenant
+    return slot, pickle.loads(payload)
+
+
+def release(conn, slot: dict | None) -> None:
+    """Give a slot back. Safe to call twice or with an expired slot."""
+    if not slot:
+        return
+    conn.zrem(f"{PREFIX}inflight", slot["token"])
+    conn.zrem(f"{PREFIX}inflight:{slot['tenant']}", slot["token"])
+
+
+def stats(conn, tenant: str, lane: str | None = None) -> dict[str, int]:
+    """In-flight and waiting job counts for one tenant (waiting in ``lane`` if given)."""
+    now = time.time()
+    lanes = [lane] if lane else LANES
+    return {
+        "in_flight": int(conn.zcount(f"{PREFIX}inflight:{tenant}", now, "+inf")),
+        "waiting": sum(int(conn.llen(f"{PREFIX}pending:{tenant}:{name}")) for name in lanes),
+    }
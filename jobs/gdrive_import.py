@@ -1,34 +1,158 @@
-"""RQ worker for importing a single Drive image (local/dev backend).
+"""RQ worker for importing Drive images (local/dev backend).
 
 Mirrors modal_worker.import_drive_image. Stores the full-res original as
 file_path and a downscaled JPEG as compressed_file_path; faces are detected on
 the compressed image so bbox coordinates match what the gallery displays.
+The original is streamed from Drive to S3 rather than buffered, and only the
+downscaled copy is ever decoded.
+Every imported (or deduplicated) file is recorded in drive_files so the next
+import of the same folder skips it from the listing alone. When a changed
+file is re-imported, the image it used to map to is retired.
+
+With QUALITY_ON_INGEST, quality metrics and flags are measured on that same
+decoded copy, so the image never has to be fetched again for analysis.
+
+The work is split into prepare/detect/persist stages so batch jobs can run
+them overlapped through jobs.pipeline; the single-image job runs them back
+to back. Either way the two S3 uploads run concurrently with each other and
+with face detection, and the row is written once both URLs are known.
 """
+import hashlib
 import logging
+import tempfile
 import uuid
 
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from db import SessionLocal
-from models import WeddingImage, FaceVector
-from utils import load_image_from_bytes, calculate_file_hash
+from models import WeddingImage, FaceVector, DriveFile
+from utils import load_image_from_bytes
 from config import settings
-from services import face_service, upload_to_s3, redis_client
-from services.gdrive import download_drive_file, compress_image
+from services import face_service, upload_to_s3_async, delete_from_s3, S3StreamUpload, redis_client
+from services.gdrive import stream_drive_file, compress_image
+from services.events import gdrive_channel, publish
+from services.quality_analyzer import ingest_metrics, record_ingest_quality
+from services.near_duplicates import hash_for_ingest, record_image_hash
+from jobs.pipeline import run_staged
 
 logger = logging.getLogger(__name__)
 
 
 def _progress_incr(celebration_id: str, failed: bool = False) -> None:
+    done_key = f"gdrive_import:{celebration_id}:done"
+    failed_key = f"gdrive_import:{celebration_id}:failed"
+    total_key = f"gdrive_import:{celebration_id}:total"
     try:
-        redis_client.incr(f"gdrive_import:{celebration_id}:done")
-        redis_client.expire(f"gdrive_import:{celebration_id}:done", 86400)
+        pipe = redis_client.pipeline()
+        pipe.incr(done_key)
+        pipe.expire(done_key, 86400)
         if failed:
-            redis_client.incr(f"gdrive_import:{celebration_id}:failed")
-            redis_client.expire(f"gdrive_import:{celebration_id}:failed", 86400)
+            pipe.incr(failed_key)
+            pipe.expire(failed_key, 86400)
+        pipe.mget(total_key, done_key, failed_key)
+        total, done, failed_n = pipe.execute()[-1]
     except Exception:
         logger.warning("failed to update gdrive import progress", exc_info=True)
+        return
+    publish(gdrive_channel(celebration_id), {
+        "type": "import",
+        "total": int(total or 0),
+        "done": int(done or 0),
+        "failed": int(failed_n or 0),
+    })
 
 
-def import_drive_image_job(
+class _IngestSink:
+    """Where a streamed Drive download goes: hashed, spooled and uploaded at once.
+
+    The original is sent to S3 part by part as it arrives and spooled (to
+    disk past INGEST_SPOOL_BYTES) for compression, so it is never held whole
+    in memory.
+    """
+
+    def __init__(self, filename: str, content_type: str, celebrant: str, photographer: str):
+        self.hash = hashlib.sha256()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=settings.INGEST_SPOOL_BYTES)
+        self.upload = S3StreamUpload(filename, content_type, celebrant, photographer)
+
+    def write(self, data: bytes) -> None:
+        self.hash.update(data)
+        self.spool.write(data)
+        self.upload.write(data)
+
+    def abort(self) -> None:
+        self.upload.abort()
+        self.spool.close()
+
+
+def record_drive_file(
+    db,
+    celebration_id: str,
+    file_id: str,
+    md5_checksum: str | None,
+    size: int | None,
+    image_id: uuid.UUID,
+    created: bool,
+) -> list[str]:
+    """Upsert the Drive file → image mapping (caller commits).
+
+    ``created`` says whether this import inserted the image (False for a
+    dedup hit on an existing one). If the file used to map to a different
+    image (it changed in Drive) that it created, in this celebration, that
+    image is deleted unless another Drive file still maps to it. Images it
+    was only mapped onto are never touched. Returns the retired image's S3
+    URLs for the caller to delete once the commit lands.
+    """
+    cid = uuid.UUID(str(celebration_id))
+    previous = db.query(DriveFile.image_id, DriveFile.created_by_import).filter(
+        DriveFile.celebration_id == cid,
+        DriveFile.drive_file_id == file_id,
+    ).first()
+    stmt = pg_insert(DriveFile).values(
+        id=uuid.uuid4(),
+        celebration_id=cid,
+        drive_file_id=file_id,
+        md5_checksum=md5_checksum,
+        size=size,
+        image_id=image_id,
+        created_by_import=created,
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_drive_files_celebration_file",
+            set_={
+                "md5_checksum": stmt.excluded.md5_checksum,
+                "size": stmt.excluded.size,
+                "image_id": stmt.excluded.image_id,
+                "created_by_import": stmt.excluded.created_by_import,
+            },
+        )
+    )
+    if previous is None or previous.image_id == image_id or not previous.created_by_import:
+        return []
+    return _retire_image(db, previous.image_id, cid)
+
+
+def _retire_image(db, image_id: uuid.UUID, celebration_id: uuid.UUID) -> list[str]:
+    """Delete a superseded image and its faces unless a Drive file still maps to it."""
+    if db.query(DriveFile.id).filter(DriveFile.image_id == image_id).first():
+        return []
+    img = db.get(WeddingImage, image_id)
+    if img is None or img.celebration_id != celebration_id:
+        return []
+    urls = sorted({u for u in (img.file_path, img.compressed_file_path) if u})
+    db.query(FaceVector).filter(FaceVector.image_id == image_id).delete(synchronize_session=False)
+    db.delete(img)
+    logger.info(f"🗑️ Retired superseded image {img.filename}")
+    return urls
+
+
+def _delete_objects(urls: list[str]) -> None:
+    for url in urls:
+        delete_from_s3(url)
+
+
+def _prepare(
     file_id: str,
     api_key: str,
     filename: str,
@@ -36,45 +160,126 @@ def import_drive_image_job(
     celebrant: str,
     photographer: str,
     celebration_id: str,
-) -> None:
+    md5_checksum: str | None = None,
+    size: int | None = None,
+    source_folder: str | None = None,
+) -> dict | None:
+    """I/O stage: stream the original to S3, dedupe, compress, upload the copy.
+
+    The original streams from Drive into a multipart upload while it is
+    hashed; a duplicate aborts the upload. Finishing it and the compressed
+    upload run on the shared upload pool while face detection works on the
+    compressed bytes; the persist stage waits for their URLs. Returns
+    what the detect/persist stages need, or None when there's nothing left to
+    do (duplicate or failure — progress is already counted).
+    """
     db = SessionLocal()
+    sink = None
     try:
-        raw = download_drive_file(file_id, api_key)
-        file_hash = calculate_file_hash(raw)
+        sink = stream_drive_file(
+            file_id,
+            api_key,
+            lambda: _IngestSink(filename, mime_type or "image/jpeg", celebrant, photographer),
+        )
+        file_hash = sink.hash.hexdigest()
 
         existing = db.query(WeddingImage).filter(
             WeddingImage.file_hash == file_hash
         ).first()
         if existing:
             logger.info(f"🟡 Skipped duplicate {filename}")
+            sink.abort()
+            retired = record_drive_file(db, celebration_id, file_id, md5_checksum, size, existing.id, created=False)
+            db.commit()
+            _delete_objects(retired)
             _progress_incr(celebration_id)
-            return
+            return None
 
-        compressed = compress_image(raw)
+        sink.spool.seek(0)
+        compressed = compress_image(sink.spool)
+        sink.spool.close()
         out_name = filename.rsplit(".", 1)[0] + ".jpg"
 
-        original_url = upload_to_s3(
-            raw, filename, mime_type or "image/jpeg", celebrant, photographer
-        )
-        compressed_url = upload_to_s3(
+        original_upload = sink.upload.finish_async()
+        compressed_upload = upload_to_s3_async(
             compressed, out_name, "image/jpeg", celebrant, photographer
         )
 
+        return {
+            "celebration_id": celebration_id,
+            "out_name": out_name,
+            "file_hash": file_hash,
+            "compressed": compressed,
+            "uploads": (original_upload, compressed_upload),
+            "drive_file": (file_id, md5_checksum, size),
+            "source_folder": source_folder or None,
+        }
+
+    except Exception as e:
+        logger.exception(f"❌ Drive import failed for {filename}: {e}")
+        if sink is not None:
+            sink.abort()
+        _progress_incr(celebration_id, failed=True)
+        return None
+    finally:
+        db.close()
+
+
+def _detect(prepared: dict) -> tuple[list[dict], dict | None, dict | None]:
+    """CPU stage: decode the compressed copy, hash it and run face detection
+    (or reuse a near-identical sibling's faces).
+
+    With QUALITY_ON_INGEST the quality metrics come from the same array.
+    """
+    arr = load_image_from_bytes(prepared["compressed"])
+    hashed, faces = hash_for_ingest(arr, prepared["celebration_id"])
+    if faces is None:
+        faces = face_service.detect_and_encode_faces(arr)
+    metrics = None
+    if settings.QUALITY_ON_INGEST:
+        try:
+            metrics = ingest_metrics(arr, faces)
+        except Exception:
+            logger.warning("⚠️ Ingest quality metrics failed", exc_info=True)
+    return faces, metrics, hashed
+
+
+def _discard_uploads(uploads) -> None:
+    """Delete whichever renditions reached S3 for an image whose row never landed."""
+    for upload in uploads:
+        try:
+            url = upload.result()
+        except Exception:
+            continue
+        delete_from_s3(url)
+
+
+def _persist(prepared: dict, detected: tuple[list[dict], dict | None, dict | None] | None) -> None:
+    """DB stage: wait for the uploads, then insert the image, its faces,
+    quality and perceptual hash. If either upload or the insert fails, the
+    other rendition is deleted rather than left orphaned in S3."""
+    faces, metrics, hashed = detected if detected is not None else (None, None, None)
+    db = SessionLocal()
+    committed = False
+    try:
+        original_upload, compressed_upload = prepared["uploads"]
+        original_url = original_upload.result()
+        compressed_url = compressed_upload.result()
+
         img = WeddingImage(
-            filename=out_name,
+            filename=prepared["out_name"],
             file_path=original_url,
             compressed_file_path=compressed_url,
-            file_hash=file_hash,
-            processed="processing",
-            celebration_id=uuid.UUID(celebration_id),
+            file_hash=prepared["file_hash"],
+            processed="completed" if faces is not None else "failed",
+            faces_count=len(faces or []),
+            celebration_id=uuid.UUID(prepared["celebration_id"]),
+            source_folder=prepared["source_folder"],
         )
         db.add(img)
-        db.commit()
-        db.refresh(img)
+        db.flush()
 
-        arr = load_image_from_bytes(compressed)
-        faces = face_service.detect_and_encode_faces(arr)
-        for f in faces:
+        for f in faces or []:
             db.add(
                 FaceVector(
                     image_id=img.id,
@@ -89,17 +294,89 @@ def import_drive_image_job(
                     embedding_model=settings.EMBEDDING_MODEL_VERSION,
                 )
             )
-
-        img.faces_count = len(faces)
-        img.processed = "completed"
+        file_id, md5_checksum, size = prepared["drive_file"]
+        retired = record_drive_file(
+            db, prepared["celebration_id"], file_id, md5_checksum, size, img.id, created=True
+        )
+        if metrics is not None:
+            record_ingest_quality(db, img, metrics)
+        if hashed is not None:
+            record_image_hash(db, img, hashed)
         db.commit()
+        committed = True
+        _delete_objects(retired)
+
+        if faces is None:
+            _progress_incr(prepared["celebration_id"], failed=True)
+            return
 
-        logger.info(f"✅ Imported {out_name} ({len(faces)} faces)")
-        _progress_incr(celebration_id)
+        logger.info(f"✅ Imported {prepared['out_name']} ({len(faces)} faces)")
+        _progress_incr(prepared["celebration_id"])
 
     except Exception as e:
-        logger.exception(f"❌ Drive import failed for {filename}: {e}")
+        logger.exception(f"❌ Drive import failed for {prepared['out_name']}: {e}")
         db.rollback()
-        _progress_incr(celebration_id, failed=True)
+        if not committed:
+            _discard_uploads(prepared["uploads"])
+        _progress_incr(prepared["celebration_id"], failed=True)
     finally:
         db.close()
+
+
+def import_drive_image_job(
+    file_id: str,
+    api_key: str,
+    filename: str,
+    mime_type: str,
+    celebrant: str,
+    photographer: str,
+    celebration_id: str,
+    md5_checksum: str | None = None,
+    size: int | None = None,
+    source_folder: str | None = None,
+) -> None:
+    prepared = _prepare(
+        file_id, api_key, filename, mime_type, celebrant, photographer, celebration_id,
+        md5_checksum, size, source_folder,
+    )
+    if prepared is None:
+        return
+    try:
+        detected = _detect(prepared)
+    except Exception as e:
+        logger.exception(f"❌ Face detection failed for {prepared['out_name']}: {e}")
+        detected = None
+    _persist(prepared, detected)
+
+
+def import_drive_batch_job(
+    files: list[dict],
+    api_key: str,
+    celebrant: str,
+    photographer: str,
+    celebration_id: str,
+) -> None:
+    """Import several Drive files with download/upload overlapping detection.
+
+    ``files`` are Drive listing entries (id, name, mimeType, md5Checksum,
+    size, and ``folder`` for recursive imports).
+    """
+    run_staged(
+        files,
+        prepare=lambda f: _prepare(
+            f["id"],
+            api_key,
+            f.get("name", "image.jpg"),
+            f.get("mimeType", "image/jpeg"),
+            celebrant,
+            photographer,
+            celebration_id,
+            f.get("md5Checksum"),
+            int(f["size"]) if f.get("size") else None,
+            f.get("folder"),
+        ),
+        detect=_detect,
+        persist=_persist,
+        io_threads=settings.INGEST_IO_THREADS,
+        depth=settings.INGEST_PIPELINE_DEPTH,
+    )
@@ -0,0 +1,379 @@
+"""
+Background Drive folder sync.
+
+POST /gdrive/import used to walk every page of the folder listing inside the
+request handler and then diff by output filename. Now the endpoint records a
+DriveFolderSync and returns; ``sync_folder`` lists in the background —
+optionally crawling subfolders — and dispatches, page by page as the listing
+arrives, only files that are new, changed, or were listed before but never
+imported. The finished listing is diffed against the folder's previous
+snapshot in drive_folder_entries for new/changed/removed counts. The API
+hands syncs to the worker backend as ``drive_sync`` jobs (listed in-process
+only on Modal, which can't run this package).
+
+Run ``python -m jobs.gdrive_sync`` from cron to re-sync every folder whose
+last sync is older than GDRIVE_SYNC_INTERVAL.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from db import SessionLocal
+from models import Celebration, WeddingImage, DriveFile, DriveFolderSync, DriveFolderEntry
+from config import settings
+from services import redis_client
+from services.gdrive import crawl_folder_images, list_folder_images
+from services.events import gdrive_channel, publish
+from jobs.dispatcher import dispatch_job, supports_batches
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when writing snapshots and backfills.
+_CHUNK = 1000
+
+# Start a new progress round unless the celebration's last one is still
+# running. Progress is celebration-wide (the import jobs only know the
+# celebration), so several folders syncing at once add to one round instead
+# of each zeroing what the others have counted.
+_BEGIN_ROUND = """
+local total = tonumber(redis.call('GET', KEYS[1]) or '0')
+local done = tonumber(redis.call('GET', KEYS[2]) or '0') + tonumber(redis.call('GET', KEYS[3]) or '0')
+if done < total then return 0 end
+for i = 1, 3 do redis.call('SET', KEYS[i], 0, 'EX', ARGV[1]) end
+return 1
+"""
+
+
+def progress_key(celebration_id: str, field: str) -> str:
+    return f"gdrive_import:{celebration_id}:{field}"
+
+
+def _publish_sync(sync: DriveFolderSync, total: int | None = None) -> None:
+    event = {
+        "type": "sync",
+        "sync_id": str(sync.id),
+        "status": sync.status,
+        "listed": sync.listed_count or 0,
+        "queued": sync.queued_count or 0,
+    }
+    if total is not None:
+        event["total"] = total
+    publish(gdrive_channel(str(sync.celebration_id)), event)
+
+
+def _size(f: dict) -> int | None:
+    return int(f["size"]) if f.get("size") else None
+
+
+def _diff(snapshot: dict[str, DriveFolderEntry], files: list[dict]) -> tuple[list, list, list]:
+    """Split a listing into (new, changed, removed IDs) against the last snapshot."""
+    new, changed = [], []
+    for f in files:
+        prev = snapshot.get(f["id"])
+        if prev is None:
+            new.append(f)
+        elif (prev.md5_checksum, prev.modified_time) != (f.get("md5Checksum"), f.get("modifiedTime")):
+            changed.append(f)
+    listed = {f["id"] for f in files}
+    removed = [file_id for file_id in snapshot if file_id not in listed]
+    return new, changed, removed
+
+
+class ImportPlanner:
+    """Picks the files in each listing page that still need importing.
+
+    drive_files maps Drive IDs to images; an unchanged md5Checksum means
+    nothing needs downloading. Files Drive has no checksum for fall back to
+    the snapshot's modifiedTime, then to size. The lookups load once, so
+    pages can be planned (and dispatched) as the listing streams in.
+    """
+
+    def __init__(self, db, celebration: Celebration, snapshot: dict[str, DriveFolderEntry] | None = None):
+        self.db = db
+        self.celebration_id = celebration.id
+        self.snapshot = snapshot or {}
+        self.skipped = 0
+        self.known = {
+            file_id: (md5, size)
+            for file_id, md5, size in db.query(
+                DriveFile.drive_file_id, DriveFile.md5_checksum, DriveFile.size
+            ).filter(DriveFile.celebration_id == celebration.id)
+        }
+        # Images imported before drive_files existed only match by output
+        # filename; they get linked as they're seen so later runs match by ID.
+        self.by_name = {
+            name: image_id
+            for name, image_id in db.query(WeddingImage.filename, WeddingImage.id)
+            .filter(WeddingImage.celebration_id == celebration.id)
+        }
+
+    def _unchanged(self, f: dict) -> bool:
+        md5, size = self.known[f["id"]]
+        if f.get("md5Checksum") and md5:
+            return f["md5Checksum"] == md5
+        prev = self.snapshot.get(f["id"])
+        if prev is not None and prev.modified_time and f.get("modifiedTime"):
+            return prev.modified_time == f["modifiedTime"]
+        return size is not None and _size(f) == size
+
+    def plan(self, files: list[dict]) -> list[dict]:
+        """Return the files from ``files`` to dispatch; the rest count as skipped."""
+        pending, backfill = [], []
+        for f in files:
+            if f["id"] in self.known:
+                if not self._unchanged(f):
+                    pending.append(f)
+                continue
+            name = f.get("name", "image.jpg")
+            image_id = self.by_name.get(name.rsplit(".", 1)[0] + ".jpg")
+            if image_id is None:
+                pending.append(f)
+                continue
+            backfill.append({
+                "id": uuid.uuid4(),
+                "celebration_id": self.celebration_id,
+                "drive_file_id": f["id"],
+                "md5_checksum": f.get("md5Checksum"),
+                "size": _size(f),
+                "image_id": image_id,
+                # Mapped by filename, not created: never retired by a re-import.
+                "created_by_import": False,
+            })
+
+        if backfill:
+            try:
+                for i in range(0, len(backfill), _CHUNK):
+                    self.db.execute(
+                        pg_insert(DriveFile).values(backfill[i:i + _CHUNK]).on_conflict_do_nothing()
+                    )
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                logger.warning("Could not backfill drive_files", exc_info=True)
+
+        self.skipped += len(files) - len(pending)
+        return pending
+
+
+def dispatch_import(
+    files: list[dict],
+    api_key: str,
+    celebrant: str,
+    photographer: str,
+    celebration_id: str,
+) -> None:
+    """Queue import jobs for ``files`` on the configured worker backend."""
+    if supports_batches():
+        # Batches pipeline downloads/uploads against face detection.
+        size = settings.INGEST_BATCH_SIZE
+        for i in range(0, len(files), size):
+            try:
+                dispatch_job(
+                    "import_drive_batch",
+                    files=files[i:i + size],
+                    api_key=api_key,
+                    celebrant=celebrant,
+                    photographer=photographer,
+                    celebration_id=celebration_id,
+                )
+            except Exception:
+                logger.exception("Failed to dispatch import batch")
+        return
+
+    for f in files:
+        try:
+            dispatch_job(
+                "import_drive_image",
+                file_id=f["id"],
+                api_key=api_key,
+                filename=f.get("name", "image.jpg"),
+                mime_type=f.get("mimeType", "image/jpeg"),
+                celebrant=celebrant,
+                photographer=photographer,
+                celebration_id=celebration_id,
+                md5_checksum=f.get("md5Checksum"),
+                size=_size(f),
+                source_folder=f.get("folder"),
+            )
+        except Exception:
+            logger.exception("Failed to dispatch import job")
+
+
+def _save_snapshot(db, sync_id: uuid.UUID, files: list[dict], removed: list[str]) -> None:
+    """Upsert this listing as the folder's snapshot and drop removed files."""
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "sync_id": sync_id,
+            "drive_file_id": f["id"],
+            "name": f.get("name"),
+            "md5_checksum": f.get("md5Checksum"),
+            "size": _size(f),
+            "modified_time": f.get("modifiedTime"),
+        }
+        for f in files
+    ]
+    for i in range(0, len(rows), _CHUNK):
+        stmt = pg_insert(DriveFolderEntry).values(rows[i:i + _CHUNK])
+        db.execute(stmt.on_conflict_do_update(
+            constraint="uq_drive_folder_entries_sync_file",
+            set_={
+                "name": stmt.excluded.name,
+                "md5_checksum": stmt.excluded.md5_checksum,
+                "size": stmt.excluded.size,
+                "modified_time": stmt.excluded.modified_time,
+            },
+        ))
+    for i in range(0, len(removed), _CHUNK):
+        db.query(DriveFolderEntry).filter(
+            DriveFolderEntry.sync_id == sync_id,
+            DriveFolderEntry.drive_file_id.in_(removed[i:i + _CHUNK]),
+        ).delete(synchronize_session=False)
+
+
+def sync_folder(sync_id: str) -> None:
+    """List a linked folder and dispatch what needs importing as pages arrive.
+
+    Each listing page is planned and dispatched as soon as it comes back, so
+    workers start on the first images while the rest of the folder (or
+    folder tree, for recursive syncs) is still being listed. Once the
+    listing completes it is diffed against the last snapshot for the
+    new/changed/removed counts and saved as the next snapshot.
+    """
+    lock = f"gdrive_sync:{sync_id}:lock"
+    locked = False
+    try:
+        if not redis_client.set(lock, 1, nx=True, ex=3600):
+            logger.info(f"🟡 Drive sync {sync_id} already running; skipped")
+            return
+        locked = True
+    except Exception:
+        # Run unlocked rather than not at all; the lock belongs to whoever holds it.
+        logger.warning("Could not take drive sync lock", exc_info=True)
+
+    db = SessionLocal()
+    sync = None
+    try:
+        sync = db.get(DriveFolderSync, uuid.UUID(sync_id))
+        if not sync:
+            logger.warning(f"⚠️ Drive sync {sync_id} not found")
+            return
+        celebration = db.get(Celebration, sync.celebration_id)
+        cid = str(celebration.id)
+        api_key = sync.api_key
+        celebrant, photographer = celebration.celebrant, celebration.photographer
+
+        sync.status = "listing"
+        sync.listed_count = 0
+        sync.queued_count = 0
+        sync.error_message = None
+        db.commit()
+        _publish_sync(sync, total=0)
+
+        snapshot = {
+            e.drive_file_id: e
+            for e in db.query(DriveFolderEntry).filter(DriveFolderEntry.sync_id == sync.id)
+        }
+        planner = ImportPlanner(db, celebration, snapshot)
+
+        try:
+            redis_client.eval(
+                _BEGIN_ROUND, 3,
+                progress_key(cid, "total"), progress_key(cid, "done"), progress_key(cid, "failed"),
+                86400,
+            )
+        except Exception:
+            logger.warning("Could not init gdrive import progress", exc_info=True)
+
+        def _on_page(page: list[dict]) -> None:
+            pending = planner.plan(page)
+            total = None
+            if pending:
+                try:
+                    total = redis_client.incrby(progress_key(cid, "total"), len(pending))
+                except Exception:
+                    logger.warning("Could not update gdrive import progress", exc_info=True)
+                dispatch_import(pending, api_key, celebrant, photographer, cid)
+            sync.listed_count += len(page)
+            sync.queued_count += len(pending)
+            db.commit()
+            _publish_sync(sync, total)
+
+        try:
+            if sync.recursive:
+                files = crawl_folder_images(
+                    sync.folder_id, api_key, on_page=_on_page,
+                    workers=settings.GDRIVE_CRAWL_WORKERS,
+                )
+            else:
+                files = list_folder_images(sync.folder_id, api_key, on_page=_on_page)
+        except Exception:
+            logger.exception("Drive folder listing failed")
+            db.rollback()
+            sync.status = "failed"
+            sync.error_message = "تعذر الوصول للمجلد. تأكد أن المجلد عام (Public)"
+            db.commit()
+            _publish_sync(sync)
+            return
+
+        new, changed, removed = _diff(snapshot, files)
+        _save_snapshot(db, sync.id, files, removed)
+
+        sync.status = "idle"
+        sync.new_count = len(new)
+        sync.changed_count = len(changed)
+        sync.removed_count = len(removed)
+        sync.skipped_count = planner.skipped
+        sync.last_synced_at = datetime.utcnow()
+        db.commit()
+        _publish_sync(sync)
+        logger.info(
+            f"✅ Drive sync {sync_id}: {len(files)} listed, {len(new)} new, "
+            f"{len(changed)} changed, {len(removed)} removed, {sync.queued_count} queued"
+        )
+
+    except Exception as e:
+        logger.exception(f"❌ Drive sync {sync_id} failed: {e}")
+        db.rollback()
+        if sync is not None:
+            sync.status = "failed"
+            sync.error_message = str(e)
+            db.commit()
+            _publish_sync(sync)
+    finally:
+        db.close()
+        if locked:
+            try:
+                redis_client.delete(lock)
+            except Exception:
+                pass
+
+
+def sync_due_folders() -> int:
+    """Re-sync every folder last synced more than GDRIVE_SYNC_INTERVAL ago."""
+    if settings.GDRIVE_SYNC_INTERVAL <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.GDRIVE_SYNC_INTERVAL)
+    db = SessionLocal()
+    try:
+        due = [
+            str(sync_id)
+            for (sync_id,) in db.query(DriveFolderSync.id).filter(
+                # Runs already in progress are skipped by sync_folder's lock.
+                or_(DriveFolderSync.last_synced_at.is_(None), DriveFolderSync.last_synced_at < cutoff),
+            ).order_by(DriveFolderSync.last_synced_at.asc().nullsfirst())
+        ]
+    finally:
+        db.close()
+    for sync_id in due:
+        sync_folder(sync_id)
+    return len(due)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    n = sync_due_folders()
+    print(f"🔄 Re-synced {n} Drive folder(s)")
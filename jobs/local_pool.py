@@ -0,0 +1,152 @@
+"""
+In-process "local" worker backend (WORKER_BACKEND=local).
+
+Runs the same job functions the RQ worker runs, in a process pool owned by
+the API process — parallel ingest on a single box with no Redis queue or
+separate worker containers. Each pool process loads the face model once at
+startup and keeps it for every job it runs.
+
+The queue is bounded: at most ``LOCAL_QUEUE_SIZE`` jobs may be running or
+waiting. Dispatch blocks for up to ``LOCAL_QUEUE_TIMEOUT`` seconds for room
+and then raises ``QueueFull``, so a huge import applies back-pressure instead
+of buffering every upload's bytes in memory. Because it blocks, async
+endpoints must dispatch from the threadpool, never on the event loop.
+
+Each gunicorn worker gets its own pool, so the host runs
+``gunicorn workers x LOCAL_WORKERS`` model processes.
+
+Jobs that dispatch further jobs (a quality coordinator's chunks, a Drive
+sync's import pages) must not start a pool of their own inside a pool
+process — it would load the model again and sit outside the queue bound.
+``submit`` refuses there; the dispatcher runs such jobs in the calling
+process instead (``run_here``).
+"""
+from __future__ import annotations
+
+import atexit
+import importlib
+import logging
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_slots: threading.BoundedSemaphore | None = None
+_in_worker = False
+
+
+class QueueFull(RuntimeError):
+    """No room freed up in the bounded queue within ``LOCAL_QUEUE_TIMEOUT``."""
+
+
+def _init_process() -> None:
+    """Pool initializer: runs once per process, before its first job."""
+    global _in_worker
+    _in_worker = True
+    logging.basicConfig(level=logging.INFO)
+    from services import face_service
+    face_service.preload()
+
+
+def _run(func_path: str, args: tuple) -> None:
+    module_name, func_name = func_path.rsplit(".", 1)
+    func = getattr(importlib.import_module(module_name), func_name)
+    func(*args)
+
+
+def in_worker() -> bool:
+    """Whether this is one of the pool's processes rather than the API."""
+    return _in_worker
+
+
+def run_here(job_type: str, func_path: str, args: tuple) -> str:
+    """Run ``func_path(*args)`` to completion in this process.
+
+    For jobs dispatched from inside a pool process. Failures are logged, not
+    raised, as they would be for a job run on the pool.
+    """
+    job_id = uuid.uuid4().hex
+    logger.info(f"[local] Running nested {job_type} job inline: {job_id}")
+    try:
+        _run(func_path, args)
+    except Exception as e:
+        logger.error(f"[local] {job_type} job {job_id} failed: {e}")
+    return job_id
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process holds DB pools, Redis sockets
+            # and event-loop threads that must not be duplicated into workers.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.LOCAL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process,
+            )
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(settings.LOCAL_QUEUE_SIZE)
+            logger.info(f"[local] Started pool with {settings.LOCAL_WORKERS} processes")
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(job_type: str, func_path: str, args: tuple, _retried: bool = False) -> str:
+    """Queue ``func_path(*args)`` on the pool. Returns a job ID for logging."""
+    if _in_worker:
+        raise RuntimeError(f"{job_type} submitted from inside a local pool process; use run_here")
+    pool = _get_pool()
+    if not _slots.acquire(timeout=settings.LOCAL_QUEUE_TIMEOUT):
+        raise QueueFull(
+            f"Local worker queue full ({settings.LOCAL_QUEUE_SIZE} jobs); try again later"
+        )
+
+    job_id = uuid.uuid4().hex
+
+    def _done(fut: Future) -> None:
+        _slots.release()
+        if fut.cancelled():
+            return
+        err = fut.exception()
+        if isinstance(err, BrokenProcessPool):
+            logger.error(f"[local] Pool died running {job_type} job {job_id}; restarting it")
+            _reset_pool(pool)
+        elif err is not None:
+            logger.error(f"[local] {job_type} job {job_id} failed: {err}")
+
+    try:
+        fut = pool.submit(_run, func_path, args)
+    except BrokenProcessPool:
+        _slots.release()
+        _reset_pool(pool)
+        if _retried:
+            raise
+        return submit(job_type, func_path, args, _retried=True)
+    except Exception:
+        _slots.release()
+        raise
+    fut.add_done_callback(_done)
+
+    logger.info(f"[local] Dispatched {job_type} job: {job_id}")
+    return job_id
+
+
+@atexit.register
+def _shutdown() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
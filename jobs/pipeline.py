@@ -0,0 +1,100 @@
+"""
+Staged ingest pipeline.
+
+A single-image job runs download → hash → compress → S3 uploads → decode →
+detect → DB write strictly in sequence, so the CPU idles during network I/O
+and the network idles during inference. Batch jobs instead push their images
+through three overlapping stages:
+
+    prepare  (I/O thread pool)   fetch, hash, dedupe, start the S3 uploads
+    detect   (the job's thread)  decode + face detection, keeps the model busy
+    persist  (one writer thread) image/face rows, status, progress
+
+Where the image row is written is up to the caller: direct uploads insert a
+pending row in ``prepare`` (their single S3 copy is already stored), while
+Drive imports insert it in ``persist`` once the uploads finish, so a failed
+import leaves no row behind.
+
+Stages are linked by bounded queues, so at most ``io_threads + depth``
+images are in flight and memory stays flat however long the batch is.
+onnxruntime and cv2 release the GIL while they work, so the threads overlap
+for real rather than taking turns.
+
+Stage functions own their error handling: return None from ``prepare`` to
+drop an item (duplicate, failed download). If ``detect`` raises, ``persist``
+gets a None result so it can mark the row failed.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def run_staged(
+    items: Iterable[Any],
+    prepare: Callable[[Any], Any],
+    detect: Callable[[Any], Any],
+    persist: Callable[[Any, Any], None],
+    io_threads: int = 4,
+    depth: int = 4,
+) -> None:
+    """Run every item through prepare → detect → persist with overlap."""
+    persist_q: queue.Queue = queue.Queue(maxsize=depth)
+
+    def _writer():
+        while True:
+            job = persist_q.get()
+            if job is _DONE:
+                return
+            prepared, result = job
+            try:
+                persist(prepared, result)
+            except Exception:
+                logger.exception("Ingest persist stage failed")
+
+    writer = threading.Thread(target=_writer, name="ingest-persist", daemon=True)
+    writer.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="ingest-io") as pool:
+            source = iter(items)
+            in_flight = set()
+
+            def _top_up():
+                while len(in_flight) < io_threads + depth:
+                    item = next(source, _DONE)
+                    if item is _DONE:
+                        return
+                    in_flight.add(pool.submit(prepare, item))
+
+            _top_up()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    in_flight.discard(fut)
+                    try:
+                        prepared = fut.result()
+                    except Exception:
+                        logger.exception("Ingest prepare stage failed")
+                        continue
+                    if prepared is None:
+                        continue
+                    try:
+                        result = detect(prepared)
+                    except Exception:
+                        logger.exception("Ingest detect stage failed")
+                        result = None
+                    # Blocks when the writer falls behind — back-pressure
+                    # instead of piling decoded results up in memory.
+                    persist_q.put((prepared, result))
+                _top_up()
+    finally:
+        persist_q.put(_DONE)
+        writer.join()
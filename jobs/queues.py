@@ -0,0 +1,75 @@
+"""
+RQ priority lanes.
+
+Every job type gets its own named queue so a bulk ``/reprocess/all`` run can't
+starve a photographer's fresh upload. Workers listen on every lane and pick
+the next one by weighted draw, so interactive work almost always goes first
+but bulk lanes still make progress instead of waiting for an empty inbox.
+"""
+from __future__ import annotations
+
+import random
+
+from config import settings
+
+# Lane names, highest priority first. "default" stays last so jobs enqueued
+# before the lanes existed still drain after a deploy.
+INGEST = "ingest"
+DRIVE_IMPORT = "drive_import"
+QUALITY = "quality"
+REPROCESS = "reprocess"
+DEFAULT = "default"
+
+LANES = [INGEST, DRIVE_IMPORT, QUALITY, REPROCESS, DEFAULT]
+
+# Relative odds of a lane being checked first. Upload is 8x as likely as
+# reprocess to be served next when both have work waiting.
+LANE_WEIGHTS = {
+    INGEST: 8,
+    DRIVE_IMPORT: 4,
+    QUALITY: 2,
+    REPROCESS: 1,
+    DEFAULT: 1,
+}
+
+JOB_LANES = {
+    "process_image": INGEST,
+    "process_image_batch": INGEST,
+    "import_drive_image": DRIVE_IMPORT,
+    "import_drive_batch": DRIVE_IMPORT,
+    "drive_sync": DRIVE_IMPORT,
+    "quality_analysis": QUALITY,
+    "quality_chunk": QUALITY,
+    "reprocess_image": REPROCESS,
+}
+
+
+def lane_for(job_type: str) -> str:
+    """Queue name a job type is routed to."""
+    return JOB_LANES.get(job_type, DEFAULT)
+
+
+def worker_lanes() -> list[str]:
+    """Lanes this worker process should listen on, in priority order.
+
+    ``RQ_QUEUES`` lets an operator pin dedicated workers to a subset
+    (e.g. ``RQ_QUEUES=ingest`` for a box that only serves uploads).
+    """
+    if not settings.RQ_QUEUES:
+        return list(LANES)
+    wanted = [q.strip() for q in settings.RQ_QUEUES.split(",") if q.strip()]
+    return sorted(wanted, key=lambda q: LANES.index(q) if q in LANES else len(LANES))
+
+
+def weighted_order(names: list[str]) -> list[str]:
+    """Weighted random permutation of lane names (Efraimidis–Spirakis).
+
+    Each lane draws ``u ** (1 / weight)`` and lanes are sorted by that key,
+    so a lane with weight 8 comes before one with weight 1 about 8 times in 9.
+    """
+    keyed = [
+        (random.random() ** (1.0 / LANE_WEIGHTS.get(name, 1)), name)
+        for name in names
+    ]
+    keyed.sort(reverse=True)
+    return [name for _, name in keyed]
@@ -1,6 +1,7 @@
 from db import SessionLocal
 from routers.uploads import _process_image_faces
 from models import WeddingImage, FaceVector
+from services.events import publish, REPROCESS_CHANNEL
 import requests
 import logging
 
@@ -39,7 +40,9 @@ def reprocess_image_job(image_id: str):
 
         _process_image_faces(db, img, content)
         logger.info(f"✅ Completed reprocessing {img.filename}")
+        publish(REPROCESS_CHANNEL, {"type": "reprocess", "image_id": image_id, "processed": img.processed})
     except Exception as e:
         logger.exception(f"❌ Error reprocessing {img.filename}: {e}")
+        publish(REPROCESS_CHANNEL, {"type": "reprocess", "image_id": image_id, "processed": "failed"})
     finally:
         db.close()
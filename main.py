@@ -1,4 +1,4 @@
-import os, logging
+import os, logging, threading, time
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -45,3 +45,54 @@ def init_db():
         logging.getLogger(__name__).info("DB ready")
     except Exception:
         logging.getLogger(__name__).exception("DB init failed")
+
+
+@app.on_event("startup")
+def start_fair_share_drain():
+    """Periodically release parked jobs (see jobs.dispatcher.drain_parked).
+
+    Without it a slot that expires because its worker died only frees up for
+    parked jobs on the next completion or dispatch.
+    """
+    interval = settings.FAIR_SHARE_DRAIN_INTERVAL
+    if interval <= 0 or settings.WORKER_BACKEND.lower() == "local":
+        return
+    if settings.FAIR_SHARE_TENANT_CAP <= 0 and settings.FAIR_SHARE_GLOBAL_CAP <= 0:
+        return
+    from jobs.dispatcher import drain_parked
+
+    def _loop():
+        while True:
+            time.sleep(interval)
+            drain_parked()
+
+    threading.Thread(target=_loop, name="fair-share-drain", daemon=True).start()
+
+
+@app.on_event("startup")
+def start_quality_chunk_sweep():
+    """Periodically re-dispatch lost quality chunks (see
+    services.quality_analyzer.resume_lost_chunks).
+
+    Status reads no longer re-dispatch anything, so without it a chunk whose
+    worker died would wait for someone to re-trigger the analysis.
+    """
+    interval = settings.QUALITY_CHUNK_SWEEP_INTERVAL
+    if interval <= 0:
+        return
+    from db import SessionLocal
+    from services.quality_analyzer import resume_lost_chunks
+
+    def _loop():
+        while True:
+            time.sleep(interval)
+            db = SessionLocal()
+            try:
+                resume_lost_chunks(db)
+            except Exception:
+                logging.getLogger(__name__).warning("Quality chunk sweep failed", exc_info=True)
+                db.rollback()
+            finally:
+                db.close()
+
+    threading.Thread(target=_loop, name="quality-chunk-sweep", daemon=True).start()
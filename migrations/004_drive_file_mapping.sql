@@ -0,0 +1,20 @@
+-- Migration 004: map Google Drive files to the images they were imported as.
+--
+-- POST /gdrive/import used to match re-runs by output filename only, and the
+-- worker had to download a file before its content hash could show it was a
+-- duplicate. With (drive_file_id, md5_checksum, size) recorded per celebration,
+-- unchanged files are skipped straight from the folder listing.
+
+CREATE TABLE IF NOT EXISTS drive_files (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    celebration_id UUID NOT NULL REFERENCES celebrations(id) ON DELETE CASCADE,
+    drive_file_id VARCHAR(128) NOT NULL,
+    md5_checksum VARCHAR(32),
+    size BIGINT,
+    image_id UUID NOT NULL REFERENCES wedding_images(id) ON DELETE CASCADE,
+    imported_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    CONSTRAINT uq_drive_files_celebration_file UNIQUE (celebration_id, drive_file_id)
+);
+
+-- Deleting an image cascades here; this index keeps that cascade cheap.
+CREATE INDEX IF NOT EXISTS idx_drive_files_image_id ON drive_files(image_id);
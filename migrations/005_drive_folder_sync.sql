@@ -0,0 +1,38 @@
+-- Migration 005: incremental Drive folder sync.
+--
+-- drive_folder_syncs links a Drive folder to a celebration and tracks the
+-- latest background sync; drive_folder_entries keeps that sync's listing so
+-- the next one can report new / changed / removed files and dispatch only
+-- what needs importing.
+
+CREATE TABLE IF NOT EXISTS drive_folder_syncs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    celebration_id UUID NOT NULL REFERENCES celebrations(id) ON DELETE CASCADE,
+    folder_id VARCHAR(128) NOT NULL,
+    api_key VARCHAR NOT NULL,
+    status VARCHAR(20) DEFAULT 'idle',
+    listed_count INTEGER DEFAULT 0,
+    new_count INTEGER DEFAULT 0,
+    changed_count INTEGER DEFAULT 0,
+    removed_count INTEGER DEFAULT 0,
+    queued_count INTEGER DEFAULT 0,
+    skipped_count INTEGER DEFAULT 0,
+    last_synced_at TIMESTAMP,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    CONSTRAINT uq_drive_folder_syncs_celebration_folder UNIQUE (celebration_id, folder_id)
+);
+
+CREATE TABLE IF NOT EXISTS drive_folder_entries (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    sync_id UUID NOT NULL REFERENCES drive_folder_syncs(id) ON DELETE CASCADE,
+    drive_file_id VARCHAR(128) NOT NULL,
+    name VARCHAR,
+    md5_checksum VARCHAR(32),
+    size BIGINT,
+    modified_time VARCHAR(40),
+    CONSTRAINT uq_drive_folder_entries_sync_file UNIQUE (sync_id, drive_file_id)
+);
+
+-- Periodic re-sync picks the folders synced longest ago.
+CREATE INDEX IF NOT EXISTS idx_drive_folder_syncs_last_synced_at ON drive_folder_syncs(last_synced_at);
@@ -0,0 +1,30 @@
+-- Migration 006: recursive Drive imports.
+--
+-- Images imported from a Drive subfolder keep its path (e.g. "ceremony" or
+-- "reception/first-dance") so the gallery can filter by it, and a linked
+-- folder remembers whether it is synced with its subfolders.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'wedding_images'
+        AND column_name = 'source_folder'
+    ) THEN
+        ALTER TABLE wedding_images ADD COLUMN source_folder VARCHAR;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'drive_folder_syncs'
+        AND column_name = 'recursive'
+    ) THEN
+        ALTER TABLE drive_folder_syncs ADD COLUMN recursive BOOLEAN DEFAULT FALSE;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_wedding_images_celebration_source_folder
+    ON wedding_images(celebration_id, source_folder);
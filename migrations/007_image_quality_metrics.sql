@@ -0,0 +1,23 @@
+-- Migration 007: persist raw quality metrics per image.
+--
+-- Quality flags only depend on a handful of scalars (Laplacian variance, mean
+-- brightness, dark/clipped ratios, motion-blur band ratio, per-face closed-eye
+-- scores). Storing them lets a re-analysis at a new threshold, or with new
+-- calibration, re-flag a celebration in one pass over this table instead of
+-- fetching and decoding every image from S3 again.
+
+CREATE TABLE IF NOT EXISTS image_quality_metrics (
+    image_id UUID PRIMARY KEY REFERENCES wedding_images(id) ON DELETE CASCADE,
+    celebration_id UUID NOT NULL REFERENCES celebrations(id) ON DELETE CASCADE,
+    metrics_version INTEGER NOT NULL,
+    laplacian_var DOUBLE PRECISION NOT NULL,
+    brightness DOUBLE PRECISION NOT NULL,
+    dark_ratio DOUBLE PRECISION NOT NULL,
+    clipped_ratio DOUBLE PRECISION NOT NULL,
+    motion_ratio DOUBLE PRECISION NOT NULL,
+    eye_scores DOUBLE PRECISION[],
+    analyzed_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_quality_metrics_celebration_id
+    ON image_quality_metrics(celebration_id);
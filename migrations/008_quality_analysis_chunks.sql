@@ -0,0 +1,24 @@
+-- Migration 008: split quality-analysis jobs into resumable chunks.
+--
+-- A celebration's images are partitioned into fixed-size chunks, each run as
+-- its own worker job that commits its own progress. The coordinator stores
+-- the shared calibration on the job row; the job's counters are the sum over
+-- its chunks. A crashed worker costs one chunk, which is re-dispatched.
+
+ALTER TABLE quality_analysis_jobs ADD COLUMN IF NOT EXISTS calibration TEXT;
+
+CREATE TABLE IF NOT EXISTS quality_analysis_chunks (
+    id UUID PRIMARY KEY,
+    job_id UUID NOT NULL REFERENCES quality_analysis_jobs(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    image_ids UUID[] NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    processed_count INTEGER DEFAULT 0,
+    flagged_count INTEGER DEFAULT 0,
+    attempts INTEGER DEFAULT 0,
+    dispatched_at TIMESTAMP,
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    error_message TEXT,
+    CONSTRAINT uq_quality_analysis_chunks_job_index UNIQUE (job_id, chunk_index)
+);
@@ -0,0 +1,16 @@
+-- Migration 009: per-celebration calibration sketches.
+--
+-- Calibration needs a few quantiles of each celebration's sharpness and
+-- brightness. Instead of decoding a random S3 sample on every analysis run,
+-- each celebration keeps fixed-bucket histograms of both, incremented as
+-- metrics are stored at ingest or analysis time. Buckets merge by addition,
+-- so concurrent workers update them with plain upserts.
+
+CREATE TABLE IF NOT EXISTS quality_calibration_bins (
+    celebration_id UUID NOT NULL REFERENCES celebrations(id) ON DELETE CASCADE,
+    metrics_version INTEGER NOT NULL,
+    metric VARCHAR(20) NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (celebration_id, metrics_version, metric, bin)
+);
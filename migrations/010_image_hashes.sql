@@ -0,0 +1,24 @@
+-- Migration 010: perceptual hashes for near-duplicate and burst detection.
+--
+-- file_hash only catches byte-identical files; the frames of a burst all
+-- hash differently. Each ingested image gets a 64-bit dHash. ``bands`` holds
+-- its eight bytes tagged with their position (band * 256 + byte): two hashes
+-- within Hamming distance 7 share at least one band exactly, so a GIN
+-- overlap query finds every near-duplicate candidate (multi-index hashing)
+-- and the exact distance is checked on those few rows. ``burst_id`` is the
+-- first image of the near-duplicate group (the image itself if it has none).
+
+CREATE TABLE IF NOT EXISTS image_hashes (
+    image_id UUID PRIMARY KEY REFERENCES wedding_images(id) ON DELETE CASCADE,
+    celebration_id UUID NOT NULL REFERENCES celebrations(id) ON DELETE CASCADE,
+    dhash BIGINT NOT NULL,
+    bands INTEGER[] NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    burst_id UUID NOT NULL,
+    created_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_hashes_celebration_id ON image_hashes(celebration_id);
+CREATE INDEX IF NOT EXISTS idx_image_hashes_bands ON image_hashes USING GIN (bands);
+CREATE INDEX IF NOT EXISTS idx_image_hashes_burst_id ON image_hashes(burst_id);
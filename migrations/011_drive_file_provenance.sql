@@ -0,0 +1,18 @@
+-- Migration 011: which Drive files created the image they map to.
+--
+-- A Drive file whose content hash matched an existing image (or that a sync
+-- backfilled by filename) maps to an image it didn't create — possibly a
+-- direct upload or another celebration's. When such a file changes in Drive
+-- the re-import must not delete that image; only images the import itself
+-- inserted are retired. Existing rows can't tell, so they default to FALSE.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'drive_files'
+        AND column_name = 'created_by_import'
+    ) THEN
+        ALTER TABLE drive_files ADD COLUMN created_by_import BOOLEAN NOT NULL DEFAULT FALSE;
+    END IF;
+END $$;
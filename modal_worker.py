@@ -24,6 +24,10 @@ DET_SIZE = 640
 MIN_FACE_PIXELS = 48
 EMBEDDING_MODEL_VERSION = "buffalo_l_v1"
 
+# Must match services/quality_analyzer.METRICS_VERSION — stored quality
+# metrics from another version are recomputed rather than re-thresholded.
+QUALITY_METRICS_VERSION = 5
+
 # Container image with all dependencies
 image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -70,18 +74,30 @@ def get_db_session():
     return Session()
 
 
+_s3_client = None
+
+
 def get_s3_client():
-    """Create S3 client."""
+    """S3 client shared by every call in this container.
+
+    boto3 clients are thread-safe; the pool is sized so concurrent uploads
+    and multipart parts reuse keep-alive connections.
+    """
     import os
     import boto3
-
-    return boto3.client(
-        "s3",
-        region_name=os.environ.get("AWS_REGION", "nyc3"),
-        endpoint_url=os.environ.get("S3_ENDPOINT"),
-        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-    )
+    from botocore.config import Config
+
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client(
+            "s3",
+            region_name=os.environ.get("AWS_REGION", "nyc3"),
+            endpoint_url=os.environ.get("S3_ENDPOINT"),
+            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+            config=Config(max_pool_connections=32),
+        )
+    return _s3_client
 
 
 def get_redis_client():
@@ -139,6 +155,1031 @@ def _decode_image_with_exif(image_bytes: bytes):
         return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
 
+def _decode_gray(image_bytes: bytes):
+    """Mirrors utils.load_gray_from_bytes: the grayscale frame, decoding
+    JPEGs luma-only. Returns None when the bytes can't be decoded."""
+    import io
+    import logging
+    import numpy as np
+    import cv2
+    from PIL import Image, ImageOps
+
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except Exception:
+        pass
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.draft("L", img.size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "L":
+            img = img.convert("L")
+        return np.asarray(img)
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"PIL decode failed ({e}); falling back to cv2")
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def _laplacian_var(gray) -> float:
+    """Mirrors quality_analyzer._laplacian_var."""
+    import cv2
+
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_64F))
+    return float(std[0, 0]) ** 2
+
+
+# Fair-share slot release. Mirrors jobs/fairshare.py + dispatcher.release_slot
+# (this file can't import the app package) — keep the Lua in sync. ``slot`` is
+# handed to each function by the dispatcher when the celebration is capped.
+_FAIRSHARE_PREFIX = "fairshare:"
+# Mirrors jobs/queues.LANES: a tenant's parked jobs drain in this order.
+_FAIRSHARE_LANES = ["ingest", "drive_import", "quality", "reprocess", "default"]
+_FAIRSHARE_NEXT = """
+local now, deadline, token = tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local tcap, gcap, ttl = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local ring, members, ginflight = ARGV[1] .. 'ring', ARGV[1] .. 'members', ARGV[1] .. 'inflight'
+redis.call('ZREMRANGEBYSCORE', ginflight, '-inf', now)
+if gcap > 0 and redis.call('ZCARD', ginflight) >= gcap then return nil end
+local n = redis.call('LLEN', ring)
+for i = 1, n do
+  local tenant = redis.call('RPOPLPUSH', ring, ring)
+  local pending, waiting = nil, 0
+  for j = 8, #ARGV do
+    local key = ARGV[1] .. 'pending:' .. tenant .. ':' .. ARGV[j]
+    local len = redis.call('LLEN', key)
+    if len > 0 and pending == nil then pending = key end
+    waiting = waiting + len
+  end
+  if pending == nil then
+    redis.call('LREM', ring, 0, tenant)
+    redis.call('SREM', members, tenant)
+  else
+    local inflight = ginflight .. ':' .. tenant
+    redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now)
+    if tcap <= 0 or redis.call('ZCARD', inflight) < tcap then
+      local payload = redis.call('LPOP', pending)
+      redis.call('ZADD', inflight, deadline, token)
+      redis.call('ZADD', ginflight, deadline, token)
+      redis.call('EXPIRE', inflight, ttl)
+      redis.call('EXPIRE', ginflight, ttl)
+      if waiting == 1 then
+        redis.call('LREM', ring, 0, tenant)
+        redis.call('SREM', members, tenant)
+      end
+      return {tenant, payload}
+    end
+  end
+end
+return nil
+"""
+
+
+def _release_slot(slot: dict | None) -> None:
+    """Free this job's fair-share slot and spawn the jobs it unblocks, round-robin."""
+    if not slot:
+        return
+    import os
+    import time
+    import uuid
+    import pickle
+    import logging
+    import redis
+
+    logger = logging.getLogger(__name__)
+    tenant_cap = int(os.environ.get("FAIR_SHARE_TENANT_CAP", "8"))
+    global_cap = int(os.environ.get("FAIR_SHARE_GLOBAL_CAP", "0"))
+    ttl = int(os.environ.get("FAIR_SHARE_SLOT_TTL", "1200"))
+
+    try:
+        conn = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+        conn.zrem(f"{_FAIRSHARE_PREFIX}inflight", slot["token"])
+        conn.zrem(f"{_FAIRSHARE_PREFIX}inflight:{slot['tenant']}", slot["token"])
+
+        while True:
+            now = time.time()
+            token = uuid.uuid4().hex
+            res = conn.eval(
+                _FAIRSHARE_NEXT, 0,
+                _FAIRSHARE_PREFIX, now, now + ttl, token, tenant_cap, global_cap, ttl,
+                *_FAIRSHARE_LANES,
+            )
+            if not res:
+                break
+            tenant, raw = res
+            payload = pickle.loads(raw)
+            nxt = {"token": token, "tenant": tenant.decode()}
+            try:
+                fn = modal.Function.from_name(app.name, payload["modal_fn"])
+                fn.spawn(**payload["kwargs"], slot=nxt)
+            except Exception:
+                logger.exception(f"Failed to release parked {payload.get('job_type')} job")
+                conn.zrem(f"{_FAIRSHARE_PREFIX}inflight", token)
+                conn.zrem(f"{_FAIRSHARE_PREFIX}inflight:{nxt['tenant']}", token)
+    except Exception:
+        logger.warning("Fair-share slot release failed", exc_info=True)
+
+
+def _publish(channel: str, event: dict) -> None:
+    """Progress event for SSE dashboards. Mirrors services/events.publish."""
+    import json
+    try:
+        get_redis_client().publish(f"events:{channel}", json.dumps(event, default=str))
+    except Exception:
+        pass
+
+
+def _quality_features(image) -> dict:
+    """Mirrors services/quality_analyzer.extract_features: one grayscale
+    conversion and one pass for every scalar the quality detectors read."""
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    total = float(gray.size) or 1.0
+    # Motion blur: the full-resolution fftshift band sums (ky/kx in [-5, 4]),
+    # computed from a real-input FFT (see quality_analyzer._motion_ratio).
+    h, w = gray.shape[:2]
+    spec = np.abs(np.fft.rfft2(gray))
+    rows = np.r_[0:5, h - 5:h]
+    inner = slice(1, w // 2 if w % 2 == 0 else None)
+    hband = spec[rows, 0].sum() + spec[rows, inner].sum() + spec[(-rows) % h, inner].sum()
+    if w % 2 == 0:
+        hband += spec[rows, w // 2].sum()
+    vband = spec[:, :5].sum() + spec[:, 1:6].sum()
+    return {
+        "laplacian_var": _laplacian_var(gray),
+        "brightness": float(hist @ np.arange(256)) / total,
+        "dark_ratio": float(hist[:30].sum()) / total,
+        "clipped_ratio": float(hist[251:].sum()) / total,
+        "motion_ratio": float(max(hband, vband) / (min(hband, vband) + 1e-10)),
+    }
+
+
+def _box_laplacian_vars(gray, boxes):
+    """Mirrors services/quality_analyzer._box_laplacian_vars: Laplacian
+    variance per (x0, y0, x1, y1) box from one pass over their region."""
+    import cv2
+    import numpy as np
+
+    h, w = gray.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4).copy()
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, w)
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, h)
+    out = np.zeros(len(boxes))
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    if not valid.any():
+        return out
+    b = boxes[valid]
+    rx0, ry0 = max(int(b[:, 0].min()) - 1, 0), max(int(b[:, 1].min()) - 1, 0)
+    rx1, ry1 = min(int(b[:, 2].max()) + 1, w), min(int(b[:, 3].max()) + 1, h)
+    total, squares = cv2.integral2(
+        cv2.Laplacian(gray[ry0:ry1, rx0:rx1], cv2.CV_64F), sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F
+    )
+    x0, x1, y0, y1 = b[:, 0] - rx0, b[:, 2] - rx0, b[:, 1] - ry0, b[:, 3] - ry0
+    area = ((x1 - x0) * (y1 - y0)).astype(np.float64)
+    sums = total[y1, x1] - total[y0, x1] - total[y1, x0] + total[y0, x0]
+    sq = squares[y1, x1] - squares[y0, x1] - squares[y1, x0] + squares[y0, x0]
+    out[valid] = np.maximum(sq / area - (sums / area) ** 2, 0.0)
+    return out
+
+
+def _eye_boxes(landmarks: list, w: int, h: int) -> tuple:
+    """Mirrors quality_analyzer._eye_boxes: readable face indices and two
+    eye-patch boxes per readable face."""
+    import numpy as np
+
+    readable, boxes = [], []
+    for i, lm in enumerate(landmarks):
+        if lm is None:
+            continue
+        lm = np.asarray(lm, dtype=np.float32).reshape(-1, 2)
+        if len(lm) < 2:
+            continue
+        iod = float(np.linalg.norm(lm[0] - lm[1]))
+        if iod < 8:
+            continue
+        half_w, half_h = max(int(iod * 0.225), 4), max(int(iod * 0.15), 3)
+        readable.append(i)
+        for x, y in ((int(lm[0][0]), int(lm[0][1])), (int(lm[1][0]), int(lm[1][1]))):
+            boxes.append((max(x - half_w, 0), max(y - half_h, 0), min(x + half_w, w), min(y + half_h, h)))
+    return readable, np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+def _per_face_eye_scores(gray, readable, boxes, lap_vars, n_faces) -> list:
+    """Mirrors quality_analyzer._per_face_eye_scores: the mean closed score
+    of both eye patches per readable face, None for the rest."""
+    import cv2
+
+    patch = []
+    for (x0, y0, x1, y1), lap in zip(boxes, lap_vars):
+        if x1 <= x0 or y1 <= y0:
+            patch.append(0.0)
+            continue
+        lo, hi, _, _ = cv2.minMaxLoc(gray[y0:y1, x0:x1])
+        edge = 1.0 - min(float(lap) / 200.0, 1.0)
+        rng = 1.0 - min((hi - lo) / 80.0, 1.0)
+        patch.append(float((edge * rng) ** 0.5))
+    scores = [None] * n_faces
+    for k, i in enumerate(readable):
+        scores[i] = (patch[2 * k] + patch[2 * k + 1]) / 2
+    return scores
+
+
+def _closed_eye_scores(gray, faces) -> list:
+    """Mirrors services/quality_analyzer.closed_eye_scores: a closed-eye score
+    per readable face, reusing ``eye_score`` from detection when every face
+    carries one."""
+    faces = faces or []
+    if faces and all("eye_score" in f for f in faces):
+        return [f["eye_score"] for f in faces if f["eye_score"] is not None]
+    h, w = gray.shape[:2]
+    landmarks = [f.get("landmarks") if f.get("landmarks") is not None else f.get("kps") for f in faces]
+    readable, boxes = _eye_boxes(landmarks, w, h)
+    if not readable:
+        return []
+    scores = _per_face_eye_scores(gray, readable, boxes, _box_laplacian_vars(gray, boxes), len(faces))
+    return [s for s in scores if s is not None]
+
+
+# face_vectors columns a detected-face dict maps onto.
+_FACE_COLUMNS = ("face_index", "vector", "bbox", "landmarks", "confidence", "quality_score")
+
+
+def _detected_faces(image_bgr, faces) -> list:
+    """Mirrors FaceRecognitionService.detect_and_encode_faces after
+    detection: drop unusable detections, then score quality and closed eyes
+    for all faces at once (quality_analyzer.face_scores)."""
+    import cv2
+    import numpy as np
+
+    kept = []
+    for f in faces:
+        if f.embedding is None or len(f.embedding) != 512:
+            continue
+        x1, y1, x2, y2 = f.bbox.astype(int)
+        if min(max(x2 - x1, 0), max(y2 - y1, 0)) < MIN_FACE_PIXELS:
+            continue
+        kept.append(f)
+    if not kept:
+        return []
+
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    boxes = np.asarray([f.bbox for f in kept], dtype=np.float64).astype(np.int64)
+    readable, eye_boxes = _eye_boxes([f.kps for f in kept], w, h)
+    lap_vars = _box_laplacian_vars(gray, np.vstack([boxes, eye_boxes]))
+    eyes = _per_face_eye_scores(gray, readable, eye_boxes, lap_vars[len(kept):], len(kept))
+
+    out = []
+    for i, f in enumerate(kept):
+        x1, y1, x2, y2 = boxes[i]
+        quality = 0.0
+        if min(x2, w) > max(x1, 0) and min(y2, h) > max(y1, 0):
+            sharp = min(lap_vars[i] / 1000, 1.0)
+            size = min(max((y2 - y1) * (x2 - x1), 1) / 10000, 1.0)
+            conf = float(min(f.det_score, 1.0))
+            quality = float(sharp * 0.4 + size * 0.3 + conf * 0.3)
+        out.append({
+            "face_index": i,
+            "vector": f.embedding.tolist(),
+            "bbox": f.bbox.tolist(),
+            "landmarks": f.kps.flatten().tolist(),
+            "confidence": float(f.det_score),
+            "quality_score": quality,
+            "eye_score": eyes[i],
+        })
+    return out
+
+
+_QUALITY_METRIC_COLUMNS = ("laplacian_var", "brightness", "dark_ratio", "clipped_ratio", "motion_ratio", "eye_scores")
+
+
+def _store_quality_metrics(db, metrics_model, rows: list) -> None:
+    """Mirrors services/quality_analyzer.store_metrics, including feeding
+    first-time measurements into the calibration sketch."""
+    from datetime import datetime
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    if not rows:
+        return
+    ids = [r["image_id"] for r in rows]
+    known = set()
+    for i in range(0, len(ids), 1000):
+        known.update(image_id for (image_id,) in db.query(metrics_model.image_id).filter(
+            metrics_model.image_id.in_(ids[i:i + 1000]),
+            metrics_model.metrics_version == QUALITY_METRICS_VERSION,
+        ))
+    now = datetime.utcnow()
+    values = [
+        {
+            "image_id": r["image_id"],
+            "celebration_id": r["celebration_id"],
+            "metrics_version": QUALITY_METRICS_VERSION,
+            "analyzed_at": now,
+            **{c: r[c] for c in _QUALITY_METRIC_COLUMNS},
+        }
+        for r in rows
+    ]
+    for i in range(0, len(values), 1000):
+        stmt = pg_insert(metrics_model).values(values[i:i + 1000])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["image_id"],
+            set_={c: stmt.excluded[c] for c in ("metrics_version", "analyzed_at", *_QUALITY_METRIC_COLUMNS)},
+        ))
+    _add_quality_sketch(db, [r for r in rows if r["image_id"] not in known])
+
+
+def _quality_sketch_bins(row: dict) -> tuple:
+    """Mirrors quality_analyzer._brightness_bin/_laplacian_bin (8 log
+    buckets per octave up to 2**20)."""
+    import math
+
+    lap = max(0, min(160, round(math.log2(max(row["laplacian_var"], 1.0)) * 8)))
+    return (("brightness", max(0, min(255, int(row["brightness"])))), ("laplacian_var", lap))
+
+
+def _add_quality_sketch(db, rows: list) -> None:
+    """Mirrors services/quality_analyzer.add_to_calibration_sketch."""
+    from sqlalchemy import text
+
+    counts = {}
+    for r in rows:
+        for metric, b in _quality_sketch_bins(r):
+            key = (str(r["celebration_id"]), metric, b)
+            counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+    # Sorted so concurrent writers lock bucket rows in the same order.
+    db.execute(
+        text(
+            "INSERT INTO quality_calibration_bins (celebration_id, metrics_version, metric, bin, count) "
+            "VALUES (CAST(:cid AS UUID), :v, :metric, :bin, :n) "
+            "ON CONFLICT (celebration_id, metrics_version, metric, bin) "
+            "DO UPDATE SET count = quality_calibration_bins.count + EXCLUDED.count"
+        ),
+        [
+            {"cid": cid, "v": QUALITY_METRICS_VERSION, "metric": metric, "bin": b, "n": n}
+            for (cid, metric, b), n in sorted(counts.items())
+        ],
+    )
+
+
+def _quality_sketch_thresholds(db, celebration_id) -> tuple:
+    """Mirrors services/quality_analyzer._thresholds_from_sketch:
+    (images in the sketch, clamped thresholds or None if fewer than 5)."""
+    from sqlalchemy import text
+
+    bins = {"brightness": [], "laplacian_var": []}
+    for metric, b, count in db.execute(
+        text(
+            "SELECT metric, bin, count FROM quality_calibration_bins "
+            "WHERE celebration_id = CAST(:cid AS UUID) AND metrics_version = :v ORDER BY metric, bin"
+        ),
+        {"cid": str(celebration_id), "v": QUALITY_METRICS_VERSION},
+    ):
+        bins.setdefault(metric, []).append((b, count))
+
+    n = sum(count for _, count in bins["brightness"])
+    if n < 5 or not bins["laplacian_var"]:
+        return n, None
+
+    def pct(metric_bins, q):
+        rank = max(0, min(n - 1, int(q * (n - 1))))
+        seen = 0
+        for b, count in metric_bins:
+            seen += count
+            if seen > rank:
+                return b
+        return metric_bins[-1][0]
+
+    return n, {
+        "blur": max(50.0, min(180.0, 2.0 ** (pct(bins["laplacian_var"], 0.25) / 8))),
+        "brightness_low": max(15.0, min(60.0, pct(bins["brightness"], 0.10) + 0.5)),
+        "brightness_high": max(180.0, min(240.0, pct(bins["brightness"], 0.90) + 0.5)),
+        "sample_size": n,
+    }
+
+
+def _replace_quality_flags(db, flag_model, issues_by_image: dict) -> None:
+    """Mirrors services/quality_analyzer.replace_flags: swap each image's flags
+    for the new set, keeping reviewed/dismissed on issues still flagged."""
+    import uuid
+    from datetime import datetime
+    from sqlalchemy import any_, delete, literal
+    from sqlalchemy.dialects.postgresql import ARRAY, UUID as PGUUID, insert as pg_insert
+
+    ids = list(issues_by_image)
+    prior = {}
+    for i in range(0, len(ids), 1000):
+        deleted = db.execute(
+            delete(flag_model)
+            .where(flag_model.image_id == any_(literal(ids[i:i + 1000], ARRAY(PGUUID(as_uuid=True)))))
+            .returning(flag_model.image_id, flag_model.issue_type, flag_model.reviewed, flag_model.dismissed)
+            .execution_options(synchronize_session=False)
+        )
+        for image_id, issue_type, reviewed, dismissed in deleted:
+            prior[(image_id, issue_type)] = (reviewed, dismissed)
+
+    now = datetime.utcnow()
+    rows = []
+    for image_id, issues in issues_by_image.items():
+        for issue_type, conf in issues:
+            reviewed, dismissed = prior.get((image_id, issue_type), (False, False))
+            rows.append({
+                "id": uuid.uuid4(), "image_id": image_id, "issue_type": issue_type,
+                "confidence": conf, "reviewed": reviewed, "dismissed": dismissed, "created_at": now,
+            })
+    for i in range(0, len(rows), 1000):
+        db.execute(pg_insert(flag_model).values(rows[i:i + 1000]))
+
+
+def _quality_issues(feats: dict, threshold: float, blur_t: float = 100.0,
+                    under_t: float = 30.0, over_t: float = 220.0) -> list:
+    """(issue_type, confidence) pairs for a metrics record — the detectors
+    analyze_quality_chunk uses, shared with the ingest functions."""
+    issues = []
+
+    var = feats["laplacian_var"]
+    if var < blur_t:
+        conf = 1.0 - min(var / blur_t, 1.0)
+        if conf >= threshold:
+            issues.append(("blur", conf))
+
+    ratio = feats["motion_ratio"]
+    if ratio > 1 / 0.7:
+        conf = min(ratio / 3.0, 1.0)
+        if conf >= threshold:
+            issues.append(("motion_blur", conf))
+
+    eyes = max(feats.get("eye_scores") or [], default=0.0)
+    if eyes > 0.55 and eyes >= threshold:
+        issues.append(("closed_eyes", eyes))
+
+    bright, dark = feats["brightness"], feats["dark_ratio"]
+    if bright < under_t or dark > 0.5:
+        conf = max(1.0 - min(bright / under_t, 1.0), min(dark / 0.5, 1.0))
+        if conf >= threshold:
+            issues.append(("underexposed", conf))
+
+    clip = feats["clipped_ratio"]
+    if bright > over_t or clip > 0.1:
+        bf = min((bright - over_t) / (255 - over_t), 1.0) if bright > over_t else 0
+        conf = max(bf, min(clip / 0.1, 1.0))
+        if conf >= threshold:
+            issues.append(("overexposed", conf))
+
+    return issues
+
+
+_quality_model_cache = None
+
+
+def _quality_models():
+    """Inline (metrics, flag) ORM classes for the ingest functions."""
+    global _quality_model_cache
+    if _quality_model_cache is None:
+        import uuid as uuid_lib
+        from datetime import datetime
+        from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ARRAY
+        from sqlalchemy.dialects.postgresql import UUID as PGUUID
+        from sqlalchemy.orm import declarative_base
+
+        Base = declarative_base()
+
+        class ImageQualityMetrics(Base):
+            __tablename__ = "image_quality_metrics"
+            image_id = Column(PGUUID(as_uuid=True), primary_key=True)
+            celebration_id = Column(PGUUID(as_uuid=True), nullable=False)
+            metrics_version = Column(Integer, nullable=False)
+            laplacian_var = Column(Float, nullable=False)
+            brightness = Column(Float, nullable=False)
+            dark_ratio = Column(Float, nullable=False)
+            clipped_ratio = Column(Float, nullable=False)
+            motion_ratio = Column(Float, nullable=False)
+            eye_scores = Column(ARRAY(Float))
+            analyzed_at = Column(DateTime, default=datetime.utcnow)
+
+        class ImageQualityFlag(Base):
+            __tablename__ = "image_quality_flags"
+            id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+            image_id = Column(PGUUID(as_uuid=True), nullable=False)
+            issue_type = Column(String, nullable=False)
+            confidence = Column(Float, nullable=False)
+            reviewed = Column(Boolean, default=False)
+            dismissed = Column(Boolean, default=False)
+            created_at = Column(DateTime, default=datetime.utcnow)
+
+        _quality_model_cache = (ImageQualityMetrics, ImageQualityFlag)
+    return _quality_model_cache
+
+
+_quality_job_model_cache = None
+
+
+def _quality_job_models():
+    """Inline (job, chunk) ORM classes shared by analyze_quality and
+    analyze_quality_chunk."""
+    global _quality_job_model_cache
+    if _quality_job_model_cache is None:
+        import uuid as uuid_lib
+        from datetime import datetime
+        from sqlalchemy import Column, String, Integer, Float, DateTime, Text, ARRAY
+        from sqlalchemy.dialects.postgresql import UUID as PGUUID
+        from sqlalchemy.orm import declarative_base
+
+        Base = declarative_base()
+
+        class QualityAnalysisJob(Base):
+            __tablename__ = "quality_analysis_jobs"
+            id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+            celebration_id = Column(PGUUID(as_uuid=True), nullable=False)
+            total_images = Column(Integer, default=0)
+            processed_count = Column(Integer, default=0)
+            flagged_count = Column(Integer, default=0)
+            status = Column(String, default="pending")
+            threshold = Column(Float, default=0.70)
+            started_at = Column(DateTime, default=datetime.utcnow)
+            completed_at = Column(DateTime)
+            error_message = Column(String)
+            calibration = Column(Text)
+
+        class QualityAnalysisChunk(Base):
+            __tablename__ = "quality_analysis_chunks"
+            id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+            job_id = Column(PGUUID(as_uuid=True), nullable=False)
+            chunk_index = Column(Integer, nullable=False)
+            image_ids = Column(ARRAY(PGUUID(as_uuid=True)), nullable=False)
+            status = Column(String, default="pending")
+            processed_count = Column(Integer, default=0)
+            flagged_count = Column(Integer, default=0)
+            attempts = Column(Integer, default=0)
+            dispatched_at = Column(DateTime)
+            started_at = Column(DateTime)
+            completed_at = Column(DateTime)
+            error_message = Column(Text)
+
+        _quality_job_model_cache = (QualityAnalysisJob, QualityAnalysisChunk)
+    return _quality_job_model_cache
+
+
+def _publish_quality_job(job) -> None:
+    """Mirrors services/quality_analyzer._publish_job, including dropping the
+    cached dashboard summary and flag totals (services/quality_summary.py)."""
+    try:
+        get_redis_client().delete(
+            f"quality_summary:{job.celebration_id}", f"quality_flag_totals:{job.celebration_id}"
+        )
+    except Exception:
+        pass
+    _publish(f"quality:{job.celebration_id}", {
+        "type": "quality",
+        "id": str(job.id),
+        "status": job.status,
+        "total_images": job.total_images,
+        "processed_count": job.processed_count,
+        "flagged_count": job.flagged_count,
+    })
+
+
+def _sync_quality_job(db, job_id):
+    """Mirrors services/quality_analyzer._sync_job: recount the job from its
+    chunks under a row lock and complete it once every chunk is done."""
+    from datetime import datetime
+    from sqlalchemy import func
+
+    job_model, chunk_model = _quality_job_models()
+    job = db.query(job_model).filter(job_model.id == job_id).with_for_update().one()
+    processed, flagged, open_chunks = db.query(
+        func.coalesce(func.sum(chunk_model.processed_count), 0),
+        func.coalesce(func.sum(chunk_model.flagged_count), 0),
+        func.count().filter(chunk_model.status != "completed"),
+    ).filter(chunk_model.job_id == job_id).one()
+
+    job.processed_count = processed
+    job.flagged_count = flagged
+    if open_chunks == 0 and job.status == "processing":
+        job.status = "completed"
+        job.completed_at = datetime.utcnow()
+    db.commit()
+    _publish_quality_job(job)
+    return job
+
+
+def _ingest_quality(db, image_bgr, faces: list, image_id, celebration_id) -> None:
+    """Quality metrics and flags on the array an ingest function already
+    decoded, reusing its landmarks. Mirrors services/quality_analyzer
+    ingest_metrics + record_ingest_quality; a no-op unless QUALITY_ON_INGEST
+    is set. Runs in a savepoint so a failure never costs the image its faces;
+    the cached summary is dropped once the caller commits."""
+    import os
+    import logging
+    import cv2
+    import numpy as np
+    from sqlalchemy import event, text
+
+    if os.environ.get("QUALITY_ON_INGEST", "").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape[:2]
+        scale = 2048 / max(h, w)
+        if scale < 1:
+            # Measure at the compressed copy's resolution, as analyze_quality does.
+            gray = cv2.resize(gray, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+            faces = [
+                {"landmarks": (np.asarray(f["landmarks"], dtype=np.float32) * scale).tolist()}
+                for f in faces if f.get("landmarks") is not None
+            ]
+        feats = _quality_features(gray)
+        feats["eye_scores"] = _closed_eye_scores(gray, faces) if faces else None
+        threshold = float(os.environ.get("QUALITY_INGEST_THRESHOLD", "0.70"))
+
+        metrics_model, flag_model = _quality_models()
+        with db.begin_nested():
+            _store_quality_metrics(db, metrics_model, [
+                {"image_id": image_id, "celebration_id": celebration_id, **feats}
+            ])
+            _replace_quality_flags(db, flag_model, {image_id: _quality_issues(feats, threshold)})
+            db.execute(
+                text("UPDATE wedding_images SET quality_analyzed = TRUE WHERE id = :id"),
+                {"id": image_id},
+            )
+    except Exception:
+        logging.getLogger(__name__).warning(f"Could not record ingest quality for {image_id}", exc_info=True)
+        return
+
+    def _invalidate_summary(_session):
+        # Mirrors services/quality_summary.invalidate_summary.
+        try:
+            get_redis_client().delete(
+                f"quality_summary:{celebration_id}", f"quality_flag_totals:{celebration_id}"
+            )
+        except Exception:
+            pass
+
+    event.listen(db, "after_commit", _invalidate_summary, once=True)
+
+
+def _image_hash(image_bgr):
+    """Mirrors services/near_duplicates.hash_image: 64-bit dHash and size,
+    or None if hashing fails."""
+    import logging
+    import cv2
+    import numpy as np
+
+    try:
+        gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).ravel()
+        h, w = gray.shape[:2]
+        return {"dhash": int(np.packbits(bits).view(">u8")[0]), "width": w, "height": h}
+    except Exception:
+        logging.getLogger(__name__).warning("Perceptual hash failed", exc_info=True)
+        return None
+
+
+def _hash_bands(h: int) -> list:
+    """Mirrors near_duplicates._bands: each byte tagged with its position."""
+    return [(i << 8) | ((h >> (i * 8)) & 0xFF) for i in range(8)]
+
+
+def _find_near_duplicate(db, celebration_id, h: int, max_distance: int):
+    """Mirrors near_duplicates.find_near_duplicate: (row, distance) of the
+    nearest hashed image within ``max_distance`` bits (at most 7), or None."""
+    from sqlalchemy import text
+
+    max_distance = min(max_distance, 7)
+    if max_distance < 0:
+        return None
+    best = None
+    for row in db.execute(
+        text(
+            "SELECT image_id, dhash, burst_id, width, height FROM image_hashes "
+            "WHERE celebration_id = CAST(:cid AS UUID) AND bands && CAST(:bands AS INTEGER[])"
+        ),
+        {"cid": str(celebration_id), "bands": _hash_bands(h)},
+    ):
+        distance = ((h ^ row.dhash) & ((1 << 64) - 1)).bit_count()
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (row, distance)
+    return best
+
+
+def _reusable_faces(db, celebration_id, hashed):
+    """Mirrors near_duplicates.reusable_faces: a processed near-identical
+    sibling's faces (same size, current embedding model) when
+    REUSE_NEAR_DUPLICATE_FACES is set, else None."""
+    import os
+    import logging
+    from sqlalchemy import text
+
+    if hashed is None or os.environ.get("REUSE_NEAR_DUPLICATE_FACES", "").lower() not in ("1", "true", "yes"):
+        return None
+    try:
+        match = _find_near_duplicate(
+            db, celebration_id, hashed["dhash"], int(os.environ.get("NEAR_DUPLICATE_REUSE_DISTANCE", "2"))
+        )
+        if match is None:
+            return None
+        sibling, distance = match
+        if (sibling.width, sibling.height) != (hashed["width"], hashed["height"]):
+            return None
+        processed = db.execute(
+            text("SELECT processed FROM wedding_images WHERE id = :id"), {"id": sibling.image_id}
+        ).scalar()
+        if processed != "completed":
+            return None
+        rows = db.execute(
+            text(
+                "SELECT face_index, vector, bbox, landmarks, confidence, quality_score, embedding_model "
+                "FROM face_vectors WHERE image_id = :id ORDER BY face_index"
+            ),
+            {"id": sibling.image_id},
+        ).all()
+    except Exception:
+        logging.getLogger(__name__).warning("Near-duplicate face lookup failed", exc_info=True)
+        return None
+    if any(r.embedding_model != EMBEDDING_MODEL_VERSION for r in rows):
+        return None
+    logging.getLogger(__name__).info(
+        f"Reusing {len(rows)} faces from near-identical {sibling.image_id} ({distance} bits apart)"
+    )
+    return [
+        {
+            "face_index": r.face_index,
+            "vector": list(r.vector),
+            "bbox": list(r.bbox) if r.bbox is not None else None,
+            "landmarks": list(r.landmarks) if r.landmarks is not None else None,
+            "confidence": r.confidence,
+            "quality_score": r.quality_score,
+        }
+        for r in rows
+    ]
+
+
+def _record_image_hash(db, image_id, celebration_id, hashed) -> None:
+    """Mirrors near_duplicates.record_image_hash: store the hash, joining the
+    burst of the nearest sibling within NEAR_DUPLICATE_DISTANCE bits. Runs in
+    a savepoint so a failure never costs the image its faces."""
+    import os
+    import logging
+    from sqlalchemy import text
+
+    if hashed is None:
+        return
+    try:
+        with db.begin_nested():
+            h = hashed["dhash"]
+            match = _find_near_duplicate(
+                db, celebration_id, h, int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "6"))
+            )
+            db.execute(
+                text(
+                    "INSERT INTO image_hashes "
+                    "(image_id, celebration_id, dhash, bands, width, height, burst_id, created_at) "
+                    "VALUES (:id, CAST(:cid AS UUID), :dhash, CAST(:bands AS INTEGER[]), :w, :h, :burst, "
+                    "NOW() AT TIME ZONE 'UTC') "
+                    "ON CONFLICT (image_id) DO UPDATE SET dhash = EXCLUDED.dhash, bands = EXCLUDED.bands, "
+                    "width = EXCLUDED.width, height = EXCLUDED.height, burst_id = EXCLUDED.burst_id"
+                ),
+                {
+                    "id": image_id,
+                    "cid": str(celebration_id),
+                    # BIGINT is signed; store the same 64 bits.
+                    "dhash": h - (1 << 64) if h >= 1 << 63 else h,
+                    "bands": _hash_bands(h),
+                    "w": hashed["width"],
+                    "h": hashed["height"],
+                    "burst": match[0].burst_id if match else image_id,
+                },
+            )
+    except Exception:
+        logging.getLogger(__name__).warning(f"Could not record perceptual hash for {image_id}", exc_info=True)
+
+
+# Shared Drive download throttle. Mirrors services/gdrive.DriveThrottle —
+# keep the Lua in sync so Modal containers and RQ workers draw from the same
+# token bucket and AIMD concurrency limit.
+_GDRIVE_PREFIX = "gdrive:throttle:"
+_GDRIVE_ACQUIRE = """
+local p, now = ARGV[1], tonumber(ARGV[2])
+local cool = tonumber(redis.call('GET', p .. 'cooldown') or '0')
+if cool > now then return cool - now end
+redis.call('ZREMRANGEBYSCORE', p .. 'inflight', '-inf', now)
+local limit = tonumber(redis.call('GET', p .. 'limit') or ARGV[6])
+if redis.call('ZCARD', p .. 'inflight') >= math.floor(limit) then return 100 end
+local rate, burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+local b = redis.call('HMGET', p .. 'bucket', 'tokens', 'ts')
+local tokens = tonumber(b[1] or burst)
+local ts = tonumber(b[2] or now)
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+if tokens < 1 then
+  redis.call('HSET', p .. 'bucket', 'tokens', tokens, 'ts', now)
+  return math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', p .. 'bucket', 'tokens', tokens - 1, 'ts', now)
+redis.call('PEXPIRE', p .. 'bucket', 60000)
+redis.call('ZADD', p .. 'inflight', now + tonumber(ARGV[7]), ARGV[3])
+redis.call('PEXPIRE', p .. 'inflight', ARGV[7])
+return 0
+"""
+_GDRIVE_RELEASE = """
+local p, token, outcome = ARGV[1], ARGV[2], ARGV[3]
+local init, lo, hi = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local now, cool_ms = tonumber(ARGV[7]), tonumber(ARGV[8])
+redis.call('ZREM', p .. 'inflight', token)
+local limit = tonumber(redis.call('GET', p .. 'limit') or init)
+if outcome ~= '0' and outcome ~= '1' then return tostring(limit) end
+if outcome == '1' then
+  limit = math.max(lo, limit / 2)
+  local until_ms = now + cool_ms
+  local cool = tonumber(redis.call('GET', p .. 'cooldown') or '0')
+  if until_ms > cool then redis.call('SET', p .. 'cooldown', until_ms, 'PX', cool_ms) end
+else
+  limit = math.min(hi, limit + 1 / limit)
+end
+redis.call('SET', p .. 'limit', limit, 'EX', 3600)
+return tostring(limit)
+"""
+
+_drive_http = None
+
+
+def _download_drive(url: str, open_sink, attempts: int = 5):
+    """Stream a Drive file into ``open_sink()`` over a pooled connection, paced
+    by the shared throttle. Mirrors services/gdrive.stream_drive_file: a fresh
+    sink per attempt, aborted when the attempt fails."""
+    global _drive_http
+    import os
+    import time
+    import uuid
+    import random
+    import logging
+    import urllib3
+
+    logger = logging.getLogger(__name__)
+    if _drive_http is None:
+        _drive_http = urllib3.PoolManager(maxsize=4, retries=False)
+    env = os.environ.get
+    rate = float(env("GDRIVE_RATE_PER_SEC", "10"))
+    burst = int(env("GDRIVE_BURST", "20"))
+    init_limit = int(env("GDRIVE_CONCURRENCY_INIT", "8"))
+    min_limit = int(env("GDRIVE_CONCURRENCY_MIN", "2"))
+    max_limit = int(env("GDRIVE_CONCURRENCY_MAX", "32"))
+    cooldown = float(env("GDRIVE_THROTTLE_COOLDOWN", "5"))
+    try:
+        conn = get_redis_client()
+    except Exception:
+        conn = None
+
+    def _acquire():
+        token = uuid.uuid4().hex
+        while conn is not None:
+            try:
+                wait_ms = conn.eval(
+                    _GDRIVE_ACQUIRE, 0, _GDRIVE_PREFIX, int(time.time() * 1000), token,
+                    rate, burst, init_limit, 300000,
+                )
+            except Exception:
+                logger.warning("Drive throttle unavailable; downloading unthrottled")
+                return None
+            if not wait_ms:
+                return token
+            time.sleep(min(int(wait_ms), 5000) / 1000 * random.uniform(1.0, 1.25))
+        return None
+
+    def _release(token, throttled, retry_after=None):
+        if token is None:
+            return
+        try:
+            conn.eval(
+                _GDRIVE_RELEASE, 0, _GDRIVE_PREFIX, token,
+                "-" if throttled is None else "1" if throttled else "0",
+                init_limit, min_limit, max_limit, int(time.time() * 1000),
+                int(max(cooldown, retry_after or 0.0) * 1000),
+            )
+        except Exception:
+            logger.warning("Drive throttle release failed")
+
+    last_err = "empty_download"
+    for attempt in range(attempts):
+        token = _acquire()
+        throttled = False
+        retry_after = None
+        sink = None
+        try:
+            resp = _drive_http.request(
+                "GET", url, timeout=urllib3.Timeout(connect=10, read=120),
+                preload_content=False,
+            )
+            try:
+                if resp.status >= 400:
+                    body = resp.read()
+                    if not (resp.status == 429 or resp.status >= 500 or (
+                        resp.status == 403 and b"ateLimitExceeded" in body
+                    )):
+                        raise RuntimeError(f"Drive download failed (HTTP {resp.status})")
+                    throttled = True
+                    try:
+                        retry_after = float(resp.headers.get("Retry-After"))
+                    except (TypeError, ValueError):
+                        pass
+                    last_err = f"HTTP {resp.status}"
+                else:
+                    sink = open_sink()
+                    received = 0
+                    for chunk in resp.stream(1024 * 1024):
+                        sink.write(chunk)
+                        received += len(chunk)
+                    if received:
+                        return sink
+                    last_err = "empty_download"
+            finally:
+                resp.release_conn()
+        except urllib3.exceptions.HTTPError as e:
+            throttled = True
+            last_err = str(e)
+        except Exception:
+            throttled = None
+            if sink is not None:
+                sink.abort()
+            raise
+        finally:
+            _release(token, throttled, retry_after)
+        if sink is not None:
+            sink.abort()
+        logger.warning(f"Drive download attempt {attempt + 1} failed: {last_err}")
+    raise RuntimeError(last_err)
+
+
+class _S3Stream:
+    """Multipart upload fed as bytes arrive. Mirrors services.S3StreamUpload."""
+
+    def __init__(self, s3, bucket: str, key: str, content_type: str, pool,
+                 part_size: int = 8 * 1024 * 1024, max_pending: int = 2):
+        self.s3, self.bucket, self.key = s3, bucket, key
+        self.content_type = content_type
+        self.pool = pool
+        self.part_size = part_size
+        self.max_pending = max_pending
+        self.buf = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data: bytes) -> None:
+        self.buf += data
+        while len(self.buf) >= self.part_size:
+            body = bytes(self.buf[:self.part_size])
+            del self.buf[:self.part_size]
+            if self.upload_id is None:
+                self.upload_id = self.s3.create_multipart_upload(
+                    Bucket=self.bucket, Key=self.key,
+                    ContentType=self.content_type, ACL="public-read",
+                )["UploadId"]
+            pending = [f for f in self.parts if not f.done()]
+            if len(pending) >= self.max_pending:
+                pending[0].result()
+            self.parts.append(self.pool.submit(self._part, len(self.parts) + 1, body))
+
+    def _part(self, number: int, body: bytes) -> dict:
+        resp = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=body,
+        )
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+    def finish(self) -> None:
+        if self.upload_id is None:
+            self.s3.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self.buf),
+                ContentType=self.content_type, ACL="public-read",
+            )
+        else:
+            parts = [f.result() for f in self.parts]
+            if self.buf:
+                parts.append(self._part(len(parts) + 1, bytes(self.buf)))
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        self.buf = bytearray()
+
+    def abort(self) -> None:
+        self.buf = bytearray()
+        if self.upload_id is None:
+            return
+        for f in self.parts:
+            f.cancel()
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception:
+            pass
+        self.upload_id = None
+
+
 @app.function(
     memory=2048,
     cpu=2.0,
@@ -152,6 +1193,7 @@ def process_image(
     photographer: str,
     filename: str,
     celebration_id: str,
+    slot: dict | None = None,
 ) -> dict:
     """
     Process a single image: upload to S3, detect faces, store in DB.
@@ -162,8 +1204,6 @@ def process_image(
     import json
     import hashlib
     import logging
-    import cv2
-    import numpy as np
     from insightface.app import FaceAnalysis
 
     logging.basicConfig(level=logging.INFO)
@@ -175,9 +1215,9 @@ def process_image(
     bucket = os.environ.get("AWS_S3_BUCKET")
 
     # Import models (need to define inline for Modal)
-    from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, ARRAY
+    from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ARRAY
     from sqlalchemy.dialects.postgresql import UUID as PGUUID
-    from sqlalchemy.orm import declarative_base, relationship
+    from sqlalchemy.orm import declarative_base
     import uuid as uuid_lib
     from datetime import datetime
 
@@ -267,60 +1307,29 @@ def process_image(
             db.commit()
             return {"status": "failed", "reason": "decode_error"}
 
-        # Initialize face model
-        face_app = FaceAnalysis(name=INSIGHTFACE_MODEL)
-        face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
+        hashed = _image_hash(image_bgr)
+        reused = _reusable_faces(db, img.celebration_id, hashed)
+        if reused is None:
+            # Initialize face model
+            face_app = FaceAnalysis(name=INSIGHTFACE_MODEL)
+            face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
 
-        # Detect faces
-        faces = face_app.get(image_bgr)
-        face_data = []
-        out_index = 0
-
-        for f in faces:
-            if f.embedding is None or len(f.embedding) != 512:
-                continue
-
-            x1, y1, x2, y2 = f.bbox.astype(int)
-            face_w = max(x2 - x1, 0)
-            face_h = max(y2 - y1, 0)
-            if min(face_w, face_h) < MIN_FACE_PIXELS:
-                continue
-
-            crop = image_bgr[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
-            quality = 0.0
-            if crop.size > 0:
-                gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-                sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-                sharp = min(sharpness / 1000, 1.0)
-                area = max((y2 - y1) * (x2 - x1), 1)
-                size = min(area / 10000, 1.0)
-                conf = float(min(f.det_score, 1.0))
-                quality = float(sharp * 0.4 + size * 0.3 + conf * 0.3)
-
-            embedding = f.embedding.tolist()
-            face_record = FaceVector(
+            # Detect faces
+            face_data = _detected_faces(image_bgr, face_app.get(image_bgr))
+        else:
+            face_data = reused
+
+        for fd in face_data:
+            db.add(FaceVector(
                 image_id=img.id,
                 celebration_id=img.celebration_id,
-                face_index=out_index,
-                vector=embedding,
-                vector_pg=embedding,
-                bbox=f.bbox.tolist(),
-                landmarks=f.kps.flatten().tolist(),
-                confidence=float(f.det_score),
-                quality_score=quality,
+                vector_pg=fd["vector"],
                 embedding_model=EMBEDDING_MODEL_VERSION,
-            )
-            db.add(face_record)
-
-            face_data.append({
-                "face_index": out_index,
-                "vector": f.embedding.tolist(),
-                "bbox": f.bbox.tolist(),
-                "landmarks": f.kps.flatten().tolist(),
-                "confidence": float(f.det_score),
-                "quality_score": quality,
-            })
-            out_index += 1
+                **{k: fd[k] for k in _FACE_COLUMNS},
+            ))
+
+        _ingest_quality(db, image_bgr, face_data, img.id, img.celebration_id)
+        _record_image_hash(db, img.id, img.celebration_id, hashed)
 
         img.faces_count = len(face_data)
         img.processed = "completed"
@@ -344,10 +1353,11 @@ def process_image(
         return {"status": "failed", "reason": str(e)}
     finally:
         db.close()
+        _release_slot(slot)
 
 
 @app.function(
-    memory=3072,
+    memory=2048,
     cpu=2.0,
     timeout=600,
     secrets=secrets,
@@ -361,6 +1371,10 @@ def import_drive_image(
     celebrant: str,
     photographer: str,
     celebration_id: str,
+    md5_checksum: str | None = None,
+    size: int | None = None,
+    source_folder: str | None = None,
+    slot: dict | None = None,
 ) -> dict:
     """
     Import one image straight from Google Drive — no round-trip through the app
@@ -370,13 +1384,11 @@ def import_drive_image(
     """
     import os
     import io
-    import time
     import uuid
     import json
     import hashlib
     import logging
     import urllib.parse
-    import urllib.request
     import cv2
     import numpy as np
     from PIL import Image, ImageOps
@@ -390,8 +1402,8 @@ def import_drive_image(
     redis_client = get_redis_client()
     bucket = os.environ.get("AWS_S3_BUCKET")
 
-    from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ARRAY
-    from sqlalchemy.dialects.postgresql import UUID as PGUUID
+    from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, Boolean, ARRAY
+    from sqlalchemy.dialects.postgresql import UUID as PGUUID, insert as pg_insert
     from sqlalchemy.orm import declarative_base
     import uuid as uuid_lib
     from datetime import datetime
@@ -411,6 +1423,7 @@ def import_drive_image(
         processed = Column(String, default="pending")
         quality_analyzed = Column(Boolean, default=False)
         order_number = Column(Integer)
+        source_folder = Column(String)
 
     from pgvector.sqlalchemy import Vector
 
@@ -429,15 +1442,90 @@ def import_drive_image(
         embedding_model = Column(String(40))
         created_date = Column(DateTime, default=datetime.utcnow)
 
+    class DriveFile(Base):
+        __tablename__ = "drive_files"
+        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+        celebration_id = Column(PGUUID(as_uuid=True), nullable=False)
+        drive_file_id = Column(String(128), nullable=False)
+        md5_checksum = Column(String(32))
+        size = Column(BigInteger)
+        image_id = Column(PGUUID(as_uuid=True), nullable=False)
+        created_by_import = Column(Boolean, nullable=False, default=False)
+        imported_at = Column(DateTime, default=datetime.utcnow)
+
+    def _record_drive_file(image_id, created: bool):
+        # Mirrors jobs/gdrive_import.record_drive_file: lets the next import
+        # skip this file from the listing alone, and retires the image a
+        # changed file used to map to — only one it created, in this
+        # celebration. Returns that image's S3 keys.
+        previous = db.query(DriveFile.image_id, DriveFile.created_by_import).filter(
+            DriveFile.celebration_id == uuid_lib.UUID(celebration_id),
+            DriveFile.drive_file_id == file_id,
+        ).first()
+        stmt = pg_insert(DriveFile).values(
+            id=uuid_lib.uuid4(),
+            celebration_id=uuid_lib.UUID(celebration_id),
+            drive_file_id=file_id,
+            md5_checksum=md5_checksum,
+            size=size,
+            image_id=image_id,
+            created_by_import=created,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            constraint="uq_drive_files_celebration_file",
+            set_={
+                "md5_checksum": stmt.excluded.md5_checksum,
+                "size": stmt.excluded.size,
+                "image_id": stmt.excluded.image_id,
+                "created_by_import": stmt.excluded.created_by_import,
+            },
+        ))
+        if previous is None or previous.image_id == image_id or not previous.created_by_import:
+            return []
+        previous = previous.image_id
+        if db.query(DriveFile.id).filter(DriveFile.image_id == previous).first():
+            return []
+        old = db.get(WeddingImage, previous)
+        if old is None or old.celebration_id != uuid_lib.UUID(celebration_id):
+            return []
+        urls = {u for u in (old.file_path, old.compressed_file_path) if u}
+        db.query(FaceVector).filter(FaceVector.image_id == previous).delete(synchronize_session=False)
+        db.delete(old)
+        logger.info(f"Retired superseded image {old.filename}")
+        base = os.environ.get("PUBLIC_S3_BASE_URL", "")
+        return sorted(
+            u[len(base) + 1:] if base and u.startswith(f"{base}/") else urllib.parse.urlparse(u).path.lstrip("/")
+            for u in urls
+        )
+
+    def _delete_keys(keys):
+        for key in keys:
+            try:
+                s3.delete_object(Bucket=bucket, Key=key)
+            except Exception:
+                pass
+
     def _progress(failed: bool = False):
+        # Mirrors jobs/gdrive_import._progress_incr
+        done_key = f"gdrive_import:{celebration_id}:done"
+        failed_key = f"gdrive_import:{celebration_id}:failed"
         try:
-            redis_client.incr(f"gdrive_import:{celebration_id}:done")
-            redis_client.expire(f"gdrive_import:{celebration_id}:done", 86400)
+            pipe = redis_client.pipeline()
+            pipe.incr(done_key)
+            pipe.expire(done_key, 86400)
             if failed:
-                redis_client.incr(f"gdrive_import:{celebration_id}:failed")
-                redis_client.expire(f"gdrive_import:{celebration_id}:failed", 86400)
+                pipe.incr(failed_key)
+                pipe.expire(failed_key, 86400)
+            pipe.mget(f"gdrive_import:{celebration_id}:total", done_key, failed_key)
+            total, done, failed_n = pipe.execute()[-1]
         except Exception:
-            pass
+            return
+        _publish(f"gdrive_import:{celebration_id}", {
+            "type": "import",
+            "total": int(total or 0),
+            "done": int(done or 0),
+            "failed": int(failed_n or 0),
+        })
 
     def _s3_url(key: str) -> str:
         s3_endpoint = os.environ.get("S3_ENDPOINT", "")
@@ -447,129 +1535,148 @@ def import_drive_image(
             return f"https://{bucket}.{host}/{key}"
         return f"https://{bucket}.s3.amazonaws.com/{key}"
 
+    renditions = []  # (upload future, key) pairs to delete if the row never lands
     try:
-        # ── Download original from Drive (auto-retry) ──────
-        # Drive throttles bursts of parallel downloads (429/5xx) and
-        # connections time out. Retry transient failures with exponential
-        # backoff so images heal themselves instead of being marked failed.
+        # ── Stream the original Drive → S3, hashing on the way ──
+        # Paced by the throttle shared with every other worker. The original
+        # goes up part by part as it downloads and is spooled (to disk past
+        # 4MB) for compression, so it is never held whole in memory.
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+
         params = urllib.parse.urlencode({"alt": "media", "key": api_key})
         url = f"https://www.googleapis.com/drive/v3/files/{file_id}?{params}"
-        raw = b""
-        last_err = "empty_download"
-        for attempt in range(5):
-            try:
-                with urllib.request.urlopen(url, timeout=120) as resp:
-                    raw = resp.read()
-                if raw:
-                    break
-                last_err = "empty_download"
-            except Exception as e:  # noqa: BLE001 — retry any transient error
-                last_err = str(e)
-                logger.warning(f"Drive download attempt {attempt + 1} failed for {filename}: {last_err}")
-            if attempt < 4:
-                time.sleep(min(2 ** (attempt + 1), 20))  # 2,4,8,16s
-
-        if not raw:
+        orig_key = f"{photographer}/{celebrant}/{uuid.uuid4()}_{filename}"
+        upload_pool = ThreadPoolExecutor(max_workers=4)
+
+        class _Sink:
+            def __init__(self):
+                self.hash = hashlib.sha256()
+                self.spool = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+                self.upload = _S3Stream(s3, bucket, orig_key, mime_type or "image/jpeg", upload_pool)
+
+            def write(self, data: bytes) -> None:
+                self.hash.update(data)
+                self.spool.write(data)
+                self.upload.write(data)
+
+            def abort(self) -> None:
+                self.upload.abort()
+                self.spool.close()
+
+        try:
+            sink = _download_drive(url, _Sink)
+        except Exception as e:  # noqa: BLE001
+            upload_pool.shutdown(wait=False)
             _progress(failed=True)
-            return {"status": "failed", "reason": f"download_failed: {last_err}"}
+            return {"status": "failed", "reason": f"download_failed: {e}"}
 
-        file_hash = hashlib.sha256(raw).hexdigest()
+        file_hash = sink.hash.hexdigest()
         existing = db.query(WeddingImage).filter(WeddingImage.file_hash == file_hash).first()
         if existing:
             logger.info(f"Skipped duplicate {filename}")
+            sink.abort()
+            upload_pool.shutdown(wait=False)
+            retired = _record_drive_file(existing.id, created=False)
+            db.commit()
+            _delete_keys(retired)
             _progress()
             return {"status": "skipped", "reason": "duplicate"}
 
         # ── Compress (bakes EXIF orientation) ──────────────
-        pil = Image.open(io.BytesIO(raw))
-        pil = ImageOps.exif_transpose(pil)
-        if pil.mode != "RGB":
-            pil = pil.convert("RGB")
-        pil.thumbnail((2048, 2048), Image.LANCZOS)
-        cbuf = io.BytesIO()
-        pil.save(cbuf, format="JPEG", quality=72, optimize=True)
-        compressed = cbuf.getvalue()
+        # JPEGs decode straight at a reduced DCT scale that still covers 2048px.
+        try:
+            sink.spool.seek(0)
+            pil = Image.open(sink.spool)
+            w, h = pil.size
+            scale = 2048 / max(w, h)
+            if scale < 1:
+                pil.draft("RGB", (int(w * scale) + 1, int(h * scale) + 1))
+            pil = ImageOps.exif_transpose(pil)
+            if pil.mode != "RGB":
+                pil = pil.convert("RGB")
+            pil.thumbnail((2048, 2048), Image.LANCZOS)
+            cbuf = io.BytesIO()
+            pil.save(cbuf, format="JPEG", quality=72, optimize=True)
+            compressed = cbuf.getvalue()
+            sink.spool.close()
+        except Exception:
+            sink.abort()
+            upload_pool.shutdown(wait=False)
+            raise
 
         out_name = filename.rsplit(".", 1)[0] + ".jpg"
 
-        # ── Upload both copies to S3 ───────────────────────
-        orig_key = f"{photographer}/{celebrant}/{uuid.uuid4()}_{filename}"
-        s3.put_object(
-            Bucket=bucket, Key=orig_key, Body=raw,
-            ContentType=mime_type or "image/jpeg", ACL="public-read",
-        )
-        comp_key = f"{photographer}/{celebrant}/{uuid.uuid4()}_{out_name}"
-        s3.put_object(
-            Bucket=bucket, Key=comp_key, Body=compressed,
-            ContentType="image/jpeg", ACL="public-read",
-        )
+        # ── Finish the original and upload the copy, concurrently with
+        # detection; the DB row is written once both URLs exist ──
+        def _finish_original() -> str:
+            try:
+                sink.upload.finish()
+            except Exception:
+                sink.upload.abort()
+                raise
+            return _s3_url(orig_key)
+
+        def _upload(key: str, body: bytes, content_type: str) -> str:
+            s3.put_object(
+                Bucket=bucket, Key=key, Body=body,
+                ContentType=content_type, ACL="public-read",
+            )
+            return _s3_url(key)
 
-        img = WeddingImage(
-            filename=out_name,
-            file_path=_s3_url(orig_key),
-            compressed_file_path=_s3_url(comp_key),
-            file_hash=file_hash,
-            processed="processing",
-            celebration_id=uuid.UUID(celebration_id),
-        )
-        db.add(img)
-        db.commit()
-        db.refresh(img)
+        comp_key = f"{photographer}/{celebrant}/{uuid.uuid4()}_{out_name}"
+        orig_upload = upload_pool.submit(_finish_original)
+        comp_upload = upload_pool.submit(_upload, comp_key, compressed, "image/jpeg")
+        upload_pool.shutdown(wait=False)
+        renditions = [(orig_upload, orig_key), (comp_upload, comp_key)]
 
         # ── Detect faces on the compressed image ───────────
         image_bgr = cv2.cvtColor(np.array(pil), cv2.COLOR_RGB2BGR)
 
-        face_app = FaceAnalysis(name=INSIGHTFACE_MODEL)
-        face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
-        faces = face_app.get(image_bgr)
-
-        face_data = []
-        out_index = 0
-        for f in faces:
-            if f.embedding is None or len(f.embedding) != 512:
-                continue
-
-            x1, y1, x2, y2 = f.bbox.astype(int)
-            face_w = max(x2 - x1, 0)
-            face_h = max(y2 - y1, 0)
-            if min(face_w, face_h) < MIN_FACE_PIXELS:
-                continue
-
-            crop = image_bgr[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
-            quality = 0.0
-            if crop.size > 0:
-                gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-                sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-                sharp = min(sharpness / 1000, 1.0)
-                area = max((y2 - y1) * (x2 - x1), 1)
-                size = min(area / 10000, 1.0)
-                conf = float(min(f.det_score, 1.0))
-                quality = float(sharp * 0.4 + size * 0.3 + conf * 0.3)
-
-            embedding = f.embedding.tolist()
-            db.add(FaceVector(
-                image_id=img.id,
-                celebration_id=img.celebration_id,
-                face_index=out_index,
-                vector=embedding,
-                vector_pg=embedding,
-                bbox=f.bbox.tolist(),
-                landmarks=f.kps.flatten().tolist(),
-                confidence=float(f.det_score),
-                quality_score=quality,
+        img_id = uuid.uuid4()
+        celeb_uuid = uuid.UUID(celebration_id)
+        hashed = _image_hash(image_bgr)
+        detected = _reusable_faces(db, celeb_uuid, hashed)
+        if detected is None:
+            face_app = FaceAnalysis(name=INSIGHTFACE_MODEL)
+            face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
+            detected = _detected_faces(image_bgr, face_app.get(image_bgr))
+
+        face_rows = [
+            FaceVector(
+                image_id=img_id,
+                celebration_id=celeb_uuid,
+                vector_pg=fd["vector"],
                 embedding_model=EMBEDDING_MODEL_VERSION,
-            ))
-            face_data.append({
-                "face_index": out_index,
-                "bbox": f.bbox.tolist(),
-                "confidence": float(f.det_score),
-                "quality_score": quality,
-            })
-            out_index += 1
+                **{k: fd[k] for k in _FACE_COLUMNS},
+            )
+            for fd in detected
+        ]
+        face_data = [
+            {k: fd[k] for k in ("face_index", "bbox", "confidence", "quality_score")}
+            for fd in detected
+        ]
 
-        img.faces_count = len(face_data)
-        img.processed = "completed"
+        img = WeddingImage(
+            id=img_id,
+            filename=out_name,
+            file_path=orig_upload.result(),
+            compressed_file_path=comp_upload.result(),
+            file_hash=file_hash,
+            faces_count=len(face_data),
+            processed="completed",
+            celebration_id=celeb_uuid,
+            source_folder=source_folder or None,
+        )
+        db.add(img)
+        db.flush()
+        db.add_all(face_rows)
+        retired = _record_drive_file(img_id, created=True)
+        _ingest_quality(db, image_bgr, detected, img_id, celeb_uuid)
+        _record_image_hash(db, img_id, celeb_uuid, hashed)
         db.commit()
+        renditions = []
+        _delete_keys(retired)
 
         redis_client.setex(f"image_faces:{img.id}", 3600, json.dumps(face_data, default=str))
         logger.info(f"Imported {out_name} ({len(face_data)} faces)")
@@ -580,10 +1687,19 @@ def import_drive_image(
     except Exception as e:
         logger.exception(f"Drive import failed for {filename}: {e}")
         db.rollback()
+        # The row never landed: don't leave whichever rendition did upload
+        # orphaned in S3. Mirrors jobs/gdrive_import._discard_uploads.
+        for fut, key in renditions:
+            try:
+                fut.result()
+                s3.delete_object(Bucket=bucket, Key=key)
+            except Exception:
+                pass
         _progress(failed=True)
         return {"status": "failed", "reason": str(e)}
     finally:
         db.close()
+        _release_slot(slot)
 
 
 @app.function(
@@ -601,8 +1717,6 @@ def analyze_single_image(
     """Analyze a single image for quality issues. Called in parallel."""
     import os
     import logging
-    import cv2
-    import numpy as np
 
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
@@ -610,32 +1724,22 @@ def analyze_single_image(
     s3 = get_s3_client()
     bucket = os.environ.get("AWS_S3_BUCKET")
 
-    # Quality detection functions
-    def detect_blur(image, thresh=100.0):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        var = cv2.Laplacian(gray, cv2.CV_64F).var()
+    # Quality detection functions, over the record from _quality_features
+    def detect_blur(feats, thresh=100.0):
+        var = feats["laplacian_var"]
         is_blurry = var < thresh
         conf = 1.0 - min(var / thresh, 1.0) if is_blurry else 0.0
         return is_blurry, conf
 
-    def detect_motion_blur(image, thresh=0.7):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        f = np.fft.fft2(gray)
-        fshift = np.fft.fftshift(f)
-        mag = np.abs(fshift)
-        h, w = mag.shape
-        ch, cw = h // 2, w // 2
-        hband = mag[ch-5:ch+5, :].sum()
-        vband = mag[:, cw-5:cw+5].sum()
-        ratio = max(hband, vband) / (min(hband, vband) + 1e-10)
+    def detect_motion_blur(feats, thresh=0.7):
+        ratio = feats["motion_ratio"]
         has_blur = ratio > (1 / thresh) if thresh > 0 else False
         conf = min(ratio / 3.0, 1.0) if has_blur else 0.0
         return has_blur, conf
 
-    def detect_underexposed(image, bright_thresh=50.0, dark_ratio_thresh=0.5):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mean_bright = gray.mean()
-        dark_ratio = np.sum(gray < 30) / gray.size
+    def detect_underexposed(feats, bright_thresh=50.0, dark_ratio_thresh=0.5):
+        mean_bright = feats["brightness"]
+        dark_ratio = feats["dark_ratio"]
         is_under = mean_bright < bright_thresh or dark_ratio > dark_ratio_thresh
         if is_under:
             conf = max(1.0 - min(mean_bright / bright_thresh, 1.0),
@@ -644,10 +1748,9 @@ def analyze_single_image(
             conf = 0.0
         return is_under, conf
 
-    def detect_overexposed(image, bright_thresh=205.0, clip_thresh=0.1):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mean_bright = gray.mean()
-        clip_ratio = np.sum(gray > 250) / gray.size
+    def detect_overexposed(feats, bright_thresh=205.0, clip_thresh=0.1):
+        mean_bright = feats["brightness"]
+        clip_ratio = feats["clipped_ratio"]
         is_over = mean_bright > bright_thresh or clip_ratio > clip_thresh
         if is_over:
             bf = min((mean_bright - bright_thresh) / (255 - bright_thresh), 1.0) if mean_bright > bright_thresh else 0
@@ -662,27 +1765,27 @@ def analyze_single_image(
         resp = s3.get_object(Bucket=bucket, Key=key)
         img_bytes = resp["Body"].read()
 
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        image_bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        gray = _decode_gray(img_bytes)
 
-        if image_bgr is None:
+        if gray is None:
             return {"image_id": image_id, "issues": [], "error": "decode_failed"}
 
         issues = []
+        feats = _quality_features(gray)
 
-        is_blurry, blur_conf = detect_blur(image_bgr)
+        is_blurry, blur_conf = detect_blur(feats)
         if is_blurry and blur_conf >= threshold:
             issues.append(("blur", blur_conf))
 
-        has_motion, motion_conf = detect_motion_blur(image_bgr)
+        has_motion, motion_conf = detect_motion_blur(feats)
         if has_motion and motion_conf >= threshold:
             issues.append(("motion_blur", motion_conf))
 
-        is_under, under_conf = detect_underexposed(image_bgr)
+        is_under, under_conf = detect_underexposed(feats)
         if is_under and under_conf >= threshold:
             issues.append(("underexposed", under_conf))
 
-        is_over, over_conf = detect_overexposed(image_bgr)
+        is_over, over_conf = detect_overexposed(feats)
         if is_over and over_conf >= threshold:
             issues.append(("overexposed", over_conf))
 
@@ -695,7 +1798,7 @@ def analyze_single_image(
 
 @app.function(
     memory=512,
-    cpu=0.5,
+    cpu=2.0,
     timeout=900,
     secrets=secrets,
     retries=1,
@@ -704,12 +1807,18 @@ def analyze_quality(
     celebration_id: str,
     threshold: float = 0.70,
     reanalyze: bool = False,
+    slot: dict | None = None,
 ) -> dict:
     """
     Analyze all images in a celebration for quality issues.
-    Uses parallel processing - each image analyzed in separate container.
+
+    Coordinator (mirrors services/quality_analyzer.analyze_celebration):
+    calibrates, re-flags images with stored metrics, then splits the rest
+    into chunks of QUALITY_CHUNK_SIZE images and spawns one
+    analyze_quality_chunk container per chunk.
     """
     import os
+    import json
     import uuid
     import logging
     from datetime import datetime
@@ -720,19 +1829,13 @@ def analyze_quality(
     db = get_db_session()
 
     # Import models inline
-    from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, ARRAY
+    from sqlalchemy import Column, String, Boolean
     from sqlalchemy.dialects.postgresql import UUID as PGUUID
     from sqlalchemy.orm import declarative_base
     import uuid as uuid_lib
 
     Base = declarative_base()
 
-    class Celebration(Base):
-        __tablename__ = "celebrations"
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
-        celebrant = Column(String, nullable=False)
-        photographer = Column(String, nullable=False)
-
     class WeddingImage(Base):
         __tablename__ = "wedding_images"
         id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
@@ -742,111 +1845,17 @@ def analyze_quality(
         compressed_file_path = Column(String)
         quality_analyzed = Column(Boolean, default=False)
 
-    class FaceVector(Base):
-        __tablename__ = "face_vectors"
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
-        image_id = Column(PGUUID(as_uuid=True), nullable=False)
-        landmarks = Column(ARRAY(Float))
-        bbox = Column(ARRAY(Float))
-
-    class QualityAnalysisJob(Base):
-        __tablename__ = "quality_analysis_jobs"
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
-        celebration_id = Column(PGUUID(as_uuid=True), nullable=False)
-        total_images = Column(Integer, default=0)
-        processed_count = Column(Integer, default=0)
-        flagged_count = Column(Integer, default=0)
-        status = Column(String, default="pending")
-        threshold = Column(Float, default=0.70)
-        started_at = Column(DateTime, default=datetime.utcnow)
-        completed_at = Column(DateTime)
-        error_message = Column(String)
-
-    class ImageQualityFlag(Base):
-        __tablename__ = "image_quality_flags"
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
-        image_id = Column(PGUUID(as_uuid=True), nullable=False)
-        issue_type = Column(String, nullable=False)
-        confidence = Column(Float, nullable=False)
-        reviewed = Column(Boolean, default=False)
-        dismissed = Column(Boolean, default=False)
-        created_at = Column(DateTime, default=datetime.utcnow)
-
-    # Quality detection functions (inline)
-    def detect_blur(image, thresh=100.0):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        is_blurry = var < thresh
-        conf = 1.0 - min(var / thresh, 1.0) if is_blurry else 0.0
-        return is_blurry, conf
-
-    def detect_motion_blur(image, thresh=0.7):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        f = np.fft.fft2(gray)
-        fshift = np.fft.fftshift(f)
-        mag = np.abs(fshift)
-        h, w = mag.shape
-        ch, cw = h // 2, w // 2
-        hband = mag[ch-5:ch+5, :].sum()
-        vband = mag[:, cw-5:cw+5].sum()
-        ratio = max(hband, vband) / (min(hband, vband) + 1e-10)
-        has_blur = ratio > (1 / thresh) if thresh > 0 else False
-        conf = min(ratio / 3.0, 1.0) if has_blur else 0.0
-        return has_blur, conf
-
-    def detect_underexposed(image, bright_thresh=50.0, dark_ratio_thresh=0.5):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mean_bright = gray.mean()
-        dark_ratio = np.sum(gray < 30) / gray.size
-        is_under = mean_bright < bright_thresh or dark_ratio > dark_ratio_thresh
-        if is_under:
-            conf = max(1.0 - min(mean_bright / bright_thresh, 1.0),
-                      min(dark_ratio / dark_ratio_thresh, 1.0) if dark_ratio_thresh > 0 else 0)
-        else:
-            conf = 0.0
-        return is_under, conf
-
-    def detect_overexposed(image, bright_thresh=205.0, clip_thresh=0.1):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mean_bright = gray.mean()
-        clip_ratio = np.sum(gray > 250) / gray.size
-        is_over = mean_bright > bright_thresh or clip_ratio > clip_thresh
-        if is_over:
-            bf = min((mean_bright - bright_thresh) / (255 - bright_thresh), 1.0) if mean_bright > bright_thresh else 0
-            rf = min(clip_ratio / clip_thresh, 1.0) if clip_thresh > 0 else 0
-            conf = max(bf, rf)
-        else:
-            conf = 0.0
-        return is_over, conf
+    ImageQualityMetrics, ImageQualityFlag = _quality_models()
+    QualityAnalysisJob, QualityAnalysisChunk = _quality_job_models()
 
     # Initialize S3 client and imports
-    import cv2
-    import numpy as np
-    import random
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import text
 
     s3 = get_s3_client()
     bucket = os.environ.get("AWS_S3_BUCKET")
     S3_WORKERS = 8
 
-    def _decode(image_bytes: bytes):
-        try:
-            import io
-            from PIL import Image, ImageOps
-            try:
-                from pillow_heif import register_heif_opener
-                register_heif_opener()
-            except Exception:
-                pass
-            img = Image.open(io.BytesIO(image_bytes))
-            img = ImageOps.exif_transpose(img)
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        except Exception:
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
     def _calibrate(sample_paths):
         """Sample-driven percentile thresholds; falls back to defaults on tiny events."""
         if len(sample_paths) < 5:
@@ -857,11 +1866,10 @@ def analyze_quality(
             try:
                 k = extract_s3_key(fp)
                 data = s3.get_object(Bucket=bucket, Key=k)["Body"].read()
-                im = _decode(data)
-                if im is None:
+                g = _decode_gray(data)
+                if g is None:
                     return None
-                g = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-                return float(cv2.Laplacian(g, cv2.CV_64F).var()), float(g.mean())
+                return _laplacian_var(g), float(g.mean())
             except Exception:
                 return None
 
@@ -870,10 +1878,13 @@ def analyze_quality(
                 if res:
                     laps.append(res[0])
                     brights.append(res[1])
+        return _pct_thresholds(laps, brights)
+
+    def _pct_thresholds(laps, brights):
         if len(laps) < 5:
             return None
-        laps.sort()
-        brights.sort()
+        laps = sorted(laps)
+        brights = sorted(brights)
         n = len(laps)
         def pct(arr, q):
             return arr[max(0, min(n - 1, int(q * (n - 1))))]
@@ -881,7 +1892,7 @@ def analyze_quality(
             "blur": max(50.0, min(180.0, pct(laps, 0.25))),
             "brightness_low": max(15.0, min(60.0, pct(brights, 0.10))),
             "brightness_high": max(180.0, min(240.0, pct(brights, 0.90))),
-            "n": n,
+            "sample_size": n,
         }
 
     try:
@@ -906,63 +1917,295 @@ def analyze_quality(
             .first()
         )
         if job is None:
-            job = QualityAnalysisJob(
-                celebration_id=celeb_uuid,
-                total_images=len(images),
-                status="processing",
-                threshold=threshold,
-            )
+            job = QualityAnalysisJob(celebration_id=celeb_uuid)
             db.add(job)
-        else:
-            job.total_images = len(images)
-            job.status = "processing"
-            job.threshold = threshold
-            job.error_message = None
-            job.completed_at = None
+        job.total_images = len(images)
+        job.processed_count = 0
+        job.flagged_count = 0
+        job.status = "processing"
+        job.threshold = threshold
+        job.error_message = None
+        job.completed_at = None
+        # Chunks treat metrics written after this as their checkpoint.
+        job.started_at = datetime.utcnow()
         db.commit()
         db.refresh(job)
+        _publish_quality_job(job)
 
         if not images:
             job.status = "completed"
             job.completed_at = datetime.utcnow()
             db.commit()
+            _publish_quality_job(job)
             return {"status": "completed", "processed": 0, "flagged": 0}
 
-        # Snapshot ORM fields into plain tuples so worker threads never touch
-        # the SQLAlchemy session (sessions are not thread-safe; lazy loads from
-        # background threads were causing inner-flush warnings and duplicate
-        # inserts).
         image_records = [
             (img.id, img.compressed_file_path or img.file_path) for img in images
         ]
-        images_by_id = {img.id: img for img in images}
-
-        # Re-runs must be idempotent: clear any existing flags for the images
-        # we're about to re-analyze, otherwise reanalyze=True would race against
-        # itself if a previous run partially wrote flags.
-        if reanalyze:
-            image_ids = [r[0] for r in image_records]
-            db.query(ImageQualityFlag).filter(
-                ImageQualityFlag.image_id.in_(image_ids)
-            ).delete(synchronize_session=False)
-            db.commit()
 
-        # Calibrate per-celebration thresholds
+        # Metrics stored under the current extraction are re-thresholded
+        # without touching S3 (mirrors services/quality_analyzer).
+        stored = {
+            m.image_id: m
+            for m in db.query(ImageQualityMetrics).filter(
+                ImageQualityMetrics.celebration_id == celeb_uuid,
+                ImageQualityMetrics.metrics_version == QUALITY_METRICS_VERSION,
+            )
+        }
+
+        # Calibrate per-celebration thresholds — from the celebration's
+        # calibration sketch once enough images are measured, otherwise from
+        # a fixed sample fetched from S3. Every chunk reads the result from
+        # the job row.
         sample_n = min(25, len(image_records))
-        sample_paths = (
-            [r[1] for r in random.sample(image_records, sample_n)]
-            if len(image_records) > sample_n
-            else [r[1] for r in image_records]
-        )
-        cal = _calibrate(sample_paths)
+        sketched, cal = _quality_sketch_thresholds(db, celeb_uuid)
+        if sketched < len(stored):
+            # Metrics stored before sketches existed; seed it from them once.
+            db.execute(
+                text(
+                    "DELETE FROM quality_calibration_bins "
+                    "WHERE celebration_id = CAST(:cid AS UUID) AND metrics_version = :v"
+                ),
+                {"cid": celebration_id, "v": QUALITY_METRICS_VERSION},
+            )
+            _add_quality_sketch(db, [
+                {"celebration_id": celeb_uuid, "laplacian_var": m.laplacian_var, "brightness": m.brightness}
+                for m in stored.values()
+            ])
+            sketched, cal = _quality_sketch_thresholds(db, celeb_uuid)
+        if sketched < max(sample_n, 5):
+            # Evenly spaced by image ID so re-runs sample the same images.
+            ordered = sorted(image_records, key=lambda r: r[0].int)
+            step = len(ordered) / sample_n
+            cal = _calibrate([ordered[int(i * step)][1] for i in range(sample_n)])
         if cal:
-            logger.info(f"Calibrated (n={cal['n']}): blur={cal['blur']:.1f} under<{cal['brightness_low']:.1f} over>{cal['brightness_high']:.1f}")
-        blur_t = (cal or {}).get("blur", 100.0)
-        under_t = (cal or {}).get("brightness_low", 30.0)
-        over_t = (cal or {}).get("brightness_high", 220.0)
+            logger.info(f"Calibrated (n={cal['sample_size']}): blur={cal['blur']:.1f} under<{cal['brightness_low']:.1f} over>{cal['brightness_high']:.1f}")
+        job.calibration = json.dumps(cal) if cal else None
+
+        rethreshold = {
+            img_id: _quality_issues(
+                {c: getattr(stored[img_id], c) for c in _QUALITY_METRIC_COLUMNS},
+                threshold,
+                (cal or {}).get("blur", 100.0),
+                (cal or {}).get("brightness_low", 30.0),
+                (cal or {}).get("brightness_high", 220.0),
+            )
+            for img_id, _ in image_records
+            if img_id in stored
+        }
+        if rethreshold:
+            _replace_quality_flags(db, ImageQualityFlag, rethreshold)
+            for img in images:
+                if img.id in rethreshold:
+                    img.quality_analyzed = True
+            now = datetime.utcnow()
+            db.add(QualityAnalysisChunk(
+                job_id=job.id,
+                chunk_index=0,
+                image_ids=list(rethreshold),
+                status="completed",
+                processed_count=len(rethreshold),
+                flagged_count=sum(1 for v in rethreshold.values() if v),
+                started_at=now,
+                completed_at=now,
+            ))
+            logger.info(f"Re-flagged {len(rethreshold)} images from stored quality metrics")
+
+        to_fetch = [r[0] for r in image_records if r[0] not in rethreshold]
+        size = max(1, int(os.environ.get("QUALITY_CHUNK_SIZE", "250")))
+        now = datetime.utcnow()
+        chunks = [
+            QualityAnalysisChunk(
+                job_id=job.id, chunk_index=n + 1, image_ids=to_fetch[i:i + size], dispatched_at=now,
+            )
+            for n, i in enumerate(range(0, len(to_fetch), size))
+        ]
+        db.add_all(chunks)
+        db.commit()
+        _sync_quality_job(db, job.id)
 
-        processed = 0
-        flagged = 0
+        for chunk in chunks:
+            analyze_quality_chunk.spawn(chunk_id=str(chunk.id))
+        logger.info(f"Spawned {len(chunks)} quality chunks of up to {size} images")
+        return {"status": "processing", "chunks": len(chunks), "job_id": str(job.id)}
+
+    except Exception as e:
+        logger.exception(f"Quality analysis failed: {e}")
+        # Mark the job as failed so the frontend stops spinning on
+        # "جاري التحليل" forever. The session may be in a bad state, so roll
+        # back first and re-query.
+        try:
+            db.rollback()
+            stuck_job = (
+                db.query(QualityAnalysisJob)
+                .filter(
+                    QualityAnalysisJob.celebration_id == uuid.UUID(celebration_id),
+                    QualityAnalysisJob.status.in_(["pending", "processing"]),
+                )
+                .order_by(QualityAnalysisJob.started_at.desc())
+                .first()
+            )
+            if stuck_job is not None:
+                stuck_job.status = "failed"
+                stuck_job.error_message = str(e)[:500]
+                stuck_job.completed_at = datetime.utcnow()
+                db.commit()
+                _publish_quality_job(stuck_job)
+        except Exception:
+            logger.exception("Failed to record analysis failure on job row")
+        return {"status": "failed", "error": str(e)}
+    finally:
+        db.close()
+        _release_slot(slot)
+
+
+@app.function(
+    memory=2048,
+    cpu=2.0,
+    timeout=900,
+    secrets=secrets,
+    retries=1,
+)
+def analyze_quality_chunk(chunk_id: str, slot: dict | None = None) -> dict:
+    """
+    Analyze one chunk of a quality job and fold its counts into the job.
+
+    Mirrors services/quality_analyzer.analyze_chunk: claims the chunk, skips
+    images this job already measured (an earlier attempt's checkpoint) and
+    commits metrics, flags and chunk counters every 10 images.
+    """
+    import os
+    import json
+    import uuid
+    import logging
+    from datetime import datetime, timedelta
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    db = get_db_session()
+
+    from sqlalchemy import Column, String, Float, Boolean, ARRAY, and_, or_, text, update
+    from sqlalchemy.dialects.postgresql import UUID as PGUUID
+    from sqlalchemy.orm import declarative_base
+    import uuid as uuid_lib
+
+    Base = declarative_base()
+
+    class WeddingImage(Base):
+        __tablename__ = "wedding_images"
+        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+        file_path = Column(String, nullable=False)
+        compressed_file_path = Column(String)
+        quality_analyzed = Column(Boolean, default=False)
+
+    class FaceVector(Base):
+        __tablename__ = "face_vectors"
+        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4)
+        image_id = Column(PGUUID(as_uuid=True), nullable=False)
+        landmarks = Column(ARRAY(Float))
+
+    ImageQualityMetrics, ImageQualityFlag = _quality_models()
+    QualityAnalysisJob, QualityAnalysisChunk = _quality_job_models()
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    s3 = get_s3_client()
+    bucket = os.environ.get("AWS_S3_BUCKET")
+    S3_WORKERS = 8
+    chunk_uuid = uuid.UUID(chunk_id)
+    chunk = None
+
+    try:
+        # Claim the chunk unless it's done or another container is on it
+        # (stale after 15 minutes, as in quality_analyzer._CHUNK_STALE).
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(QualityAnalysisChunk)
+            .where(
+                QualityAnalysisChunk.id == chunk_uuid,
+                or_(
+                    QualityAnalysisChunk.status.in_(("pending", "failed")),
+                    and_(
+                        QualityAnalysisChunk.status == "processing",
+                        QualityAnalysisChunk.started_at < now - timedelta(minutes=15),
+                    ),
+                ),
+            )
+            .values(
+                status="processing",
+                started_at=now,
+                attempts=QualityAnalysisChunk.attempts + 1,
+                error_message=None,
+            )
+            .returning(QualityAnalysisChunk.id)
+        ).first()
+        db.commit()
+        if not claimed:
+            logger.info(f"Quality chunk {chunk_id} is done or running elsewhere; skipped")
+            return {"status": "skipped"}
+
+        chunk = db.get(QualityAnalysisChunk, chunk_uuid)
+        job = db.get(QualityAnalysisJob, chunk.job_id)
+        if job.status != "processing":
+            chunk.status = "failed"
+            chunk.error_message = f"Job is {job.status}"
+            db.commit()
+            return {"status": "skipped"}
+
+        threshold = job.threshold
+        cal = json.loads(job.calibration) if job.calibration else {}
+        blur_t = cal.get("blur", 100.0)
+        under_t = cal.get("brightness_low", 30.0)
+        over_t = cal.get("brightness_high", 220.0)
+
+        def _issues(feats) -> list:
+            return _quality_issues(feats, threshold, blur_t, under_t, over_t)
+
+        def _mark_analyzed(ids) -> None:
+            if ids:
+                db.execute(
+                    text("UPDATE wedding_images SET quality_analyzed = TRUE WHERE id = ANY(:ids)"),
+                    {"ids": list(ids)},
+                )
+
+        # Checkpoint: images this job already measured are re-flagged from
+        # their metrics, not refetched.
+        done = {
+            m.image_id: m
+            for m in db.query(ImageQualityMetrics).filter(
+                ImageQualityMetrics.image_id.in_(chunk.image_ids),
+                ImageQualityMetrics.metrics_version == QUALITY_METRICS_VERSION,
+                ImageQualityMetrics.analyzed_at >= job.started_at,
+            )
+        }
+        resumed = {
+            img_id: _issues({c: getattr(m, c) for c in _QUALITY_METRIC_COLUMNS})
+            for img_id, m in done.items()
+        }
+        if resumed:
+            _replace_quality_flags(db, ImageQualityFlag, resumed)
+            _mark_analyzed(resumed)
+            logger.info(f"Quality chunk {chunk.chunk_index}: resumed past {len(resumed)} analyzed images")
+
+        remaining = [img_id for img_id in chunk.image_ids if img_id not in done]
+        records = [
+            (img_id, compressed or original)
+            for img_id, compressed, original in db.query(
+                WeddingImage.id, WeddingImage.compressed_file_path, WeddingImage.file_path
+            ).filter(WeddingImage.id.in_(remaining))
+        ]
+        # Images deleted since the job was planned count as processed.
+        processed = len(resumed) + len(remaining) - len(records)
+        flagged = sum(1 for v in resumed.values() if v)
+
+        # Snapshot landmarks up front so worker threads never touch the session.
+        faces_by_image: dict = {}
+        for fv_image_id, landmarks in db.query(FaceVector.image_id, FaceVector.landmarks).filter(
+            FaceVector.image_id.in_([r[0] for r in records]),
+            FaceVector.landmarks.isnot(None),
+        ):
+            faces_by_image.setdefault(fv_image_id, []).append({"landmarks": landmarks})
 
         def _fetch(record):
             img_id, fp = record
@@ -972,8 +2215,25 @@ def analyze_quality(
             except Exception as e:
                 return img_id, None, str(e)
 
+        pending_metrics: list = []
+        pending_issues: dict = {}
+
+        def _flush() -> None:
+            _store_quality_metrics(db, ImageQualityMetrics, pending_metrics)
+            _replace_quality_flags(db, ImageQualityFlag, pending_issues)
+            _mark_analyzed(pending_issues)
+            pending_metrics.clear()
+            pending_issues.clear()
+            chunk.processed_count = processed
+            chunk.flagged_count = flagged
+            # Heartbeat: the claim above only takes over a chunk whose
+            # started_at is stale, so a long chunk must keep refreshing it.
+            chunk.started_at = datetime.utcnow()
+            db.commit()
+            _sync_quality_job(db, job.id)
+
         with ThreadPoolExecutor(max_workers=S3_WORKERS) as pool:
-            futures = [pool.submit(_fetch, rec) for rec in image_records]
+            futures = [pool.submit(_fetch, rec) for rec in records]
 
             for future in as_completed(futures):
                 img_id, img_bytes, err = future.result()
@@ -983,89 +2243,59 @@ def analyze_quality(
                         processed += 1
                         continue
 
-                    image_bgr = _decode(img_bytes) if img_bytes else None
-                    if image_bgr is None:
+                    faces = faces_by_image.get(img_id)
+                    gray = _decode_gray(img_bytes) if img_bytes else None
+                    if gray is None:
                         processed += 1
                         continue
 
-                    issues = []
-
-                    is_blurry, blur_conf = detect_blur(image_bgr, thresh=blur_t)
-                    if is_blurry and blur_conf >= threshold:
-                        issues.append(("blur", blur_conf))
-
-                    has_motion, motion_conf = detect_motion_blur(image_bgr)
-                    if has_motion and motion_conf >= threshold:
-                        issues.append(("motion_blur", motion_conf))
-
-                    is_under, under_conf = detect_underexposed(image_bgr, bright_thresh=under_t)
-                    if is_under and under_conf >= threshold:
-                        issues.append(("underexposed", under_conf))
-
-                    is_over, over_conf = detect_overexposed(image_bgr, bright_thresh=over_t)
-                    if is_over and over_conf >= threshold:
-                        issues.append(("overexposed", over_conf))
+                    feats = _quality_features(gray)
+                    feats["eye_scores"] = _closed_eye_scores(gray, faces) if faces else None
+                    issues = _issues(feats)
 
+                    pending_metrics.append({"image_id": img_id, "celebration_id": job.celebration_id, **feats})
+                    pending_issues[img_id] = issues
                     if issues:
                         flagged += 1
-                        for issue_type, conf in issues:
-                            db.add(ImageQualityFlag(
-                                image_id=img_id,
-                                issue_type=issue_type,
-                                confidence=conf,
-                            ))
-
-                    img_row = images_by_id.get(img_id)
-                    if img_row is not None:
-                        img_row.quality_analyzed = True
                     processed += 1
 
                     if processed % 10 == 0:
-                        job.processed_count = processed
-                        job.flagged_count = flagged
-                        db.commit()
+                        _flush()
                 except Exception as e:
                     # Roll back so the session can keep being used. Without this,
                     # the next attribute access triggers PendingRollbackError.
                     db.rollback()
+                    pending_metrics.clear()
+                    pending_issues.clear()
                     logger.error(f"Error analyzing {img_id}: {e}")
                     continue
 
-        job.processed_count = processed
-        job.flagged_count = flagged
-        job.status = "completed"
-        job.completed_at = datetime.utcnow()
+        _flush()
+        chunk.status = "completed"
+        chunk.completed_at = datetime.utcnow()
         db.commit()
+        _sync_quality_job(db, job.id)
 
-        logger.info(f"Quality analysis complete: {processed} images, {flagged} flagged")
-        return {"status": "completed", "processed": processed, "flagged": flagged, "job_id": str(job.id)}
+        logger.info(f"Quality chunk {chunk.chunk_index} complete: {processed} images, {flagged} flagged")
+        return {"status": "completed", "processed": processed, "flagged": flagged}
 
     except Exception as e:
-        logger.exception(f"Quality analysis failed: {e}")
-        # Mark the job as failed so the frontend stops spinning on
-        # "جاري التحليل" forever. The session may be in a bad state, so roll
-        # back first and re-query.
+        logger.exception(f"Quality chunk {chunk_id} failed: {e}")
+        # Left failed for the API's chunk sweep to re-dispatch
+        # (services/quality_analyzer.resume_lost_chunks).
         try:
             db.rollback()
-            stuck_job = (
-                db.query(QualityAnalysisJob)
-                .filter(
-                    QualityAnalysisJob.celebration_id == uuid.UUID(celebration_id),
-                    QualityAnalysisJob.status.in_(["pending", "processing"]),
-                )
-                .order_by(QualityAnalysisJob.started_at.desc())
-                .first()
-            )
-            if stuck_job is not None:
-                stuck_job.status = "failed"
-                stuck_job.error_message = str(e)[:500]
-                stuck_job.completed_at = datetime.utcnow()
+            if chunk is not None:
+                chunk.status = "failed"
+                chunk.error_message = str(e)[:500]
                 db.commit()
+                _sync_quality_job(db, chunk.job_id)
         except Exception:
-            logger.exception("Failed to record analysis failure on job row")
+            logger.exception("Failed to record chunk failure")
         return {"status": "failed", "error": str(e)}
     finally:
         db.close()
+        _release_slot(slot)
 
 
 @app.function(
@@ -1074,14 +2304,12 @@ def analyze_quality(
     timeout=300,
     secrets=secrets,
 )
-def reprocess_image(image_id: str) -> dict:
+def reprocess_image(image_id: str, slot: dict | None = None) -> dict:
     """Reprocess a single image for face detection."""
     import os
     import uuid
     import json
     import logging
-    import cv2
-    import numpy as np
     from insightface.app import FaceAnalysis
 
     logging.basicConfig(level=logging.INFO)
@@ -1092,7 +2320,7 @@ def reprocess_image(image_id: str) -> dict:
     redis_client = get_redis_client()
     bucket = os.environ.get("AWS_S3_BUCKET")
 
-    from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ARRAY
+    from sqlalchemy import Column, String, Integer, Float, DateTime, ARRAY
     from sqlalchemy.dialects.postgresql import UUID as PGUUID
     from sqlalchemy.orm import declarative_base
     import uuid as uuid_lib
@@ -1146,6 +2374,7 @@ def reprocess_image(image_id: str) -> dict:
         if image_bgr is None:
             img.processed = "failed"
             db.commit()
+            _publish("reprocess", {"type": "reprocess", "image_id": image_id, "processed": "failed"})
             return {"status": "failed", "reason": "decode_error"}
 
         # Delete old face vectors
@@ -1154,52 +2383,22 @@ def reprocess_image(image_id: str) -> dict:
         # Detect faces
         face_app = FaceAnalysis(name=INSIGHTFACE_MODEL)
         face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
-        faces = face_app.get(image_bgr)
-
-        face_data = []
-        out_index = 0
-        for f in faces:
-            if f.embedding is None or len(f.embedding) != 512:
-                continue
-
-            x1, y1, x2, y2 = f.bbox.astype(int)
-            face_w = max(x2 - x1, 0)
-            face_h = max(y2 - y1, 0)
-            if min(face_w, face_h) < MIN_FACE_PIXELS:
-                continue
-
-            crop = image_bgr[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
-            quality = 0.0
-            if crop.size > 0:
-                gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-                sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-                sharp = min(sharpness / 1000, 1.0)
-                area = max((y2 - y1) * (x2 - x1), 1)
-                size = min(area / 10000, 1.0)
-                conf = float(min(f.det_score, 1.0))
-                quality = float(sharp * 0.4 + size * 0.3 + conf * 0.3)
-
-            embedding = f.embedding.tolist()
-            face_record = FaceVector(
+        detected = _detected_faces(image_bgr, face_app.get(image_bgr))
+
+        for fd in detected:
+            db.add(FaceVector(
                 image_id=img.id,
                 celebration_id=img.celebration_id,
-                face_index=out_index,
-                vector=embedding,
-                vector_pg=embedding,
-                bbox=f.bbox.tolist(),
-                landmarks=f.kps.flatten().tolist(),
-                confidence=float(f.det_score),
-                quality_score=quality,
+                vector_pg=fd["vector"],
                 embedding_model=EMBEDDING_MODEL_VERSION,
-            )
-            db.add(face_record)
-            face_data.append({
-                "face_index": out_index,
-                "bbox": f.bbox.tolist(),
-                "confidence": float(f.det_score),
-                "quality_score": quality,
-            })
-            out_index += 1
+                **{k: fd[k] for k in _FACE_COLUMNS},
+            ))
+        face_data = [
+            {k: fd[k] for k in ("face_index", "bbox", "confidence", "quality_score")}
+            for fd in detected
+        ]
+
+        _ingest_quality(db, image_bgr, detected, img.id, img.celebration_id)
 
         img.faces_count = len(face_data)
         img.processed = "completed"
@@ -1208,13 +2407,16 @@ def reprocess_image(image_id: str) -> dict:
         redis_client.setex(f"image_faces:{img.id}", 3600, json.dumps(face_data, default=str))
 
         logger.info(f"Reprocessed {img.filename}: {len(face_data)} faces")
+        _publish("reprocess", {"type": "reprocess", "image_id": image_id, "processed": "completed"})
         return {"status": "completed", "image_id": image_id, "faces_count": len(face_data)}
 
     except Exception as e:
         logger.exception(f"Reprocess failed: {e}")
+        _publish("reprocess", {"type": "reprocess", "image_id": image_id, "processed": "failed"})
         return {"status": "failed", "reason": str(e)}
     finally:
         db.close()
+        _release_slot(slot)
 
 
 @app.local_entrypoint()
@@ -1224,4 +2426,5 @@ def main():
     print("\nAvailable functions:")
     print("  - process_image: Process uploaded images")
     print("  - analyze_quality: Analyze celebration for quality issues")
+    print("  - analyze_quality_chunk: Analyze one chunk of a quality job")
     print("  - reprocess_image: Reprocess a single image")
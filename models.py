@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, DateTime, Float, Integer, Text, ForeignKey, Boolean
+from sqlalchemy import String, DateTime, Float, Integer, BigInteger, Text, ForeignKey, Boolean, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID as PGUUID, ARRAY
 
 try:
@@ -48,6 +48,7 @@ class WeddingImage(Base):
     extra_metadata: Mapped[str | None] = mapped_column(Text)
     order_number: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
     quality_analyzed: Mapped[bool] = mapped_column(default=False)  # T002: Whether quality analysis has run
+    source_folder: Mapped[str | None] = mapped_column(String, nullable=True)  # Drive subfolder path for recursive imports
 
     celebration: Mapped["Celebration"] = relationship(back_populates="images")
     faces: Mapped[list["FaceVector"]] = relationship(back_populates="image", cascade="all, delete-orphan")
@@ -87,10 +88,30 @@ class QualityAnalysisJob(Base):
     started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    calibration: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON thresholds shared by the job's chunks
 
     celebration: Mapped["Celebration"] = relationship()
 
 
+# T003b: A slice of a quality-analysis job, run and checkpointed on its own.
+# The job's processed/flagged counts are the sums over its chunks.
+class QualityAnalysisChunk(Base):
+    __tablename__ = "quality_analysis_chunks"
+    __table_args__ = (UniqueConstraint("job_id", "chunk_index", name="uq_quality_analysis_chunks_job_index"),)
+    id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("quality_analysis_jobs.id", ondelete="CASCADE"), nullable=False)
+    chunk_index: Mapped[int] = mapped_column(Integer, nullable=False)  # 0 = images re-flagged from stored metrics by the coordinator
+    image_ids: Mapped[list[uuid.UUID]] = mapped_column(ARRAY(PGUUID(as_uuid=True)), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending")  # pending|processing|completed|failed
+    processed_count: Mapped[int] = mapped_column(Integer, default=0)
+    flagged_count: Mapped[int] = mapped_column(Integer, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    dispatched_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
 # T004: Image Quality Flag - detected quality issues for an image
 class ImageQualityFlag(Base):
     __tablename__ = "image_quality_flags"
@@ -103,3 +124,98 @@ class ImageQualityFlag(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     image: Mapped["WeddingImage"] = relationship(back_populates="quality_flags")
+
+
+# T004b: Raw per-image quality measurements. Flags are a threshold decision
+# over these scalars, so re-flagging at a new threshold (or recalibrating)
+# reads this table instead of re-downloading and re-decoding every image.
+class ImageQualityMetrics(Base):
+    __tablename__ = "image_quality_metrics"
+    image_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("wedding_images.id", ondelete="CASCADE"), primary_key=True)
+    celebration_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("celebrations.id", ondelete="CASCADE"), nullable=False)
+    metrics_version: Mapped[int] = mapped_column(Integer, nullable=False)  # bumped when extraction changes; older rows are recomputed
+    laplacian_var: Mapped[float] = mapped_column(Float, nullable=False)
+    brightness: Mapped[float] = mapped_column(Float, nullable=False)
+    dark_ratio: Mapped[float] = mapped_column(Float, nullable=False)
+    clipped_ratio: Mapped[float] = mapped_column(Float, nullable=False)
+    motion_ratio: Mapped[float] = mapped_column(Float, nullable=False)
+    eye_scores: Mapped[list[float] | None] = mapped_column(ARRAY(Float), nullable=True)  # closed-eye score per readable face; NULL = faces not checked
+    analyzed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# T004c: Per-celebration histogram buckets of image_quality_metrics, the
+# sketch calibration reads its percentiles from. Fed as metrics are stored.
+class QualityCalibrationBin(Base):
+    __tablename__ = "quality_calibration_bins"
+    celebration_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("celebrations.id", ondelete="CASCADE"), primary_key=True)
+    metrics_version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(20), primary_key=True)  # laplacian_var|brightness
+    bin: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Perceptual hash of an image, for burst and near-duplicate grouping
+# (services/near_duplicates.py). ``bands`` is the multi-index key the GIN
+# index searches; burst_id is the first image of the near-duplicate group.
+class ImageHash(Base):
+    __tablename__ = "image_hashes"
+    image_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("wedding_images.id", ondelete="CASCADE"), primary_key=True)
+    celebration_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("celebrations.id", ondelete="CASCADE"), nullable=False)
+    dhash: Mapped[int] = mapped_column(BigInteger, nullable=False)  # signed 64-bit dHash
+    bands: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    burst_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# Drive file → imported image. Lets a re-run of a Drive import skip files whose
+# ID and checksum are unchanged straight from the listing, before any download.
+class DriveFile(Base):
+    __tablename__ = "drive_files"
+    __table_args__ = (UniqueConstraint("celebration_id", "drive_file_id", name="uq_drive_files_celebration_file"),)
+    id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    celebration_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("celebrations.id", ondelete="CASCADE"), nullable=False)
+    drive_file_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    md5_checksum: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    image_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("wedding_images.id", ondelete="CASCADE"), nullable=False)
+    # True only when this file's import inserted the image (not a dedup hit
+    # or filename backfill); only such images are retired when it changes.
+    created_by_import: Mapped[bool] = mapped_column(default=False)
+    imported_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# A Drive folder linked to a celebration for (re-)sync. Listing runs in the
+# background; status and counts describe the latest run.
+class DriveFolderSync(Base):
+    __tablename__ = "drive_folder_syncs"
+    __table_args__ = (UniqueConstraint("celebration_id", "folder_id", name="uq_drive_folder_syncs_celebration_folder"),)
+    id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    celebration_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("celebrations.id", ondelete="CASCADE"), nullable=False)
+    folder_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    api_key: Mapped[str] = mapped_column(String, nullable=False)  # needed again for periodic re-syncs
+    recursive: Mapped[bool] = mapped_column(default=False)  # include subfolders
+    status: Mapped[str] = mapped_column(String(20), default="idle")  # idle|listing|failed
+    listed_count: Mapped[int] = mapped_column(Integer, default=0)
+    new_count: Mapped[int] = mapped_column(Integer, default=0)
+    changed_count: Mapped[int] = mapped_column(Integer, default=0)
+    removed_count: Mapped[int] = mapped_column(Integer, default=0)
+    queued_count: Mapped[int] = mapped_column(Integer, default=0)
+    skipped_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_synced_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# Snapshot of a synced folder's listing, diffed against the next listing.
+class DriveFolderEntry(Base):
+    __tablename__ = "drive_folder_entries"
+    __table_args__ = (UniqueConstraint("sync_id", "drive_file_id", name="uq_drive_folder_entries_sync_file"),)
+    id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    sync_id: Mapped[uuid.UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("drive_folder_syncs.id", ondelete="CASCADE"), nullable=False)
+    drive_file_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    name: Mapped[str | None] = mapped_column(String, nullable=True)
+    md5_checksum: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    modified_time: Mapped[str | None] = mapped_column(String(40), nullable=True)  # RFC 3339, as Drive returns it
@@ -1,14 +1,19 @@
 import logging
+import uuid
+from datetime import datetime
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from db import get_db
-from models import Celebration, WeddingImage
-from jobs.dispatcher import dispatch_job
+from db import get_db, SessionLocal
+from models import Celebration, DriveFolderSync
+from jobs import fairshare
+from jobs.dispatcher import dispatch_job, supports_drive_sync
+from jobs.gdrive_sync import progress_key, sync_folder
 from services import redis_client
-from services.gdrive import list_folder_images
+from services.events import gdrive_channel, sse_response
 from config import settings
 
 logger = logging.getLogger("routers.gdrive")
@@ -21,10 +26,58 @@ class ImportRequest(BaseModel):
     celebrant: str
     folder_id: str
     api_key: str
+    recursive: bool = False  # also import every subfolder, tagging images with its path
 
 
-def _progress_key(celebration_id: str, field: str) -> str:
-    return f"gdrive_import:{celebration_id}:{field}"
+class SyncResponse(BaseModel):
+    sync_id: str
+    folder_id: str
+    recursive: bool
+    status: str
+    listed: int
+    new: int
+    changed: int
+    removed: int
+    queued: int
+    skipped: int
+    last_synced_at: datetime | None = None
+    error: str | None = None
+
+
+def _sync_response(sync: DriveFolderSync) -> SyncResponse:
+    return SyncResponse(
+        sync_id=str(sync.id),
+        folder_id=sync.folder_id,
+        recursive=bool(sync.recursive),
+        status=sync.status,
+        listed=sync.listed_count or 0,
+        new=sync.new_count or 0,
+        changed=sync.changed_count or 0,
+        removed=sync.removed_count or 0,
+        queued=sync.queued_count or 0,
+        skipped=sync.skipped_count or 0,
+        last_synced_at=sync.last_synced_at,
+        error=sync.error_message,
+    )
+
+
+def _queue_sync(background: BackgroundTasks, sync_id: str) -> None:
+    """Run a folder sync on the worker backend (RQ), else in this process."""
+    if supports_drive_sync():
+        dispatch_job("drive_sync", sync_id=sync_id)
+    else:
+        background.add_task(sync_folder, sync_id)
+
+
+def _celebration_uuid(db: Session, celebration_id: str) -> uuid.UUID:
+    """Parse ``celebration_id`` (400 if malformed) and check it exists (404)."""
+    try:
+        cid = uuid.UUID(celebration_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid celebration_id")
+    if db.get(Celebration, cid) is None:
+        raise HTTPException(404, "Celebration not found")
+    return cid
 
 
 @router.post("/import")
@@ -33,10 +86,11 @@ def start_import(
     background: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
-    """Kick off a background import of every image in a public Drive folder.
+    """Link a public Drive folder to a celebration and sync it in the background.
 
-    Returns immediately; the work runs on the configured worker backend and
-    progress is polled via GET /gdrive/import/status.
+    Returns immediately: listing, diffing against the previous sync and
+    dispatching the new/changed files all happen in jobs.gdrive_sync.
+    Listing and import progress are polled via GET /gdrive/import/status.
     """
     celebration = db.query(Celebration).filter(
         Celebration.photographer == req.photographer,
@@ -45,80 +99,106 @@ def start_import(
     if not celebration:
         raise HTTPException(404, "Celebration not found")
 
-    try:
-        files = list_folder_images(req.folder_id, req.api_key)
-    except Exception:
-        logger.exception("Drive folder listing failed")
-        raise HTTPException(400, "تعذر الوصول للمجلد. تأكد أن المجلد عام (Public)")
-
-    cid = str(celebration.id)
-
-    # Skip files already imported (matched by output filename) so re-running the
-    # import only processes what's missing — a cheap retry of failed items
-    # instead of re-dispatching (and re-billing on Modal) every image.
-    existing = {
-        name
-        for (name,) in db.query(WeddingImage.filename)
-        .filter(WeddingImage.celebration_id == celebration.id)
-        .all()
-    }
-
-    def _out_name(name: str) -> str:
-        return name.rsplit(".", 1)[0] + ".jpg"
-
-    pending = [
-        f for f in files if _out_name(f.get("name", "image.jpg")) not in existing
-    ]
-    skipped = len(files) - len(pending)
-    total = len(pending)
-
-    try:
-        redis_client.set(_progress_key(cid, "total"), total, ex=86400)
-        redis_client.set(_progress_key(cid, "done"), 0, ex=86400)
-        redis_client.set(_progress_key(cid, "failed"), 0, ex=86400)
-    except Exception:
-        logger.warning("Could not init gdrive import progress", exc_info=True)
-
-    def _dispatch_all():
-        for f in pending:
-            try:
-                dispatch_job(
-                    "import_drive_image",
-                    file_id=f["id"],
-                    api_key=req.api_key,
-                    filename=f.get("name", "image.jpg"),
-                    mime_type=f.get("mimeType", "image/jpeg"),
-                    celebrant=req.celebrant,
-                    photographer=req.photographer,
-                    celebration_id=cid,
-                )
-            except Exception:
-                logger.exception("Failed to dispatch import job")
-
-    background.add_task(_dispatch_all)
+    sync = db.query(DriveFolderSync).filter(
+        DriveFolderSync.celebration_id == celebration.id,
+        DriveFolderSync.folder_id == req.folder_id,
+    ).first()
+    if sync is None:
+        sync = DriveFolderSync(
+            celebration_id=celebration.id,
+            folder_id=req.folder_id,
+            api_key=req.api_key,
+            recursive=req.recursive,
+        )
+        db.add(sync)
+    else:
+        sync.api_key = req.api_key
+        sync.recursive = req.recursive
+    db.commit()
+
+    _queue_sync(background, str(sync.id))
 
     return {
-        "queued": total,
-        "skipped": skipped,
-        "celebration_id": cid,
+        "sync_id": str(sync.id),
+        "celebration_id": str(celebration.id),
+        "status": "listing",
         "message": (
-            f"Queued {total} images ({skipped} already imported, skipped) "
-            f"via {settings.WORKER_BACKEND}."
+            f"Listing folder in the background; new and changed images will be "
+            f"queued via {settings.WORKER_BACKEND}."
         ),
     }
 
 
+@router.post("/sync")
+def resync_celebration(
+    background: BackgroundTasks,
+    celebration_id: str = Query(...),
+    db: Session = Depends(get_db),
+):
+    """Re-sync every Drive folder linked to a celebration."""
+    syncs = db.query(DriveFolderSync).filter(
+        DriveFolderSync.celebration_id == _celebration_uuid(db, celebration_id)
+    ).all()
+    if not syncs:
+        raise HTTPException(404, "No Drive folders linked to this celebration")
+    for sync in syncs:
+        _queue_sync(background, str(sync.id))
+    return {"syncing": [str(sync.id) for sync in syncs]}
+
+
 @router.get("/import/status")
-def import_status(celebration_id: str = Query(...)):
+def import_status(celebration_id: str = Query(...), db: Session = Depends(get_db)):
+    return _import_status(db, _celebration_uuid(db, celebration_id))
+
+
+@router.get("/import/events")
+async def import_events(request: Request, celebration_id: str = Query(...)):
+    """Server-Sent Events: the import status once, then each progress change.
+
+    ``import`` events carry total/done/failed; ``sync`` events carry a linked
+    folder's listing state.
+    """
+    def _validate() -> uuid.UUID:
+        db = SessionLocal()
+        try:
+            return _celebration_uuid(db, celebration_id)
+        finally:
+            db.close()
+
+    cid = await run_in_threadpool(_validate)
+
+    def _snapshot():
+        db = SessionLocal()
+        try:
+            return _import_status(db, cid)
+        finally:
+            db.close()
+
+    return sse_response(request, gdrive_channel(str(cid)), _snapshot)
+
+
+def _import_status(db: Session, celebration_id: uuid.UUID) -> dict:
     def _read(field: str) -> int:
         try:
-            v = redis_client.get(_progress_key(celebration_id, field))
+            v = redis_client.get(progress_key(str(celebration_id), field))
             return int(v) if v is not None else 0
         except Exception:
             return 0
 
+    # Jobs held back by the per-celebration concurrency cap (jobs/fairshare.py).
+    try:
+        waiting = fairshare.stats(redis_client, str(celebration_id))["waiting"]
+    except Exception:
+        waiting = 0
+
+    syncs = db.query(DriveFolderSync).filter(
+        DriveFolderSync.celebration_id == celebration_id
+    ).order_by(DriveFolderSync.created_at.asc()).all()
+
     return {
         "total": _read("total"),
         "done": _read("done"),
         "failed": _read("failed"),
+        "waiting": waiting,
+        "syncs": [_sync_response(sync) for sync in syncs],
     }
@@ -9,7 +9,7 @@ from models import WeddingImage, FaceVector, Celebration
 router = APIRouter(prefix="/{photographer}/{celebrant}/images", tags=["images"])
 
 @router.get("")
-def list_images(skip: int = 0, limit: int = 100, status: str | None = None, sort: str = "date", celebrant: str = "", photographer: str = "", db: Session = Depends(get_db)):
+def list_images(skip: int = 0, limit: int = 100, status: str | None = None, sort: str = "date", folder: str | None = None, celebrant: str = "", photographer: str = "", db: Session = Depends(get_db)):
     celebration = db.query(Celebration).filter(
         Celebration.celebrant == celebrant,
         Celebration.photographer == photographer
@@ -24,6 +24,10 @@ def list_images(skip: int = 0, limit: int = 100, status: str | None = None, sort
 
     q = q.filter(WeddingImage.celebration_id == celebration.id)
 
+    # Drive subfolder the image was imported from (recursive imports)
+    if folder is not None:
+        q = q.filter(WeddingImage.source_folder == folder)
+
     # Pinned photos (order_number set) always come first. The rest sort by
     # filename when sort=="name", otherwise by upload date.
     secondary = (
@@ -44,7 +48,10 @@ def list_images(skip: int = 0, limit: int = 100, status: str | None = None, sort
         .all()
     )
 
-    total = db.query(WeddingImage).filter(WeddingImage.celebration_id == celebration.id).count()
+    total_q = db.query(WeddingImage).filter(WeddingImage.celebration_id == celebration.id)
+    if folder is not None:
+        total_q = total_q.filter(WeddingImage.source_folder == folder)
+    total = total_q.count()
 
     return {
         "data": [
@@ -59,6 +66,7 @@ def list_images(skip: int = 0, limit: int = 100, status: str | None = None, sort
             "compressed_url": img.compressed_file_path,
             "thumbnail_url": img.compressed_file_path,
             "order_number": img.order_number,
+            "source_folder": img.source_folder,
             "faces": [
                 {
                     "face_id": str(face.id),
@@ -92,6 +100,7 @@ def get_image_by_face(face_id: str, db: Session = Depends(get_db)):
         "processed": img.processed,
         "high_quality_url": img.file_path,
         "compressed_url": img.compressed_file_path,
+        "source_folder": img.source_folder,
         "faces": [
             {
                 "face_id": str(f.id),
@@ -11,18 +11,30 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import REAL, any_, cast, func, literal, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PGUUID
 
-from db import get_db
+from db import get_db, SessionLocal
 from models import (
     Celebration,
     WeddingImage,
+    ImageHash,
     ImageQualityFlag,
     QualityAnalysisJob,
 )
+from services.events import quality_channel, sse_response
+from services.quality_summary import (
+    cache_flag_total,
+    cache_summary,
+    compute_summary,
+    get_cached_flag_total,
+    get_cached_summary,
+    invalidate_summary,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -75,10 +87,11 @@ class FlaggedImageResponse(BaseModel):
 
 class FlaggedImagesListResponse(BaseModel):
     items: list[FlaggedImageResponse]
-    total: int
-    page: int
+    total: Optional[int]  # None when requested with include_total=false
+    page: Optional[int]  # None when paging by cursor
     per_page: int
-    total_pages: int
+    total_pages: Optional[int]
+    next_cursor: Optional[str] = None
 
 
 class QualitySummaryResponse(BaseModel):
@@ -91,6 +104,23 @@ class QualitySummaryResponse(BaseModel):
     last_analysis: Optional[QualityAnalysisJobResponse]
 
 
+class BurstImageResponse(BaseModel):
+    image_id: uuid.UUID
+    filename: str
+    compressed_file_path: Optional[str]
+
+
+class BurstResponse(BaseModel):
+    burst_id: uuid.UUID
+    images: list[BurstImageResponse]
+
+
+class BurstListResponse(BaseModel):
+    items: list[BurstResponse]
+    page: int
+    per_page: int
+
+
 class UpdateFlagRequest(BaseModel):
     reviewed: Optional[bool] = None
     dismissed: Optional[bool] = None
@@ -119,21 +149,48 @@ def _get_celebration(db: Session, photographer: str, celebrant: str) -> Celebrat
     return celebration
 
 
-def _recover_stale_jobs(db: Session, celebration_id: uuid.UUID) -> None:
-    """Mark abandoned pending/processing jobs as failed.
+def _quality_parked(celebration_id: uuid.UUID) -> bool:
+    """Whether fair-share scheduling still holds this celebration's quality job."""
+    from jobs import fairshare
+    from jobs.queues import QUALITY
+    from services import redis_client
+
+    try:
+        return fairshare.stats(redis_client, str(celebration_id), QUALITY)["waiting"] > 0
+    except Exception:
+        return False
+
+
+def _recover_stale_jobs(db: Session, celebration_id: uuid.UUID, redispatch: bool = False) -> None:
+    """Resume or fail abandoned pending/processing jobs.
 
     Workers can die without flipping the row (Modal timeout, OOM, crash before
     the except clause runs). Without this, the dashboard polls "جاري التحليل"
     forever and the trigger endpoint 409s on every retry. Called from both
     the status read path and the trigger path so either unsticks things.
+
+    Chunked jobs re-dispatch their lost chunks instead (resume_quality_job),
+    but only with ``redispatch`` (the trigger path); status reads leave that
+    to the API's periodic chunk sweep and only fail jobs whose chunks ran
+    out of attempts. Jobs whose coordinator died before planning chunks go
+    by age. A
+    pending job parked by fair-share scheduling hasn't started yet, so its
+    age only counts once it is released (the coordinator resets started_at).
     """
+    from services.quality_analyzer import resume_quality_job
+
     now = datetime.utcnow()
     jobs = db.query(QualityAnalysisJob).filter(
         QualityAnalysisJob.celebration_id == celebration_id,
         QualityAnalysisJob.status.in_(["pending", "processing"]),
     ).all()
+    parked = any(j.status == "pending" for j in jobs) and _quality_parked(celebration_id)
     changed = False
     for j in jobs:
+        if resume_quality_job(db, j, redispatch=redispatch):
+            continue
+        if j.status == "pending" and parked:
+            continue
         age = now - j.started_at
         is_stale = (
             (j.processed_count == 0 and age > timedelta(minutes=10))
@@ -146,6 +203,7 @@ def _recover_stale_jobs(db: Session, celebration_id: uuid.UUID) -> None:
             changed = True
     if changed:
         db.commit()
+        invalidate_summary(celebration_id)
 
 
 # T015: POST /quality/{photographer}/{celebrant}/analyze
@@ -162,7 +220,7 @@ def trigger_quality_analysis(
     """
     celebration = _get_celebration(db, photographer, celebrant)
 
-    _recover_stale_jobs(db, celebration.id)
+    _recover_stale_jobs(db, celebration.id, redispatch=True)
 
     # Check if analysis already in progress (after stale recovery)
     existing_job = db.query(QualityAnalysisJob).filter(
@@ -192,6 +250,7 @@ def trigger_quality_analysis(
     db.add(job)
     db.commit()
     db.refresh(job)
+    invalidate_summary(celebration.id)
 
     # T020: Enqueue background job
     enqueue_quality_analysis(str(celebration.id), request.threshold, request.reanalyze)
@@ -223,6 +282,48 @@ def get_quality_status(
     return job
 
 
+@router.get("/{photographer}/{celebrant}/events")
+async def stream_quality_status(photographer: str, celebrant: str, request: Request):
+    """Server-Sent Events: the latest job's status once, then each progress update.
+
+    Replaces polling GET .../status while an analysis runs.
+    """
+    def _celebration_id() -> uuid.UUID:
+        db = SessionLocal()
+        try:
+            return _get_celebration(db, photographer, celebrant).id
+        finally:
+            db.close()
+
+    celebration_id = await run_in_threadpool(_celebration_id)
+
+    def _snapshot():
+        db = SessionLocal()
+        try:
+            _recover_stale_jobs(db, celebration_id)
+            job = db.query(QualityAnalysisJob).filter(
+                QualityAnalysisJob.celebration_id == celebration_id
+            ).order_by(QualityAnalysisJob.started_at.desc()).first()
+            return QualityAnalysisJobResponse.model_validate(job) if job else None
+        finally:
+            db.close()
+
+    return sse_response(request, quality_channel(str(celebration_id)), _snapshot)
+
+
+def _uuid_array(ids: list[uuid.UUID]):
+    """``ids`` as one uuid[] bind parameter, for ``= ANY(...)`` filters."""
+    return literal(list(ids), ARRAY(PGUUID(as_uuid=True)))
+
+
+def _parse_cursor(cursor: str) -> tuple[float, uuid.UUID]:
+    try:
+        score, image_id = cursor.split(":", 1)
+        return float(score), uuid.UUID(image_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 # T017: GET /quality/{photographer}/{celebrant}/flags
 @router.get("/{photographer}/{celebrant}/flags", response_model=FlaggedImagesListResponse)
 def list_flagged_images(
@@ -236,37 +337,83 @@ def list_flagged_images(
     # through. Cap is high enough to fit a typical wedding gallery's worst
     # case but small enough that a single page can still render.
     per_page: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; page is ignored"),
+    include_total: bool = Query(True, description="Count matching images (cached per celebration)"),
     db: Session = Depends(get_db)
 ):
-    """List images with quality flags for a celebration."""
+    """List images with quality flags for a celebration.
+
+    Images are ordered by their highest matching flag confidence, then ID.
+    Passing the previous page's ``next_cursor`` seeks straight to the next
+    page (keyset pagination), so deep pages cost the same as the first;
+    ``page`` still works as an offset for older clients, is ignored with a
+    cursor and comes back as null then. Flags for the page come from one
+    batched query.
+    """
     celebration = _get_celebration(db, photographer, celebrant)
 
-    # Build query for images with flags
-    base_query = db.query(WeddingImage).join(
-        ImageQualityFlag, WeddingImage.id == ImageQualityFlag.image_id
+    # One row per image with a matching flag, scored by its worst issue.
+    score = func.max(ImageQualityFlag.confidence).label("score")
+    matching = db.query(ImageQualityFlag.image_id, score).join(
+        WeddingImage, WeddingImage.id == ImageQualityFlag.image_id
     ).filter(
         WeddingImage.celebration_id == celebration.id
     )
 
     if issue_type:
-        base_query = base_query.filter(ImageQualityFlag.issue_type == issue_type)
+        matching = matching.filter(ImageQualityFlag.issue_type == issue_type)
 
     if reviewed is not None:
-        base_query = base_query.filter(ImageQualityFlag.reviewed == reviewed)
-
-    # Get distinct images
-    base_query = base_query.distinct()
-
-    # Count total
-    total = base_query.count()
-    total_pages = (total + per_page - 1) // per_page
-
-    # Paginate
-    images = base_query.offset((page - 1) * per_page).limit(per_page).all()
+        matching = matching.filter(ImageQualityFlag.reviewed == reviewed)
+
+    ranked = matching.group_by(ImageQualityFlag.image_id).subquery()
+
+    page_query = db.query(ranked.c.image_id, ranked.c.score)
+    if cursor:
+        after_score, after_id = _parse_cursor(cursor)
+        # confidence is REAL. Against a double bind the cursor's score is off
+        # by the float4 rounding, so rows tied with it were skipped or
+        # repeated; cast back to REAL it equals the stored value exactly.
+        page_query = page_query.filter(
+            tuple_(ranked.c.score, ranked.c.image_id) < tuple_(cast(after_score, REAL), after_id)
+        )
+    else:
+        page_query = page_query.offset((page - 1) * per_page)
+    rows = page_query.order_by(ranked.c.score.desc(), ranked.c.image_id.desc()).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = f"{rows[-1].score!r}:{rows[-1].image_id}" if has_more else None
+
+    total = None
+    total_pages = None
+    if include_total:
+        total = get_cached_flag_total(celebration.id, issue_type, reviewed)
+        if total is None:
+            total = db.query(func.count()).select_from(ranked).scalar() or 0
+            cache_flag_total(celebration.id, issue_type, reviewed, total)
+        total_pages = (total + per_page - 1) // per_page
+
+    page_ids = [row.image_id for row in rows]
+    images = {
+        image.id: image
+        for image in db.query(WeddingImage).filter(WeddingImage.id == any_(_uuid_array(page_ids)))
+    } if page_ids else {}
+
+    # Every flag on the page's images in one query, instead of a lazy
+    # image.quality_flags load per image.
+    flags_by_image: dict[uuid.UUID, list[ImageQualityFlag]] = {}
+    if page_ids:
+        for flag in db.query(ImageQualityFlag).filter(ImageQualityFlag.image_id == any_(_uuid_array(page_ids))):
+            flags_by_image.setdefault(flag.image_id, []).append(flag)
 
     # Build response
     items = []
-    for image in images:
+    for image_id in page_ids:
+        image = images.get(image_id)
+        if image is None:
+            continue
+        image_flags = flags_by_image.get(image_id, [])
         flags = [
             QualityFlagResponse(
                 id=flag.id,
@@ -276,13 +423,13 @@ def list_flagged_images(
                 dismissed=flag.dismissed,
                 created_at=flag.created_at
             )
-            for flag in image.quality_flags
+            for flag in image_flags
             if (issue_type is None or flag.issue_type == issue_type)
             and (reviewed is None or flag.reviewed == reviewed)
         ]
 
-        all_reviewed = all(f.reviewed for f in image.quality_flags)
-        all_dismissed = all(f.dismissed for f in image.quality_flags)
+        all_reviewed = all(f.reviewed for f in image_flags)
+        all_dismissed = all(f.dismissed for f in image_flags)
 
         items.append(FlaggedImageResponse(
             image_id=image.id,
@@ -297,9 +444,10 @@ def list_flagged_images(
     return FlaggedImagesListResponse(
         items=items,
         total=total,
-        page=page,
+        page=None if cursor else page,
         per_page=per_page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
 
@@ -310,75 +458,73 @@ def get_quality_summary(
     celebrant: str,
     db: Session = Depends(get_db)
 ):
-    """Get quality analysis summary statistics for a celebration."""
-    celebration = _get_celebration(db, photographer, celebrant)
-
-    # Total images
-    total_images = db.query(WeddingImage).filter(
-        WeddingImage.celebration_id == celebration.id
-    ).count()
+    """Get quality analysis summary statistics for a celebration.
 
-    # Analyzed images
-    analyzed_images = db.query(WeddingImage).filter(
-        WeddingImage.celebration_id == celebration.id,
-        WeddingImage.quality_analyzed == True
-    ).count()
-
-    # Flagged images (distinct images with at least one flag)
-    flagged_images = db.query(func.count(func.distinct(ImageQualityFlag.image_id))).join(
-        WeddingImage, ImageQualityFlag.image_id == WeddingImage.id
-    ).filter(
-        WeddingImage.celebration_id == celebration.id
-    ).scalar() or 0
+    Served from the per-celebration cache when present; otherwise one
+    aggregated query plus the last-job lookup (services/quality_summary.py).
+    """
+    celebration = _get_celebration(db, photographer, celebrant)
 
-    # Reviewed images (all flags reviewed)
-    reviewed_subq = db.query(ImageQualityFlag.image_id).join(
-        WeddingImage, ImageQualityFlag.image_id == WeddingImage.id
-    ).filter(
-        WeddingImage.celebration_id == celebration.id
-    ).group_by(ImageQualityFlag.image_id).having(
-        func.bool_and(ImageQualityFlag.reviewed) == True
-    ).subquery()
+    cached = get_cached_summary(celebration.id)
+    if cached is not None:
+        return QualitySummaryResponse.model_validate(cached)
 
-    reviewed_images = db.query(func.count()).select_from(reviewed_subq).scalar() or 0
-
-    # Dismissed images
-    dismissed_subq = db.query(ImageQualityFlag.image_id).join(
-        WeddingImage, ImageQualityFlag.image_id == WeddingImage.id
-    ).filter(
-        WeddingImage.celebration_id == celebration.id
-    ).group_by(ImageQualityFlag.image_id).having(
-        func.bool_and(ImageQualityFlag.dismissed) == True
-    ).subquery()
-
-    dismissed_images = db.query(func.count()).select_from(dismissed_subq).scalar() or 0
-
-    # Issues by type
-    issues_by_type_query = db.query(
-        ImageQualityFlag.issue_type,
-        func.count(ImageQualityFlag.id)
-    ).join(
-        WeddingImage, ImageQualityFlag.image_id == WeddingImage.id
-    ).filter(
-        WeddingImage.celebration_id == celebration.id
-    ).group_by(ImageQualityFlag.issue_type).all()
-
-    issues_by_type = {row[0]: row[1] for row in issues_by_type_query}
+    counters = compute_summary(db, celebration.id)
 
     # Last analysis job
     last_job = db.query(QualityAnalysisJob).filter(
         QualityAnalysisJob.celebration_id == celebration.id
     ).order_by(QualityAnalysisJob.started_at.desc()).first()
 
-    return QualitySummaryResponse(
-        total_images=total_images,
-        analyzed_images=analyzed_images,
-        flagged_images=flagged_images,
-        reviewed_images=reviewed_images,
-        dismissed_images=dismissed_images,
-        issues_by_type=issues_by_type,
+    summary = QualitySummaryResponse(
+        **counters,
         last_analysis=QualityAnalysisJobResponse.model_validate(last_job) if last_job else None
     )
+    cache_summary(celebration.id, summary.model_dump(mode="json"))
+    return summary
+
+
+@router.get("/{photographer}/{celebrant}/bursts", response_model=BurstListResponse)
+def list_bursts(
+    photographer: str,
+    celebrant: str,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Groups of near-duplicate images (bursts), largest first.
+
+    Grouping comes from the perceptual hashes stored at ingest
+    (services/near_duplicates.py); single images are left out.
+    """
+    celebration = _get_celebration(db, photographer, celebrant)
+
+    size = func.count().label("size")
+    burst_ids = [
+        burst_id for burst_id, _ in db.query(ImageHash.burst_id, size).filter(
+            ImageHash.celebration_id == celebration.id
+        ).group_by(ImageHash.burst_id).having(func.count() > 1).order_by(
+            size.desc(), ImageHash.burst_id
+        ).offset((page - 1) * per_page).limit(per_page)
+    ]
+
+    members: dict[uuid.UUID, list[BurstImageResponse]] = {b: [] for b in burst_ids}
+    if burst_ids:
+        rows = db.query(
+            ImageHash.burst_id, WeddingImage.id, WeddingImage.filename, WeddingImage.compressed_file_path
+        ).join(WeddingImage, WeddingImage.id == ImageHash.image_id).filter(
+            ImageHash.burst_id == any_(_uuid_array(burst_ids))
+        ).order_by(ImageHash.created_at, WeddingImage.id)
+        for burst_id, image_id, filename, compressed_path in rows:
+            members[burst_id].append(BurstImageResponse(
+                image_id=image_id, filename=filename, compressed_file_path=compressed_path
+            ))
+
+    return BurstListResponse(
+        items=[BurstResponse(burst_id=b, images=members[b]) for b in burst_ids],
+        page=page,
+        per_page=per_page,
+    )
 
 
 # PATCH endpoints for US2 (T030, T031) - keeping them here for router completeness
@@ -409,6 +555,7 @@ def update_quality_flag(
             flag.dismissed = request.dismissed
 
     db.commit()
+    invalidate_summary(celebration.id)
 
     flags = [
         QualityFlagResponse(
@@ -433,6 +580,11 @@ def update_quality_flag(
     )
 
 
+# Images per bulk review request. The update is a single statement, so this
+# only bounds the request body.
+_BULK_MAX_IMAGES = 5000
+
+
 @router.patch("/{photographer}/{celebrant}/flags/bulk", response_model=BulkUpdateResponse)
 def bulk_update_quality_flags(
     photographer: str,
@@ -440,32 +592,38 @@ def bulk_update_quality_flags(
     request: BulkUpdateFlagRequest,
     db: Session = Depends(get_db)
 ):
-    """Bulk update reviewed/dismissed status for multiple images."""
-    celebration = _get_celebration(db, photographer, celebrant)
+    """Bulk update reviewed/dismissed status for multiple images.
 
-    if len(request.image_ids) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 images per bulk request")
-
-    # Update flags for all specified images
-    updated_count = 0
-    for image_id in request.image_ids:
-        flags = db.query(ImageQualityFlag).join(
-            WeddingImage, ImageQualityFlag.image_id == WeddingImage.id
-        ).filter(
-            WeddingImage.id == image_id,
-            WeddingImage.celebration_id == celebration.id
-        ).all()
-
-        for flag in flags:
-            if request.reviewed is not None:
-                flag.reviewed = request.reviewed
-            if request.dismissed is not None:
-                flag.dismissed = request.dismissed
-            updated_count += 1
+    One ``UPDATE ... FROM wedding_images WHERE image_id = ANY(:ids)``,
+    scoped to the celebration, however many images are selected.
+    """
+    celebration = _get_celebration(db, photographer, celebrant)
 
+    if len(request.image_ids) > _BULK_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Maximum {_BULK_MAX_IMAGES} images per bulk request")
+
+    values = {}
+    if request.reviewed is not None:
+        values["reviewed"] = request.reviewed
+    if request.dismissed is not None:
+        values["dismissed"] = request.dismissed
+    if not values or not request.image_ids:
+        return BulkUpdateResponse(updated_count=0)
+
+    result = db.execute(
+        update(ImageQualityFlag)
+        .where(
+            ImageQualityFlag.image_id == WeddingImage.id,
+            WeddingImage.celebration_id == celebration.id,
+            ImageQualityFlag.image_id == any_(_uuid_array(request.image_ids)),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
+    invalidate_summary(celebration.id)
 
-    return BulkUpdateResponse(updated_count=updated_count)
+    return BulkUpdateResponse(updated_count=result.rowcount)
 
 
 # T020: Background job enqueue function
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from db import get_db
+from db import get_db, SessionLocal
 from models import WeddingImage, Celebration, FaceVector
 from jobs.dispatcher import dispatch_job
+from services.events import REPROCESS_CHANNEL, sse_response
 from config import settings
 import logging
 
@@ -30,7 +31,11 @@ def reprocess_unprocessed(db: Session = Depends(get_db)):
 
     count = 0
     for img in images:
-        job_id = dispatch_job("reprocess_image", image_id=str(img.id))
+        job_id = dispatch_job(
+            "reprocess_image",
+            image_id=str(img.id),
+            celebration_id=str(img.celebration_id),
+        )
         count += 1
         logger.info(f"Queued job {job_id} for {img.filename}")
 
@@ -96,7 +101,11 @@ def reprocess_all(
     db.commit()
 
     for img in images:
-        dispatch_job("reprocess_image", image_id=str(img.id))
+        dispatch_job(
+            "reprocess_image",
+            image_id=str(img.id),
+            celebration_id=str(img.celebration_id),
+        )
         queued += 1
 
     return {
@@ -149,6 +158,20 @@ def reprocess_status(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/events")
+async def reprocess_events(request: Request):
+    """Server-Sent Events: /reprocess/status once, then one event per image
+    as workers finish it (``{"image_id", "processed"}``)."""
+    def _snapshot():
+        db = SessionLocal()
+        try:
+            return reprocess_status(db)
+        finally:
+            db.close()
+
+    return sse_response(request, REPROCESS_CHANNEL, _snapshot)
+
+
 @router.post("/{photographer}/{celebrant}")
 def reprocess_celebration(
     photographer: str = Path(...),
@@ -180,7 +203,11 @@ def reprocess_celebration(
 
     count = 0
     for img in images:
-        job_id = dispatch_job("reprocess_image", image_id=str(img.id))
+        job_id = dispatch_job(
+            "reprocess_image",
+            image_id=str(img.id),
+            celebration_id=str(img.celebration_id),
+        )
         count += 1
         logger.info(f"Queued job {job_id} for {img.filename}")
 
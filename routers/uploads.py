@@ -10,6 +10,7 @@ from fastapi import (
     Form,
 )
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from db import get_db, SessionLocal
 from models import WeddingImage, FaceVector, Celebration
 from utils import (
@@ -17,9 +18,12 @@ from utils import (
     calculate_file_hash,
 )
 from config import settings
-from jobs.dispatcher import dispatch_job
+from jobs.dispatcher import dispatch_job, supports_batches
+from jobs.local_pool import QueueFull
 # Services used by legacy RQ workers (not used with Modal upload endpoint)
 from services import face_service, upload_to_s3, redis_client
+from services.quality_analyzer import ingest_metrics, record_ingest_quality
+from services.near_duplicates import hash_for_ingest, record_image_hash
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -61,16 +65,36 @@ async def upload_wedding_photos(
     if oversized:
         raise HTTPException(413, f"الملفات التالية تتجاوز 2MB: {', '.join(oversized)}")
 
-    # Queue each file for async processing using configured backend
-    for content, filename in zip(file_contents, filenames):
-        dispatch_job(
-            "process_image",
-            celebrant=celebrant,
-            photographer=photographer,
-            filename=filename,
-            content=content,
-            celebration_id=str(celebration.id),
-        )
+    # Queue files for async processing using configured backend. RQ/local
+    # workers take them in batches so S3 uploads overlap face detection;
+    # Modal gets one container per file. Dispatch runs in the threadpool: the
+    # local backend blocks while its bounded queue is full.
+    def _dispatch_all():
+        if supports_batches():
+            pairs = list(zip(filenames, file_contents))
+            for i in range(0, len(pairs), settings.INGEST_BATCH_SIZE):
+                dispatch_job(
+                    "process_image_batch",
+                    celebrant=celebrant,
+                    photographer=photographer,
+                    files=pairs[i:i + settings.INGEST_BATCH_SIZE],
+                    celebration_id=str(celebration.id),
+                )
+        else:
+            for content, filename in zip(file_contents, filenames):
+                dispatch_job(
+                    "process_image",
+                    celebrant=celebrant,
+                    photographer=photographer,
+                    filename=filename,
+                    content=content,
+                    celebration_id=str(celebration.id),
+                )
+
+    try:
+        await run_in_threadpool(_dispatch_all)
+    except QueueFull as e:
+        raise HTTPException(503, str(e))
 
     return {
         "status": "accepted",
@@ -84,23 +108,23 @@ async def upload_wedding_photos(
 # 🔧 Background Job Functions
 # --------------------------
 
-def _handle_single_upload(
+def _prepare_upload(
     celebrant: str,
     photographer: str,
     filename: str,
     content: bytes,
     celebration_id: str,
-):
+) -> WeddingImage | None:
     """
-    🧠 Runs inside the RQ worker.
-    Handles S3 uploads + DB insert + face detection.
+    📤 I/O stage: dedupe, S3 upload and DB insert.
+    Returns the new (detached) row, or None if there is nothing to process.
     """
     db = SessionLocal()
 
     try:
         if not content:
             logger.warning(f"⚠️ Empty content for {filename}")
-            return
+            return None
 
         file_hash = calculate_file_hash(content)
 
@@ -109,7 +133,7 @@ def _handle_single_upload(
         ).first()
         if existing:
             logger.info(f"🟡 Skipped duplicate file {filename}")
-            return
+            return None
 
         # Upload to S3 (single copy — files are already optimized at upload time)
         url = upload_to_s3(content, filename, "image/jpeg", celebrant, photographer)
@@ -126,52 +150,172 @@ def _handle_single_upload(
         db.add(img)
         db.commit()
         db.refresh(img)
+        db.expunge(img)
 
         logger.info(f"🧾 Added {filename}, starting face detection...")
-
-        _process_image_faces(db, img, content)
+        return img
 
     except Exception as e:
         logger.exception(f"❌ Failed to handle {filename}: {e}")
         db.rollback()
+        return None
     finally:
         db.close()
 
 
-def _process_image_faces(db: Session, img: WeddingImage, file_content: bytes):
+def _handle_single_upload(
+    celebrant: str,
+    photographer: str,
+    filename: str,
+    content: bytes,
+    celebration_id: str,
+):
     """
-    🔍 Detects faces & saves vectors.
+    🧠 Runs inside the RQ worker.
+    Handles S3 uploads + DB insert + face detection.
     """
+    img = _prepare_upload(celebrant, photographer, filename, content, celebration_id)
+    if img is None:
+        return
+
+    db = SessionLocal()
     try:
-        img.processed = "processing"
-        db.commit()
+        img = db.merge(img, load=False)
+        _process_image_faces(db, img, content)
+    except Exception as e:
+        logger.exception(f"❌ Failed to handle {filename}: {e}")
+        db.rollback()
+    finally:
+        db.close()
 
-        arr = load_image_from_bytes(file_content)
-        faces = face_service.detect_and_encode_faces(arr)
 
-        for f in faces:
-            db.add(
-                FaceVector(
-                    image_id=img.id,
-                    face_index=f["face_index"],
-                    vector=f["vector"],
-                    vector_pg=f["vector"],
-                    bbox=f["bbox"],
-                    landmarks=f["landmarks"],
-                    confidence=f["confidence"],
-                    quality_score=f["quality_score"],
-                    celebration_id=img.celebration_id,
-                    embedding_model=settings.EMBEDDING_MODEL_VERSION,
+def _handle_upload_batch(
+    celebrant: str,
+    photographer: str,
+    files: list[tuple[str, bytes]],
+    celebration_id: str,
+):
+    """
+    🧠 Runs inside the RQ worker.
+    Same as _handle_single_upload for several (filename, content) pairs, with
+    S3 uploads of the next images overlapping detection of the current one
+    (see jobs.pipeline).
+    """
+    from jobs.pipeline import run_staged
+
+    def _prepare(item):
+        filename, content = item
+        img = _prepare_upload(celebrant, photographer, filename, content, celebration_id)
+        return (img, content) if img is not None else None
+
+    def _detect(prepared):
+        return _detect_faces(prepared[1], prepared[0].celebration_id)
+
+    def _persist(prepared, detected):
+        db = SessionLocal()
+        try:
+            img = db.merge(prepared[0], load=False)
+            if detected is None:
+                img.processed = "failed"
+                db.commit()
+                return
+            _save_faces(db, img, *detected)
+        except Exception as e:
+            logger.exception(f"💥 Error processing {prepared[0].filename}: {e}")
+            db.rollback()
+            # Don't leave the row "pending" forever: the face rows were
+            # rolled back, so record the image as failed for reprocessing.
+            try:
+                db.query(WeddingImage).filter(WeddingImage.id == prepared[0].id).update(
+                    {"processed": "failed"}, synchronize_session=False
                 )
+                db.commit()
+            except Exception:
+                logger.exception(f"Could not mark {prepared[0].filename} failed")
+                db.rollback()
+        finally:
+            db.close()
+
+    run_staged(
+        files,
+        prepare=_prepare,
+        detect=_detect,
+        persist=_persist,
+        io_threads=settings.INGEST_IO_THREADS,
+        depth=settings.INGEST_PIPELINE_DEPTH,
+    )
+
+
+def _detect_faces(file_content: bytes, celebration_id=None) -> tuple[list[dict], dict | None, dict | None]:
+    """Decode and run face detection (the CPU-bound part of ingest).
+
+    Also returns the image's perceptual hash; with REUSE_NEAR_DUPLICATE_FACES,
+    a near-identical processed sibling's faces are copied instead of running
+    detection. With QUALITY_ON_INGEST, quality metrics are measured on the
+    same decoded array (and the detected landmarks); otherwise the metrics
+    are None.
+    """
+    arr = load_image_from_bytes(file_content)
+    hashed, faces = hash_for_ingest(arr, celebration_id)
+    if faces is None:
+        faces = face_service.detect_and_encode_faces(arr)
+    metrics = None
+    if settings.QUALITY_ON_INGEST:
+        try:
+            metrics = ingest_metrics(arr, faces)
+        except Exception:
+            logger.warning("⚠️ Ingest quality metrics failed", exc_info=True)
+    return faces, metrics, hashed
+
+
+def _save_faces(
+    db: Session,
+    img: WeddingImage,
+    faces: list[dict],
+    metrics: dict | None = None,
+    hashed: dict | None = None,
+):
+    """Store face vectors (and ingest quality and perceptual hash), mark the
+    image completed and cache the faces."""
+    for f in faces:
+        db.add(
+            FaceVector(
+                image_id=img.id,
+                face_index=f["face_index"],
+                vector=f["vector"],
+                vector_pg=f["vector"],
+                bbox=f["bbox"],
+                landmarks=f["landmarks"],
+                confidence=f["confidence"],
+                quality_score=f["quality_score"],
+                celebration_id=img.celebration_id,
+                embedding_model=settings.EMBEDDING_MODEL_VERSION,
             )
+        )
 
-        img.faces_count = len(faces)
-        img.processed = "completed"
-        db.commit()
+    if metrics is not None:
+        record_ingest_quality(db, img, metrics)
+    if hashed is not None:
+        record_image_hash(db, img, hashed)
+
+    img.faces_count = len(faces)
+    img.processed = "completed"
+    db.commit()
+
+    redis_client.setex(f"image_faces:{img.id}", 3600, json.dumps(faces, default=str))
+
+    logger.info(f"✅ Processed {len(faces)} faces for {img.filename}")
 
-        redis_client.setex(f"image_faces:{img.id}", 3600, json.dumps(faces, default=str))
 
-        logger.info(f"✅ Processed {len(faces)} faces for {img.filename}")
+def _process_image_faces(db: Session, img: WeddingImage, file_content: bytes):
+    """
+    🔍 Detects faces & saves vectors.
+    """
+    try:
+        img.processed = "processing"
+        db.commit()
+
+        _save_faces(db, img, *_detect_faces(file_content, img.celebration_id))
 
     except Exception as e:
         logger.exception(f"💥 Error processing {img.filename}: {e}")
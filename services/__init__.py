@@ -1,34 +1,41 @@
+import io
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from urllib.parse import urlparse
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import insightface
 import redis
 from typing import Any, Dict, List, Tuple
-import cv2
 
 from config import settings
 
+# One client per process, shared by every thread (boto3 clients are
+# thread-safe). The connection pool is sized for the upload pool plus
+# multipart part uploads so concurrent transfers reuse keep-alive sockets.
 _s3 = boto3.client(
     "s3",
     region_name=settings.AWS_REGION,
     endpoint_url=settings.S3_ENDPOINT,
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS),
 )
 
+# Large originals (RAW-ish JPEGs, HEIC from Drive) go up as parallel parts.
+_transfer_config = TransferConfig(
+    multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=settings.S3_MULTIPART_THRESHOLD,
+    max_concurrency=4,
+)
 
-def upload_to_s3(file_bytes: bytes, filename: str, content_type: str, celebrant: str, photographer: str) -> str:
-    if not settings.AWS_S3_BUCKET:
-        raise RuntimeError("AWS_S3_BUCKET not configured")
-    key = f"{photographer}/{celebrant}/{uuid.uuid4()}_{filename}"
-    _s3.put_object(
-        Bucket=settings.AWS_S3_BUCKET,
-        Key=key,
-        Body=file_bytes,
-        ContentType=content_type,
-        ACL="public-read"
-    )
+_upload_pool = ThreadPoolExecutor(
+    max_workers=settings.S3_UPLOAD_THREADS, thread_name_prefix="s3-upload"
+)
 
+
+def public_s3_url(key: str) -> str:
     # Prefer explicit public base if provided (CDN/custom domain)
     if settings.PUBLIC_S3_BASE_URL:
         return f"{settings.PUBLIC_S3_BASE_URL}/{key}"
@@ -42,6 +49,157 @@ def upload_to_s3(file_bytes: bytes, filename: str, content_type: str, celebrant:
     return f"https://{settings.AWS_S3_BUCKET}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
 
 
+def _object_key(filename: str, celebrant: str, photographer: str) -> str:
+    return f"{photographer}/{celebrant}/{uuid.uuid4()}_{filename}"
+
+
+def upload_to_s3(file_bytes: bytes, filename: str, content_type: str, celebrant: str, photographer: str) -> str:
+    if not settings.AWS_S3_BUCKET:
+        raise RuntimeError("AWS_S3_BUCKET not configured")
+    key = _object_key(filename, celebrant, photographer)
+    if len(file_bytes) >= settings.S3_MULTIPART_THRESHOLD:
+        _s3.upload_fileobj(
+            io.BytesIO(file_bytes),
+            settings.AWS_S3_BUCKET,
+            key,
+            ExtraArgs={"ContentType": content_type, "ACL": "public-read"},
+            Config=_transfer_config,
+        )
+    else:
+        _s3.put_object(
+            Bucket=settings.AWS_S3_BUCKET,
+            Key=key,
+            Body=file_bytes,
+            ContentType=content_type,
+            ACL="public-read"
+        )
+    return public_s3_url(key)
+
+
+def delete_from_s3(url: str) -> None:
+    """Best-effort delete of an object by the URL upload_to_s3/S3StreamUpload returned."""
+    base = settings.PUBLIC_S3_BASE_URL
+    if base and url.startswith(f"{base}/"):
+        key = url[len(base) + 1:]
+    else:
+        key = urlparse(url).path.lstrip("/")
+    try:
+        _s3.delete_object(Bucket=settings.AWS_S3_BUCKET, Key=key)
+    except Exception:
+        pass  # an orphan costs storage, not correctness
+
+
+def upload_to_s3_async(file_bytes: bytes, filename: str, content_type: str, celebrant: str, photographer: str) -> "Future[str]":
+    """upload_to_s3 on the shared upload pool; the future resolves to the URL."""
+    return _upload_pool.submit(upload_to_s3, file_bytes, filename, content_type, celebrant, photographer)
+
+
+class S3StreamUpload:
+    """Upload an object to S3 while it is still being produced.
+
+    Written bytes are cut into S3_MULTIPART_THRESHOLD-sized parts that go up
+    on the upload pool while the caller keeps writing. At most
+    ``max_pending`` parts are in flight (write() waits on the oldest), so
+    memory stays at a few parts however large the object is. Objects smaller
+    than one part never start a multipart upload; finish() sends them with a
+    single put_object. Call abort() if the object turns out to be unwanted.
+    """
+
+    def __init__(self, filename: str, content_type: str, celebrant: str, photographer: str, max_pending: int = 2):
+        if not settings.AWS_S3_BUCKET:
+            raise RuntimeError("AWS_S3_BUCKET not configured")
+        self.key = _object_key(filename, celebrant, photographer)
+        self.content_type = content_type
+        self._part_size = settings.S3_MULTIPART_THRESHOLD
+        self._max_pending = max_pending
+        self._buf = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[Future] = []
+
+    def write(self, data: bytes) -> None:
+        self._buf += data
+        while len(self._buf) >= self._part_size:
+            body = bytes(self._buf[:self._part_size])
+            del self._buf[:self._part_size]
+            self._send_part(body)
+
+    def _send_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = _s3.create_multipart_upload(
+                Bucket=settings.AWS_S3_BUCKET,
+                Key=self.key,
+                ContentType=self.content_type,
+                ACL="public-read",
+            )["UploadId"]
+        pending = [f for f in self._parts if not f.done()]
+        if len(pending) >= self._max_pending:
+            pending[0].result()
+        number = len(self._parts) + 1
+        self._parts.append(_upload_pool.submit(self._upload_part, number, body))
+
+    def _upload_part(self, number: int, body: bytes) -> dict:
+        resp = _s3.upload_part(
+            Bucket=settings.AWS_S3_BUCKET,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+    def finish(self) -> str:
+        """Flush the tail, complete the upload and return the public URL.
+
+        A failed finish aborts the multipart upload so no parts linger.
+        """
+        try:
+            return self._finish()
+        except Exception:
+            self.abort()
+            raise
+
+    def _finish(self) -> str:
+        if self._upload_id is None:
+            _s3.put_object(
+                Bucket=settings.AWS_S3_BUCKET,
+                Key=self.key,
+                Body=bytes(self._buf),
+                ContentType=self.content_type,
+                ACL="public-read",
+            )
+        else:
+            parts = [f.result() for f in self._parts]
+            if self._buf:
+                # The last part may be smaller than the 5MB S3 minimum.
+                parts.append(self._upload_part(len(parts) + 1, bytes(self._buf)))
+            _s3.complete_multipart_upload(
+                Bucket=settings.AWS_S3_BUCKET,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        self._buf = bytearray()
+        return public_s3_url(self.key)
+
+    def finish_async(self) -> "Future[str]":
+        """finish() on the upload pool. Parts already queued run first (FIFO)."""
+        return _upload_pool.submit(self.finish)
+
+    def abort(self) -> None:
+        self._buf = bytearray()
+        if self._upload_id is None:
+            return
+        for f in self._parts:
+            f.cancel()
+        try:
+            _s3.abort_multipart_upload(
+                Bucket=settings.AWS_S3_BUCKET, Key=self.key, UploadId=self._upload_id
+            )
+        except Exception:
+            pass  # best effort; stale parts can be expired by a bucket lifecycle rule
+        self._upload_id = None
+
+
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
 
 
@@ -65,13 +223,16 @@ class FaceRecognitionService:
         except Exception as e:
             raise
 
+    def preload(self) -> None:
+        """Load the model now instead of on the first detection (worker warm-up)."""
+        self._init_models()
+
     def detect_and_encode_faces(self, image_bgr) -> List[Dict[str, Any]]:
         # Lazy load models on first use
         if self._app is None:
             self._init_models()
         faces = self._app.get(image_bgr)
-        out: List[Dict[str, Any]] = []
-        out_idx = 0
+        kept = []
         for f in faces:
             emb = f.embedding
             if emb is None or emb.shape[0] != settings.VECTOR_DIM:
@@ -82,29 +243,32 @@ class FaceRecognitionService:
             if min(face_w, face_h) < settings.MIN_FACE_PIXELS:
                 # Reject sub-threshold detections (background blur, mis-detections)
                 continue
-            out.append({
-                "face_index": out_idx,
-                "vector": emb.tolist(),
+            kept.append(f)
+        if not kept:
+            return []
+
+        # Quality and closed-eye scores for all faces at once, on one
+        # grayscale frame; ingest's closed-eye check reuses the eye scores.
+        from services.quality_analyzer import face_scores
+
+        quality, eyes = face_scores(
+            image_bgr,
+            [f.bbox for f in kept],
+            [f.det_score for f in kept],
+            [f.kps for f in kept],
+        )
+        return [
+            {
+                "face_index": i,
+                "vector": f.embedding.tolist(),
                 "bbox": f.bbox.tolist(),
                 "landmarks": f.kps.flatten().tolist(),
                 "confidence": float(f.det_score),
-                "quality_score": self._quality_score(f, image_bgr),
-            })
-            out_idx += 1
-        return out
-
-    def _quality_score(self, face, image_bgr) -> float:
-        x1, y1, x2, y2 = face.bbox.astype(int)
-        crop = image_bgr[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
-        if crop.size == 0:
-            return 0.0
-        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
-        sharp = min(sharpness / 1000, 1.0)
-        area = max((y2 - y1) * (x2 - x1), 1)
-        size = min(area / (100 * 100), 1.0)
-        conf = float(min(face.det_score, 1.0))
-        return float(sharp * 0.4 + size * 0.3 + conf * 0.3)
+                "quality_score": quality[i],
+                "eye_score": eyes[i],
+            }
+            for i, f in enumerate(kept)
+        ]
 
 
 # Lazy initialization - models loaded only when needed (e.g., search endpoint)
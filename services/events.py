@@ -0,0 +1,101 @@
+"""
+Progress events: Redis pub/sub from the workers, Server-Sent Events to browsers.
+
+Workers ``publish`` whenever a counter moves (Drive import, quality analysis,
+reprocessing). The API relays a channel to each connected dashboard with
+``sse_response``: one ``snapshot`` event with the current state on connect,
+then a ``progress`` event per change — instead of the dashboard polling
+status endpoints that run COUNT queries every few seconds.
+
+Publishing is fire-and-forget; a Redis hiccup never fails the job, and
+clients can always fall back to the status endpoints.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Callable
+
+import redis.asyncio as aioredis
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "events:"
+REPROCESS_CHANNEL = f"{CHANNEL_PREFIX}reprocess"
+
+# Comment line sent when a channel is quiet, so proxies keep the stream open.
+_HEARTBEAT_SECONDS = 15.0
+
+_async_redis: aioredis.Redis | None = None
+
+
+def gdrive_channel(celebration_id: str) -> str:
+    return f"{CHANNEL_PREFIX}gdrive_import:{celebration_id}"
+
+
+def quality_channel(celebration_id: str) -> str:
+    return f"{CHANNEL_PREFIX}quality:{celebration_id}"
+
+
+def publish(channel: str, event: dict[str, Any], conn=None) -> None:
+    """Publish ``event`` as JSON on ``channel``; never raises."""
+    try:
+        if conn is None:
+            from services import redis_client as conn
+        conn.publish(channel, json.dumps(event, default=str))
+    except Exception:
+        logger.debug("Failed to publish progress event", exc_info=True)
+
+
+def _get_async_redis() -> aioredis.Redis:
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_redis
+
+
+def _frame(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def sse_response(
+    request: Request,
+    channel: str,
+    snapshot: Callable[[], Any] | None = None,
+) -> StreamingResponse:
+    """Stream ``channel`` to the client as Server-Sent Events.
+
+    ``snapshot`` (sync, run in the threadpool) supplies the initial state.
+    It runs after subscribing, so nothing published in between is lost —
+    at worst an event repeats what the snapshot already showed.
+    """
+    async def _events():
+        pubsub = _get_async_redis().pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            if snapshot is not None:
+                state = await run_in_threadpool(snapshot)
+                yield _frame("snapshot", json.dumps(jsonable_encoder(state)))
+            while not await request.is_disconnected():
+                msg = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=_HEARTBEAT_SECONDS
+                )
+                if msg is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _frame("progress", msg["data"])
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.reset()
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,45 +1,84 @@
 """Google Drive helpers for the background import worker.
 
-Lists a public folder, downloads originals, and compresses to the platform's
-display size. Uses urllib (stdlib) so it works unchanged on Modal containers.
+Lists a public folder (optionally with its subfolders), downloads originals,
+and compresses to the platform's display size. Requests go over one pooled
+urllib3 manager so connections to googleapis.com stay alive across files, and
+downloads pass through a Redis-backed throttle shared by every worker.
 """
 from __future__ import annotations
 
 import io
 import json
 import time
+import uuid
+import random
 import logging
 import urllib.parse
-import urllib.request
-from typing import Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, BinaryIO, Callable
+
+import urllib3
 
 logger = logging.getLogger(__name__)
 
 from PIL import Image, ImageOps
 
+from config import settings
+
 DRIVE_API_BASE = "https://www.googleapis.com/drive/v3"
 
+# Keep-alive pool shared by every thread in the process. Retries are ours
+# (through the throttle), not urllib3's.
+_http = urllib3.PoolManager(maxsize=settings.GDRIVE_CONCURRENCY_MAX, block=False, retries=False)
+
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+_LIST_FIELDS = "nextPageToken,files(id,name,mimeType,md5Checksum,size,modifiedTime)"
+
+# Subfolders deeper than this are ignored (guards against shortcut cycles).
+_MAX_FOLDER_DEPTH = 10
+
+
+def _list_page(query: str, api_key: str, page_token: str | None) -> dict[str, Any]:
+    params = {
+        "q": query,
+        "key": api_key,
+        "fields": _LIST_FIELDS,
+        "pageSize": "1000",
+    }
+    if page_token:
+        params["pageToken"] = page_token
 
-def list_folder_images(folder_id: str, api_key: str) -> list[dict[str, Any]]:
-    """Return all image files (id, name, mimeType) in a public Drive folder."""
+    url = f"{DRIVE_API_BASE}/files?{urllib.parse.urlencode(params)}"
+    resp = _http.request("GET", url, timeout=30)
+    if resp.status >= 400:
+        raise RuntimeError(f"Drive listing failed (HTTP {resp.status})")
+    return json.loads(resp.data.decode("utf-8"))
+
+
+def list_folder_images(
+    folder_id: str,
+    api_key: str,
+    on_page: Callable[[list[dict[str, Any]]], None] | None = None,
+) -> list[dict[str, Any]]:
+    """Return all image files in a public Drive folder.
+
+    Each entry has id, name, mimeType, md5Checksum, size and modifiedTime —
+    the checksum and size let imports skip unchanged files without
+    downloading them (``size`` comes back as a string, as Drive sends it).
+    ``on_page`` is called with each page as it arrives, for progress.
+    """
     files: list[dict[str, Any]] = []
     page_token: str | None = None
+    query = f"'{folder_id}' in parents and mimeType contains 'image/'"
 
     while True:
-        params = {
-            "q": f"'{folder_id}' in parents and mimeType contains 'image/'",
-            "key": api_key,
-            "fields": "nextPageToken,files(id,name,mimeType)",
-            "pageSize": "1000",
-        }
-        if page_token:
-            params["pageToken"] = page_token
-
-        url = f"{DRIVE_API_BASE}/files?{urllib.parse.urlencode(params)}"
-        with urllib.request.urlopen(url, timeout=30) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-
-        files.extend(data.get("files", []))
+        data = _list_page(query, api_key, page_token)
+        page = data.get("files", [])
+        files.extend(page)
+        if on_page is not None:
+            on_page(page)
         page_token = data.get("nextPageToken")
         if not page_token:
             break
@@ -47,38 +86,321 @@ def list_folder_images(folder_id: str, api_key: str) -> list[dict[str, Any]]:
     return files
 
 
-def download_drive_file(
-    file_id: str, api_key: str, timeout: int = 120, attempts: int = 5
-) -> bytes:
-    """Download a single Drive file's bytes, auto-retrying transient failures.
+def crawl_folder_images(
+    folder_id: str,
+    api_key: str,
+    on_page: Callable[[list[dict[str, Any]]], None] | None = None,
+    workers: int = 4,
+) -> list[dict[str, Any]]:
+    """Return all image files in a public Drive folder and its subfolders.
+
+    Folders are listed breadth-first by up to ``workers`` concurrent
+    requests; every listing page is its own request, so one huge folder
+    doesn't hold up its siblings. Entries carry the same fields as
+    list_folder_images plus ``folder``, the subfolder path relative to the
+    root ("" for the root itself, "ceremony/day1" for nested ones).
+
+    ``on_page`` gets each page's images on the calling thread as soon as the
+    page arrives, so callers can dispatch while the crawl continues. The
+    root folder failing to list raises; a subfolder failing is logged and
+    skipped.
+    """
+    files: list[dict[str, Any]] = []
+    seen = {folder_id}
+
+    def _query(fid: str) -> str:
+        return (
+            f"'{fid}' in parents and trashed = false and "
+            f"(mimeType contains 'image/' or mimeType = '{FOLDER_MIME_TYPE}')"
+        )
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-crawl") as pool:
+        in_flight: dict[Future, tuple[str, str, int]] = {}
+
+        def _submit(fid: str, path: str, depth: int, page_token: str | None = None) -> None:
+            fut = pool.submit(_list_page, _query(fid), api_key, page_token)
+            in_flight[fut] = (fid, path, depth)
+
+        _submit(folder_id, "", 0)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                fid, path, depth = in_flight.pop(fut)
+                try:
+                    data = fut.result()
+                except Exception:
+                    if fid == folder_id:
+                        raise
+                    logger.warning("Skipping Drive subfolder %s (%s)", path, fid, exc_info=True)
+                    continue
+
+                if data.get("nextPageToken"):
+                    _submit(fid, path, depth, data["nextPageToken"])
+
+                images = []
+                for f in data.get("files", []):
+                    if f.get("mimeType") == FOLDER_MIME_TYPE:
+                        if depth < _MAX_FOLDER_DEPTH and f["id"] not in seen:
+                            seen.add(f["id"])
+                            sub = f"{path}/{f.get('name', f['id'])}" if path else f.get("name", f["id"])
+                            _submit(f["id"], sub, depth + 1)
+                    else:
+                        f["folder"] = path
+                        images.append(f)
+
+                files.extend(images)
+                if images and on_page is not None:
+                    on_page(images)
+
+    return files
+
+
+class DriveThrottle:
+    """Drive download limiter shared by every worker through Redis.
+
+    Two controls, both held in Redis so all processes and hosts act as one
+    client towards Google:
+
+    * a token bucket (``rate`` downloads/s, bursts up to ``burst``), and
+    * an AIMD concurrency limit: each clean download nudges the limit up by
+      ``1/limit`` (about +1 per round of downloads); a 429/5xx/rate-limit 403
+      halves it and starts a shared cooldown (``Retry-After`` when Drive
+      sends one), so one throttling storm slows every worker down together
+      instead of each discovering it with its own backoff. Other failures
+      leave the limit alone.
 
-    Drive throttles bursts of parallel downloads (429/5xx) and connections
-    time out; retry with exponential backoff so images heal themselves instead
-    of failing the import.
+    In-flight slots carry a deadline so a killed worker can't leak one. If
+    Redis is unreachable downloads proceed unthrottled.
+    """
+
+    PREFIX = "gdrive:throttle:"
+
+    _ACQUIRE = """
+local p, now = ARGV[1], tonumber(ARGV[2])
+local cool = tonumber(redis.call('GET', p .. 'cooldown') or '0')
+if cool > now then return cool - now end
+redis.call('ZREMRANGEBYSCORE', p .. 'inflight', '-inf', now)
+local limit = tonumber(redis.call('GET', p .. 'limit') or ARGV[6])
+if redis.call('ZCARD', p .. 'inflight') >= math.floor(limit) then return 100 end
+local rate, burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+local b = redis.call('HMGET', p .. 'bucket', 'tokens', 'ts')
+local tokens = tonumber(b[1] or burst)
+local ts = tonumber(b[2] or now)
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+if tokens < 1 then
+  redis.call('HSET', p .. 'bucket', 'tokens', tokens, 'ts', now)
+  return math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', p .. 'bucket', 'tokens', tokens - 1, 'ts', now)
+redis.call('PEXPIRE', p .. 'bucket', 60000)
+redis.call('ZADD', p .. 'inflight', now + tonumber(ARGV[7]), ARGV[3])
+redis.call('PEXPIRE', p .. 'inflight', ARGV[7])
+return 0
+"""
+
+    _RELEASE = """
+local p, token, outcome = ARGV[1], ARGV[2], ARGV[3]
+local init, lo, hi = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local now, cool_ms = tonumber(ARGV[7]), tonumber(ARGV[8])
+redis.call('ZREM', p .. 'inflight', token)
+local limit = tonumber(redis.call('GET', p .. 'limit') or init)
+if outcome ~= '0' and outcome ~= '1' then return tostring(limit) end
+if outcome == '1' then
+  limit = math.max(lo, limit / 2)
+  local until_ms = now + cool_ms
+  local cool = tonumber(redis.call('GET', p .. 'cooldown') or '0')
+  if until_ms > cool then redis.call('SET', p .. 'cooldown', until_ms, 'PX', cool_ms) end
+else
+  limit = math.min(hi, limit + 1 / limit)
+end
+redis.call('SET', p .. 'limit', limit, 'EX', 3600)
+return tostring(limit)
+"""
+
+    def __init__(self, conn, rate: float, burst: int, init_limit: int,
+                 min_limit: int, max_limit: int, cooldown: float, slot_ttl: float = 300.0):
+        self.conn = conn
+        self.rate = rate
+        self.burst = burst
+        self.init_limit = init_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.cooldown = cooldown
+        self.slot_ttl = slot_ttl
+
+    def acquire(self) -> str | None:
+        """Block until a download may start. Returns a slot token for release()."""
+        token = uuid.uuid4().hex
+        while True:
+            try:
+                wait_ms = self.conn.eval(
+                    self._ACQUIRE, 0, self.PREFIX, int(time.time() * 1000), token,
+                    self.rate, self.burst, self.init_limit, int(self.slot_ttl * 1000),
+                )
+            except Exception:
+                logger.warning("Drive throttle unavailable; downloading unthrottled", exc_info=True)
+                return None
+            if not wait_ms:
+                return token
+            # Jitter so waiting workers don't stampede the moment a slot opens.
+            time.sleep(min(int(wait_ms), 5000) / 1000 * random.uniform(1.0, 1.25))
+
+    def release(self, token: str | None, throttled: bool | None, retry_after: float | None = None) -> None:
+        """Report the outcome: additive increase on success, halve + cooldown on
+        throttling. ``None`` just frees the slot, for failures that say nothing
+        about Drive's capacity (missing file, private folder, sink errors)."""
+        if token is None:
+            return
+        cooldown = max(self.cooldown, retry_after or 0.0)
+        outcome = "-" if throttled is None else "1" if throttled else "0"
+        try:
+            self.conn.eval(
+                self._RELEASE, 0, self.PREFIX, token, outcome,
+                self.init_limit, self.min_limit, self.max_limit,
+                int(time.time() * 1000), int(cooldown * 1000),
+            )
+        except Exception:
+            logger.warning("Drive throttle release failed", exc_info=True)
+
+
+_throttle: DriveThrottle | None = None
+
+
+def _get_throttle() -> DriveThrottle:
+    global _throttle
+    if _throttle is None:
+        from services import redis_client
+        _throttle = DriveThrottle(
+            redis_client,
+            rate=settings.GDRIVE_RATE_PER_SEC,
+            burst=settings.GDRIVE_BURST,
+            init_limit=settings.GDRIVE_CONCURRENCY_INIT,
+            min_limit=settings.GDRIVE_CONCURRENCY_MIN,
+            max_limit=settings.GDRIVE_CONCURRENCY_MAX,
+            cooldown=settings.GDRIVE_THROTTLE_COOLDOWN,
+        )
+    return _throttle
+
+
+def _is_throttled(status: int, body: bytes) -> bool:
+    """429, any 5xx, or Drive's 403 flavour of rate limiting."""
+    if status == 429 or status >= 500:
+        return True
+    return status == 403 and b"ateLimitExceeded" in body  # rateLimitExceeded / userRateLimitExceeded
+
+
+def _retry_after(resp) -> float | None:
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _BytesSink:
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def write(self, data: bytes) -> None:
+        self.buf.write(data)
+
+    def abort(self) -> None:
+        pass
+
+
+def stream_drive_file(
+    file_id: str,
+    api_key: str,
+    open_sink: Callable[[], Any],
+    timeout: int = 120,
+    attempts: int = 5,
+    chunk_size: int = 1024 * 1024,
+) -> Any:
+    """Stream a Drive file into a sink through the shared throttle.
+
+    Each attempt calls ``open_sink()`` for a fresh sink (anything with
+    ``write(bytes)`` and ``abort()``) and feeds it the body ``chunk_size``
+    bytes at a time, so the file is never held whole in memory. A failed
+    attempt aborts its sink. Returns the sink that received the complete file.
+
+    Throttling responses (429/5xx, rate-limit 403) and connection errors are
+    retried; the wait between attempts comes from the shared cooldown in
+    DriveThrottle rather than a fixed per-worker sleep. Other 4xx responses
+    (missing file, private folder) and sink errors fail immediately.
     """
     params = urllib.parse.urlencode({"alt": "media", "key": api_key})
     url = f"{DRIVE_API_BASE}/files/{file_id}?{params}"
+    throttle = _get_throttle()
     last_err: Exception | None = None
     for attempt in range(attempts):
+        token = throttle.acquire()
+        throttled = False
+        retry_after = None
+        sink = None
         try:
-            with urllib.request.urlopen(url, timeout=timeout) as resp:
-                data = resp.read()
-            if data:
-                return data
-        except Exception as e:  # noqa: BLE001 — retry any transient error
+            resp = _http.request(
+                "GET", url, timeout=urllib3.Timeout(connect=10, read=timeout),
+                preload_content=False,
+            )
+            try:
+                if resp.status >= 400:
+                    body = resp.read()
+                    if not _is_throttled(resp.status, body):
+                        raise RuntimeError(f"Drive download failed (HTTP {resp.status})")
+                    throttled = True
+                    retry_after = _retry_after(resp)
+                    last_err = RuntimeError(f"Drive throttled download (HTTP {resp.status})")
+                else:
+                    sink = open_sink()
+                    received = 0
+                    for chunk in resp.stream(chunk_size):
+                        sink.write(chunk)
+                        received += len(chunk)
+                    if received:
+                        return sink
+                    last_err = RuntimeError("empty download from Drive")
+            finally:
+                resp.release_conn()
+        except urllib3.exceptions.HTTPError as e:
+            # Timeouts and resets mostly mean Drive (or the link) is saturated.
+            throttled = True
             last_err = e
-            logger.warning("Drive download attempt %d failed: %s", attempt + 1, e)
-        if attempt < attempts - 1:
-            time.sleep(min(2 ** (attempt + 1), 20))  # 2,4,8,16s
+        except Exception:
+            # Non-throttle 4xx or a sink error: neither a success nor a signal
+            # to back off, so the AIMD limit is left as it is.
+            throttled = None
+            if sink is not None:
+                sink.abort()
+            raise
+        finally:
+            throttle.release(token, throttled, retry_after)
+        if sink is not None:
+            sink.abort()
+        logger.warning("Drive download attempt %d failed: %s", attempt + 1, last_err)
     if last_err:
         raise last_err
     raise RuntimeError("empty download from Drive")
 
 
-def compress_image(raw: bytes, max_edge: int = 2048, quality: int = 72) -> bytes:
+def download_drive_file(
+    file_id: str, api_key: str, timeout: int = 120, attempts: int = 5
+) -> bytes:
+    """Download a single Drive file's bytes (see stream_drive_file)."""
+    sink = stream_drive_file(file_id, api_key, _BytesSink, timeout=timeout, attempts=attempts)
+    return sink.buf.getvalue()
+
+
+def compress_image(raw: bytes | BinaryIO, max_edge: int = 2048, quality: int = 72) -> bytes:
     """Downscale to `max_edge` (long side) and re-encode as JPEG. EXIF rotation
-    is baked in so the stored bytes need no further orientation handling."""
-    img = Image.open(io.BytesIO(raw))
+    is baked in so the stored bytes need no further orientation handling.
+
+    Accepts bytes or a seekable file. JPEGs are decoded directly at a reduced
+    DCT scale (1/2, 1/4 or 1/8, never below `max_edge`), so a 24MP original
+    never materialises at full resolution."""
+    img = Image.open(io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else raw)
+    w, h = img.size
+    scale = max_edge / max(w, h)
+    if scale < 1:
+        img.draft("RGB", (int(w * scale) + 1, int(h * scale) + 1))
     img = ImageOps.exif_transpose(img)
     if img.mode != "RGB":
         img = img.convert("RGB")
@@ -0,0 +1,173 @@
+"""
+Near-duplicate and burst detection by perceptual hash.
+
+``file_hash`` (SHA-256) only catches byte-identical uploads; the 5–10
+frames of a burst all hash differently and each goes through face detection
+and quality analysis. Ingest now also computes a 64-bit dHash of every
+image and stores it in image_hashes with a Hamming-searchable index.
+
+The index is multi-index hashing in Postgres rather than an in-process
+BK-tree, since ingest runs across RQ workers and Modal containers that
+share nothing but the database. The hash is split into eight 8-bit bands;
+two hashes at most 7 bits apart must agree exactly on at least one band, so
+a GIN overlap query on the tagged bands returns every candidate and the
+exact distance is checked on those few rows.
+
+Each image joins the burst (``burst_id``) of its nearest sibling within
+NEAR_DUPLICATE_DISTANCE bits. With REUSE_NEAR_DUPLICATE_FACES, an image
+within NEAR_DUPLICATE_REUSE_DISTANCE bits of an already processed sibling
+of the same size copies that sibling's faces instead of running inference.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+
+import cv2
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import settings
+from db import SessionLocal
+from models import FaceVector, ImageHash, WeddingImage
+
+logger = logging.getLogger(__name__)
+
+_HASH_BITS = 64
+_BAND_BITS = 8
+_BANDS = _HASH_BITS // _BAND_BITS
+# Pigeonhole: with 8 bands, only distances up to 7 are guaranteed to share one.
+MAX_SEARCH_DISTANCE = _BANDS - 1
+
+
+def dhash(image: np.ndarray) -> int:
+    """64-bit difference hash: sign of each horizontal gradient of a 9x8
+    grayscale thumbnail. Robust to re-encoding, resizing and small exposure
+    shifts; flips bits as the framing or subject moves."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _signed(h: int) -> int:
+    # BIGINT is signed; store the same 64 bits.
+    return h - (1 << _HASH_BITS) if h >= 1 << (_HASH_BITS - 1) else h
+
+
+def _bands(h: int) -> list[int]:
+    """Each byte of the hash tagged with its position, as GIN keys."""
+    mask = (1 << _BAND_BITS) - 1
+    return [(i << _BAND_BITS) | ((h >> (i * _BAND_BITS)) & mask) for i in range(_BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << _HASH_BITS) - 1)).bit_count()
+
+
+def hash_image(image: np.ndarray) -> dict:
+    """What ingest keeps for an image: its dHash and size."""
+    h, w = image.shape[:2]
+    return {"dhash": dhash(image), "width": w, "height": h}
+
+
+def find_near_duplicate(
+    db: Session,
+    celebration_id: uuid.UUID,
+    h: int,
+    max_distance: int,
+) -> tuple[ImageHash, int] | None:
+    """The celebration's nearest hashed image within ``max_distance`` bits."""
+    max_distance = min(max_distance, MAX_SEARCH_DISTANCE)
+    if max_distance < 0:
+        return None
+    best = None
+    for row in db.query(ImageHash).filter(
+        ImageHash.celebration_id == celebration_id,
+        ImageHash.bands.overlap(_bands(h)),
+    ):
+        distance = hamming(h, row.dhash)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (row, distance)
+    return best
+
+
+def reusable_faces(db: Session, celebration_id: uuid.UUID, hashed: dict) -> list[dict] | None:
+    """Faces of a processed near-identical sibling, in detect_and_encode_faces'
+    shape, or None to run detection.
+
+    Only siblings of the same pixel size qualify, so their bboxes and
+    landmarks land on the same coordinates.
+    """
+    if not settings.REUSE_NEAR_DUPLICATE_FACES:
+        return None
+    match = find_near_duplicate(db, celebration_id, hashed["dhash"], settings.NEAR_DUPLICATE_REUSE_DISTANCE)
+    if match is None:
+        return None
+    sibling, distance = match
+    if (sibling.width, sibling.height) != (hashed["width"], hashed["height"]):
+        return None
+    processed = db.query(WeddingImage.processed).filter(WeddingImage.id == sibling.image_id).scalar()
+    if processed != "completed":
+        return None
+
+    rows = db.query(FaceVector).filter(
+        FaceVector.image_id == sibling.image_id
+    ).order_by(FaceVector.face_index).all()
+    if any(r.embedding_model != settings.EMBEDDING_MODEL_VERSION for r in rows):
+        return None
+    logger.info(f"♻️ Reusing {len(rows)} faces from near-identical {sibling.image_id} ({distance} bits apart)")
+    return [
+        {
+            "face_index": r.face_index,
+            "vector": list(r.vector),
+            "bbox": list(r.bbox) if r.bbox is not None else None,
+            "landmarks": list(r.landmarks) if r.landmarks is not None else None,
+            "confidence": r.confidence,
+            "quality_score": r.quality_score,
+        }
+        for r in rows
+    ]
+
+
+def hash_for_ingest(image: np.ndarray, celebration_id) -> tuple[dict | None, list[dict] | None]:
+    """Detect stage of ingest: the image's hash, plus a sibling's faces to
+    reuse (None means run detection). Never raises."""
+    try:
+        hashed = hash_image(image)
+    except Exception:
+        logger.warning("⚠️ Perceptual hash failed", exc_info=True)
+        return None, None
+    if celebration_id is None or not settings.REUSE_NEAR_DUPLICATE_FACES:
+        return hashed, None
+    db = SessionLocal()
+    try:
+        return hashed, reusable_faces(db, uuid.UUID(str(celebration_id)), hashed)
+    except Exception:
+        logger.warning("⚠️ Near-duplicate face lookup failed", exc_info=True)
+        return hashed, None
+    finally:
+        db.close()
+
+
+def record_image_hash(db: Session, image: WeddingImage, hashed: dict) -> None:
+    """Store the image's hash, joining the burst of its nearest sibling.
+
+    Runs in a savepoint inside the caller's transaction, so a failure here
+    never costs the image its faces. The caller commits.
+    """
+    try:
+        with db.begin_nested():
+            h = hashed["dhash"]
+            match = find_near_duplicate(db, image.celebration_id, h, settings.NEAR_DUPLICATE_DISTANCE)
+            db.merge(ImageHash(
+                image_id=image.id,
+                celebration_id=image.celebration_id,
+                dhash=_signed(h),
+                bands=_bands(h),
+                width=hashed["width"],
+                height=hashed["height"],
+                burst_id=match[0].burst_id if match else image.id,
+            ))
+    except Exception:
+        logger.warning(f"Could not record perceptual hash for {image.id}", exc_info=True)
@@ -0,0 +1,141 @@
+"""
+Quality summary counters for the dashboard.
+
+GET /quality/.../summary used to run six separate queries (two image
+counts, a distinct-flag count, two bool_and subqueries and a group-by) on
+every page load. ``compute_summary`` gets every counter from one aggregated
+query, and the router caches the finished summary in Redis per celebration,
+along with the flagged-image totals the flags listing reports per filter.
+
+Writers drop the cached copy instead of adjusting counters in place: flags
+are rewritten by RQ workers, Modal containers and ingest, and removed by
+cascades, so deltas kept by hand would drift. Quality job progress events
+and the review PATCH endpoints invalidate; the TTL covers writes that don't
+(new uploads, deleted images).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TTL = 60
+
+_SUMMARY_SQL = text("""
+WITH images AS (
+    SELECT count(*) AS total,
+           count(*) FILTER (WHERE quality_analyzed) AS analyzed
+    FROM wedding_images
+    WHERE celebration_id = :cid
+),
+flags AS (
+    SELECT f.image_id, f.issue_type, f.reviewed, f.dismissed
+    FROM image_quality_flags f
+    JOIN wedding_images w ON w.id = f.image_id
+    WHERE w.celebration_id = :cid
+),
+per_image AS (
+    SELECT bool_and(reviewed) AS reviewed, bool_and(dismissed) AS dismissed
+    FROM flags
+    GROUP BY image_id
+),
+by_type AS (
+    SELECT issue_type, count(*) AS n
+    FROM flags
+    GROUP BY issue_type
+)
+SELECT
+    images.total,
+    images.analyzed,
+    (SELECT count(*) FROM per_image) AS flagged,
+    (SELECT count(*) FILTER (WHERE reviewed) FROM per_image) AS reviewed,
+    (SELECT count(*) FILTER (WHERE dismissed) FROM per_image) AS dismissed,
+    (SELECT coalesce(json_object_agg(issue_type, n), '{}'::json) FROM by_type) AS issues_by_type
+FROM images
+""")
+
+
+def summary_key(celebration_id: uuid.UUID | str) -> str:
+    return f"quality_summary:{celebration_id}"
+
+
+def compute_summary(db: Session, celebration_id: uuid.UUID) -> dict:
+    """Every summary counter for a celebration, in one query."""
+    row = db.execute(_SUMMARY_SQL, {"cid": celebration_id}).one()
+    return {
+        "total_images": row.total,
+        "analyzed_images": row.analyzed,
+        "flagged_images": row.flagged,
+        "reviewed_images": row.reviewed,
+        "dismissed_images": row.dismissed,
+        "issues_by_type": row.issues_by_type or {},
+    }
+
+
+def get_cached_summary(celebration_id: uuid.UUID) -> dict | None:
+    from services import redis_client
+
+    try:
+        raw = redis_client.get(summary_key(celebration_id))
+    except Exception:
+        logger.debug("Could not read cached quality summary", exc_info=True)
+        return None
+    return json.loads(raw) if raw else None
+
+
+def cache_summary(celebration_id: uuid.UUID, summary: dict) -> None:
+    from services import redis_client
+
+    try:
+        redis_client.setex(summary_key(celebration_id), SUMMARY_TTL, json.dumps(summary, default=str))
+    except Exception:
+        logger.debug("Could not cache quality summary", exc_info=True)
+
+
+def flag_totals_key(celebration_id: uuid.UUID | str) -> str:
+    return f"quality_flag_totals:{celebration_id}"
+
+
+def _flag_total_field(issue_type: str | None, reviewed: bool | None) -> str:
+    return f"{issue_type or '*'}:{'*' if reviewed is None else int(reviewed)}"
+
+
+def get_cached_flag_total(celebration_id: uuid.UUID, issue_type: str | None, reviewed: bool | None) -> int | None:
+    """Cached count of flagged images for one filter combination, if any."""
+    from services import redis_client
+
+    try:
+        raw = redis_client.hget(flag_totals_key(celebration_id), _flag_total_field(issue_type, reviewed))
+    except Exception:
+        logger.debug("Could not read cached flag total", exc_info=True)
+        return None
+    return int(raw) if raw is not None else None
+
+
+def cache_flag_total(celebration_id: uuid.UUID, issue_type: str | None, reviewed: bool | None, total: int) -> None:
+    from services import redis_client
+
+    key = flag_totals_key(celebration_id)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, _flag_total_field(issue_type, reviewed), total)
+        pipe.expire(key, SUMMARY_TTL)
+        pipe.execute()
+    except Exception:
+        logger.debug("Could not cache flag total", exc_info=True)
+
+
+def invalidate_summary(celebration_id: uuid.UUID | str, conn=None) -> None:
+    """Drop the cached summary and flag totals after flags or review state
+    change; never raises."""
+    try:
+        if conn is None:
+            from services import redis_client as conn
+        conn.delete(summary_key(celebration_id), flag_totals_key(celebration_id))
+    except Exception:
+        logger.debug("Could not invalidate quality summary", exc_info=True)
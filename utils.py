@@ -22,6 +22,16 @@ def load_image_from_bytes(image_bytes: bytes) -> np.ndarray:
     arr = np.array(img)
     return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
 
+def load_gray_from_bytes(image_bytes: bytes) -> np.ndarray:
+    """Grayscale decode for analysis. JPEGs decode only their luma plane, so
+    the chroma is never upsampled or converted."""
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("L", img.size)
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "L":
+        img = img.convert("L")
+    return np.asarray(img)
+
 def compress_image_bytes(image_bytes: bytes, quality: int = 75, max_size: Tuple[int,int] = (1024,1024)) -> bytes:
     img = Image.open(io.BytesIO(image_bytes))
     img = ImageOps.exif_transpose(img)
@@ -1,14 +1,38 @@
 import os
 import redis
-from rq import Worker, Queue, Connection
+from rq import SimpleWorker, Queue, Connection
+
+from jobs.queues import worker_lanes, weighted_order
 
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
 conn = redis.from_url(redis_url)
 
-listen = ["default"]
+listen = worker_lanes()
+
+
+class WeightedWorker(SimpleWorker):
+    """Re-draws the lane order after every job (see jobs.queues.LANE_WEIGHTS).
+
+    Plain RQ checks queues in strict listed order, which would leave the
+    reprocess lane untouched for as long as uploads keep trickling in.
+
+    Jobs run in this process rather than a forked work horse, so the model
+    warmed at startup is reused by every job instead of reloaded per job
+    (and onnxruntime sessions never cross a fork).
+    """
+
+    def reorder_queues(self, reference_queue):
+        by_name = {q.name: q for q in self._ordered_queues}
+        self._ordered_queues = [by_name[n] for n in weighted_order(list(by_name))]
+
 
 if __name__ == "__main__":
+    # Warm the face model before taking jobs so the first upload doesn't pay
+    # for the load, and the autoscaler's new workers arrive ready.
+    from services import face_service
+    face_service.preload()
+
     with Connection(conn):
-        worker = Worker(map(Queue, listen))
-        print("👷 Worker started. Waiting for jobs...")
+        worker = WeightedWorker(map(Queue, listen))
+        print(f"👷 Worker started on {', '.join(listen)}. Waiting for jobs...")
         worker.work()